@@ -1,14 +1,27 @@
-from flask import Flask, render_template, request, jsonify, flash, send_file
+from flask import Flask, render_template, request, jsonify, flash, make_response, session, g, url_for
+from werkzeug.http import quote_etag
 import os
 import logging
 from datetime import datetime
 from config import Config
-from services.competitor_analysis import CompetitorAnalyzer
-from services.data_fetcher import DataFetcher
-from services.openai_service import OpenAIService
-from services.smithery_agent import SmitheryAgent
-from utils.helpers import validate_url, format_analysis_data, generate_pdf_report
+from services.registry import ServiceRegistry
+from services.scheduler import RefreshScheduler
+from utils.helpers import (validate_url, format_analysis_data, generate_pdf_report,
+                           generate_csv_report, content_hash, chart_payload)
+from utils.cache import BoundedCache
+from utils.compact import AnalysisCache
+from utils.prerender import ExportPrerenderer
+from utils.admission import AdmissionController, Overloaded
+from utils.assets import AssetManifest
+from utils.report import start_pool, stream_report
+from utils.serialization import dumps, encode_payload, payload_response
+from utils.storage import private_dir
+from utils import metrics
+from utils.tracing import tracer, span, MemoryExporter, JsonLinesExporter
+from utils.profiling import RequestProfiler
 import json
+import time
+from contextlib import ExitStack
 
 # Configure logging
 logging.basicConfig(
@@ -22,14 +35,323 @@ logging.basicConfig(
 app = Flask(__name__)
 app.config.from_object(Config)
 
-# Initialize services
-analyzer = CompetitorAnalyzer()
-data_fetcher = DataFetcher()
-openai_service = OpenAIService()
-agent = SmitheryAgent()
+# Tracing: recent traces stay in memory for /debug/traces
+trace_buffer = MemoryExporter(max_traces=app.config['TRACE_BUFFER_SIZE'])
+tracer.configure(
+    enabled=app.config['TRACING_ENABLED'],
+    exporters=[trace_buffer] + ([JsonLinesExporter(app.config['TRACE_FILE'])] if app.config['TRACE_FILE'] else [])
+)
+
+# Sampled or header-triggered profiling of individual requests
+profiler = RequestProfiler(
+    app.config['PROFILE_DIR'],
+    sample_rate=app.config['PROFILE_SAMPLE_RATE'],
+    default_mode=app.config['PROFILE_MODE'],
+    token=app.config['PROFILE_TOKEN'],
+    interval=app.config['PROFILE_INTERVAL_MS'] / 1000
+)
+
+# Static files are served under content-hashed names with immutable caching
+assets = AssetManifest(app.static_folder, auto_reload=app.config['DEBUG'])
+app.jinja_env.globals.update(asset_url=assets.url, chart_payload=chart_payload)
+
+# Services are built lazily on first use (keeps serverless cold starts cheap)
+registry = ServiceRegistry()
+
+# Content hash of each cached analysis, computed once when it is stored
+analysis_fingerprints = {}
+
+# Cache for storing analysis results, kept as compact (and, when cold, compressed) records
+analysis_cache = AnalysisCache(
+    hot_entries=app.config['ANALYSIS_CACHE_HOT_ENTRIES'],
+    compress=app.config['ANALYSIS_CACHE_COMPRESS'],
+    max_entries=app.config['ANALYSIS_CACHE_MAX_ENTRIES'],
+    max_bytes=app.config['ANALYSIS_CACHE_MAX_BYTES'],
+    on_evict=lambda key: analysis_fingerprints.pop(key, None)
+)
 
-# Cache for storing analysis results
-analysis_cache = {}
+# Rendered export artifacts, addressed by analysis content hash
+export_cache = BoundedCache(max_bytes=app.config['EXPORT_CACHE_MAX_BYTES'], name='export')
+
+EXPORT_RENDERERS = {
+    'pdf': generate_pdf_report,
+    'csv': generate_csv_report,
+    # JSON bodies are encoded once and stored with precompressed variants
+    'json': encode_payload,
+    'insights': lambda analysis: encode_payload(analysis.get('ai_insights', {})),
+    'market_data': lambda analysis: encode_payload(analysis.get('market_data', {})),
+    'charts': lambda analysis: encode_payload(chart_payload(analysis)),
+}
+
+# Rendered analysis pages, keyed by analysis hash and template version
+page_cache = BoundedCache(max_bytes=app.config['PAGE_CACHE_MAX_BYTES'], name='page')
+_template_versions = {}
+
+# Background work backs off while too many requests are in flight
+prerenderer = ExportPrerenderer(
+    export_cache,
+    EXPORT_RENDERERS,
+    max_pending=app.config['PRERENDER_QUEUE_SIZE'],
+    load_fn=lambda: metrics.IN_FLIGHT.value(kind='requests'),
+    max_load=app.config['PRERENDER_MAX_INFLIGHT']
+)
+
+
+# Background refresh of watched analyses keeps the analysis cache of every worker warm
+scheduler = RefreshScheduler(
+    lambda *triple: refresh_watched_analysis(*triple),
+    reload_fn=lambda *triple: load_refreshed_analysis(*triple),
+    state_file=app.config['WATCHLIST_FILE'],
+    default_interval=app.config['SCHEDULER_INTERVAL'],
+    min_interval=app.config['SCHEDULER_MIN_INTERVAL'],
+    max_concurrent=app.config['SCHEDULER_MAX_CONCURRENT'],
+    requests_per_minute=app.config['SCHEDULER_REQUESTS_PER_MINUTE'],
+    tokens_per_day=app.config['SCHEDULER_TOKENS_PER_DAY'],
+    load_fn=lambda: metrics.IN_FLIGHT.value(kind='requests'),
+    max_load=app.config['PRERENDER_MAX_INFLIGHT']
+)
+if app.config['SCHEDULER_ENABLED']:
+    scheduler.start()
+
+# Shared across reports; None (render inline) unless REPORT_WORKERS is above 1
+report_pool = start_pool(app.config['REPORT_WORKERS'])
+
+# Expensive endpoints get bounded concurrency and a short wait queue; cheap ones are never gated
+admission = AdmissionController(enabled=app.config['ADMISSION_ENABLED'])
+for _endpoint, _limit in (('analyze', app.config['ADMISSION_ANALYZE_LIMIT']),
+                          ('api_analyze', app.config['ADMISSION_ANALYZE_LIMIT']),
+                          ('run_demo', app.config['ADMISSION_AGENT_LIMIT']),
+                          ('report', app.config['ADMISSION_REPORT_LIMIT'])):
+    admission.add(_endpoint, _limit, queue_size=app.config['ADMISSION_QUEUE_SIZE'],
+                  timeout=app.config['ADMISSION_TIMEOUT'])
+
+
+@app.before_request
+def _track_request_start():
+    g.request_started = time.perf_counter()
+    g.trace_span = tracer.start_span(f"{request.method} {request.path}", endpoint=request.endpoint)
+    metrics.IN_FLIGHT.inc(kind='requests')
+    mode = profiler.select_mode(request.headers)
+    if mode:
+        g.profile = profiler.start(mode, request.path)
+
+
+@app.after_request
+def _record_request_latency(response):
+    metrics.REQUEST_LATENCY.observe(
+        time.perf_counter() - g.request_started,
+        endpoint=request.endpoint or 'unknown',
+        status=response.status_code
+    )
+    if g.get('trace_span') is not None:
+        g.trace_span.set_attribute('status', response.status_code)
+    return response
+
+
+@app.teardown_request
+def _track_request_end(exc):
+    metrics.IN_FLIGHT.dec(kind='requests')
+    profiler.finish(g.pop('profile', None))
+    tracer.end_span(g.pop('trace_span', None), error=exc)
+
+
+def analysis_cache_key(competitor_company, your_company, product_domain):
+    return f"{competitor_company}_{your_company}_{product_domain}"
+
+
+def run_analysis(competitor_company, your_company, product_domain, keep_cached=False):
+    """Run a full analysis, store it in the cache and return it.
+
+    With ``keep_cached`` a fallback result does not replace a cached AI analysis.
+    """
+    # Get market data
+    market_data = registry.data_fetcher.fetch_market_data(competitor_company, your_company, product_domain)
+
+    # Perform analysis
+    analysis_result = registry.analyzer.analyze_competitor(
+        competitor_company,
+        your_company,
+        product_domain,
+        market_data=market_data
+    )
+
+    if not analysis_result:
+        raise ValueError("Analysis returned no results")
+
+    # Use analysis_result as the main analysis object (templates expect top-level keys)
+    complete_analysis = analysis_result if isinstance(analysis_result, dict) else {}
+
+    # Ensure expected top-level keys exist and merge market data / metadata
+    complete_analysis.setdefault('market_analysis', {})
+    complete_analysis.setdefault('visualization_data', {})
+    complete_analysis.setdefault('swot_analysis', {})
+    complete_analysis['market_data'] = market_data or {}
+    # Provide sentiment defaults so templates don't fail
+    complete_analysis.setdefault('sentiment', complete_analysis['market_data'].get('sentiment_analysis', {}))
+    complete_analysis['timestamp'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    complete_analysis['is_fallback'] = analysis_result.get('is_fallback', False) if isinstance(analysis_result, dict) else True
+
+    # Cache the result
+    cache_key = analysis_cache_key(competitor_company, your_company, product_domain)
+    if keep_cached and complete_analysis['is_fallback'] and cache_key in analysis_cache \
+            and not analysis_cache[cache_key].get('is_fallback'):
+        raise RuntimeError("AI analysis unavailable; keeping the cached analysis")
+    cache_analysis(cache_key, complete_analysis)
+    record_history(complete_analysis, product_domain)
+    return complete_analysis
+
+
+def basic_analysis(competitor_company, your_company, product_domain):
+    """Deterministic analysis (no scraping or AI) used when the full analysis fails or is shed"""
+    analysis = registry.analyzer._get_basic_analysis(competitor_company, your_company, product_domain)
+    analysis['market_data'] = registry.data_fetcher.fetch_market_data(competitor_company, your_company, product_domain)
+    analysis.setdefault('sentiment', analysis['market_data'].get('sentiment_analysis', {}))
+    analysis['timestamp'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    analysis['is_fallback'] = True
+    return analysis
+
+
+def overloaded_response(error, **payload):
+    """503 with Retry-After for a request turned away by admission control"""
+    response = jsonify({
+        'success': False,
+        'error': 'The server is busy. Please retry shortly.',
+        'retry_after': error.retry_after,
+        **payload
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+
+def refreshed_analysis_path(cache_key):
+    return os.path.join(app.config['SCHEDULER_RESULTS_DIR'], content_hash(cache_key) + '.json')
+
+
+def refresh_watched_analysis(competitor_company, your_company, product_domain):
+    """Scheduler callback: re-run a watched analysis, publish it for the other workers
+    and return its fingerprint"""
+    analysis = run_analysis(competitor_company, your_company, product_domain, keep_cached=True)
+    path = refreshed_analysis_path(analysis_cache_key(competitor_company, your_company, product_domain))
+    try:
+        private_dir(app.config['SCHEDULER_RESULTS_DIR'])
+        with open(f'{path}.{os.getpid()}.tmp', 'wb') as fh:
+            fh.write(dumps(analysis))
+        os.replace(f'{path}.{os.getpid()}.tmp', path)
+    except OSError as e:
+        app.logger.warning(f"Could not publish the refreshed analysis: {str(e)}")
+    # Ignore per-run metadata so the change rate reflects actual content changes
+    return content_hash({k: v for k, v in analysis.items() if k not in ('timestamp', 'sections', 'snapshot')})
+
+
+def load_refreshed_analysis(competitor_company, your_company, product_domain):
+    """Scheduler callback: cache an analysis that another worker refreshed"""
+    cache_key = analysis_cache_key(competitor_company, your_company, product_domain)
+    try:
+        with open(refreshed_analysis_path(cache_key), 'rb') as fh:
+            analysis = json.loads(fh.read())
+    except FileNotFoundError:
+        return
+    if content_hash(analysis) != analysis_fingerprints.get(cache_key):
+        cache_analysis(cache_key, analysis)
+
+
+def cache_analysis(cache_key, analysis):
+    """Store an analysis result and queue its export artifacts"""
+    fingerprint = content_hash(analysis)
+    previous = analysis_fingerprints.get(cache_key)
+    if previous is not None and previous != fingerprint:
+        # The analysis was upgraded; drop artifacts rendered from the old one
+        prerenderer.cancel(previous)
+        export_cache.discard_matching(lambda key: key[0] == previous)
+        page_cache.discard_matching(lambda key: key[0] == previous)
+    analysis_cache[cache_key] = analysis
+    analysis_fingerprints[cache_key] = fingerprint
+    if app.config['PRERENDER_EXPORTS']:
+        prerenderer.submit(fingerprint, analysis)
+
+
+def get_export_artifact(cache_key, fmt):
+    """Return (etag, artifact) for a cached analysis, rendering on a cache miss"""
+    # The analysis is only decoded when the artifact has to be rendered
+    etag = analysis_fingerprints.get(cache_key)
+    artifact = export_cache.get((etag, fmt)) if etag is not None else None
+    if artifact is not None:
+        app.logger.info(f"Serving cached {fmt} export")
+        return etag, artifact
+
+    analysis_data = analysis_cache[cache_key]
+    if etag is None:
+        etag = analysis_fingerprints[cache_key] = content_hash(analysis_data)
+    with span('export.render', format=fmt), metrics.STAGE_LATENCY.time(stage=f'export_{fmt}'):
+        artifact = EXPORT_RENDERERS[fmt](analysis_data)
+    export_cache.set((etag, fmt), artifact)
+    return etag, artifact
+
+
+def record_history(analysis, product_domain):
+    """Append the numeric fields of a fresh analysis to the trend history"""
+    if not app.config['HISTORY_ENABLED'] or analysis.get('is_fallback'):
+        return
+    try:
+        with span('history.record'):
+            registry.history.record_analysis(analysis, product_domain)
+    except Exception as e:
+        app.logger.warning(f"Could not record analysis history: {str(e)}")
+
+
+def template_version(name):
+    """Hash of a template and the base layout, recomputed when templates auto-reload"""
+    version = _template_versions.get(name)
+    if version is None or app.jinja_env.auto_reload:
+        sources = [app.jinja_loader.get_source(app.jinja_env, template)[0]
+                   for template in (name, 'base.html')]
+        version = _template_versions[name] = content_hash(sources)[:16]
+    return version
+
+
+def render_analysis_page(cache_key, analysis, competitor_company, your_company, product_domain, is_fallback):
+    """Render analysis.html, reusing the cached page for an unchanged analysis"""
+    fingerprint = analysis_fingerprints.get(cache_key)
+    # Pages carrying flashed messages are one-off and never cached
+    cacheable = fingerprint is not None and not session.get('_flashes')
+    if cacheable:
+        page_key = (fingerprint, template_version('analysis.html'), cache_key)
+        html = page_cache.get(page_key)
+        if html is not None:
+            app.logger.info("Serving cached analysis page")
+            return html
+
+    with span('render.analysis_page'), metrics.STAGE_LATENCY.time(stage='render'):
+        html = render_template(
+            'analysis.html',
+            analysis=analysis,
+            competitor_company=competitor_company,
+            your_company=your_company,
+            product_domain=product_domain,
+            is_fallback=is_fallback,
+            # Chart datasets come from /api/charts, versioned by the analysis hash
+            charts_url=url_for('get_charts', key=cache_key, v=fingerprint) if fingerprint else None,
+            # Lets the browser keep the page and revalidate it against the JSON export's ETag
+            analysis_key=cache_key,
+            analysis_url=url_for('export_json', key=cache_key) if fingerprint else None,
+            analysis_etag=quote_etag(fingerprint) if fingerprint else None
+        ).encode('utf-8')
+    if cacheable:
+        page_cache.set(page_key, html)
+    return html
+
+
+def export_response(artifact, etag, mimetype, filename=None):
+    """Build a conditional response for a rendered export artifact"""
+    response = make_response(artifact)
+    response.mimetype = mimetype
+    if filename:
+        response.headers['Content-Disposition'] = f"attachment; filename={filename}"
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 
 @app.route('/')
@@ -77,70 +399,60 @@ def analyze_competitor():
             return render_template('error.html', error_message=error_msg)
 
         # Generate cache key and check cache
-        cache_key = f"{competitor_company}_{your_company}_{product_domain}"
+        cache_key = analysis_cache_key(competitor_company, your_company, product_domain)
+        scheduler.touch(competitor_company, your_company, product_domain)
         if cache_key in analysis_cache:
+            metrics.CACHE_EVENTS.inc(cache='analysis', event='hit')
             app.logger.info("Returning cached analysis")
             cached_analysis = analysis_cache[cache_key]
-            return render_template(
-                'analysis.html',
-                analysis=cached_analysis,
-                competitor_company=competitor_company,
-                your_company=your_company,
-                product_domain=product_domain,
+            return render_analysis_page(
+                cache_key,
+                cached_analysis,
+                competitor_company,
+                your_company,
+                product_domain,
                 is_fallback=cached_analysis.get('is_fallback', False)
             )
 
+        metrics.CACHE_EVENTS.inc(cache='analysis', event='miss')
         app.logger.info(f"Analyzing: Competitor={competitor_company}, Your Company={your_company}, Domain={product_domain}")
 
+        if app.config['SCHEDULER_AUTO_WATCH']:
+            scheduler.watch(competitor_company, your_company, product_domain)
+
         try:
-            # Get market data
-            market_data = data_fetcher.fetch_market_data(competitor_company, your_company, product_domain)
+            with admission.admit('analyze'):
+                complete_analysis = run_analysis(competitor_company, your_company, product_domain)
+            app.logger.info("Analysis completed successfully")
             
-            # Perform analysis
-            analysis_result = analyzer.analyze_competitor(
+            return render_analysis_page(
+                cache_key,
+                complete_analysis,
                 competitor_company,
                 your_company,
-                product_domain
+                product_domain,
+                is_fallback=complete_analysis.get('is_fallback', False)
             )
-            
-            if not analysis_result:
-                raise ValueError("Analysis returned no results")
-
-            # Use analysis_result as the main analysis object (templates expect top-level keys)
-            complete_analysis = analysis_result if isinstance(analysis_result, dict) else {}
-
-            # Ensure expected top-level keys exist and merge market data / metadata
-            complete_analysis.setdefault('market_analysis', {})
-            complete_analysis.setdefault('visualization_data', {})
-            complete_analysis.setdefault('swot_analysis', {})
-            complete_analysis['market_data'] = market_data or {}
-            # Provide sentiment defaults so templates don't fail
-            complete_analysis.setdefault('sentiment', complete_analysis['market_data'].get('sentiment_analysis', {}))
-            complete_analysis['timestamp'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            complete_analysis['is_fallback'] = analysis_result.get('is_fallback', False) if isinstance(analysis_result, dict) else True
-            
-            # Cache the result
-            analysis_cache[cache_key] = complete_analysis
-            app.logger.info("Analysis completed successfully")
-            
+                
+        except Overloaded as e:
+            app.logger.warning(f"Shedding analysis request: {str(e)}")
+            # Degrade to the basic analysis rather than queueing behind the LLM
+            complete_analysis = basic_analysis(competitor_company, your_company, product_domain)
+            if request.headers.get('Accept') == 'application/json':
+                return overloaded_response(e, data=complete_analysis)
             return render_template(
                 'analysis.html',
                 analysis=complete_analysis,
                 competitor_company=competitor_company,
                 your_company=your_company,
                 product_domain=product_domain,
-                is_fallback=analysis_result.get('is_fallback', False)
+                is_fallback=True
             )
-                
+
         except Exception as e:
             app.logger.error(f"Analysis error: {str(e)}")
             # Get fallback analysis and present it at top-level so templates work
-            fallback_analysis = analyzer._get_basic_analysis(competitor_company, your_company, product_domain)
-            complete_analysis = fallback_analysis
-            complete_analysis['market_data'] = market_data if 'market_data' in locals() else {}
-            complete_analysis.setdefault('sentiment', complete_analysis['market_data'].get('sentiment_analysis', {}))
-            complete_analysis['timestamp'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            complete_analysis['is_fallback'] = True
+            complete_analysis = basic_analysis(competitor_company, your_company, product_domain)
             
             if request.headers.get('Accept') == 'application/json':
                 return jsonify({
@@ -179,6 +491,8 @@ def api_analyze():
         competitor_url = data.get('competitor_url', '').strip()
         your_company = data.get('your_company', '').strip()
         product_domain = data.get('product_domain', '').strip()
+        # Optional; attributes the page's sentiment to the competitor's name
+        competitor_company = (data.get('competitor_company') or '').strip() or None
 
         if not competitor_url or not your_company:
             return jsonify({
@@ -193,24 +507,30 @@ def api_analyze():
             }), 400
 
         # Fetch and analyze
-        competitor_data = data_fetcher.fetch_website_data(competitor_url)
-        if not competitor_data:
-            return jsonify({
-                'success': False,
-                'error': 'Could not fetch data from the provided URL'
-            }), 400
+        with admission.admit('api_analyze'):
+            competitor_data = registry.data_fetcher.fetch_website_data(
+                competitor_url, domain=product_domain or None, company=competitor_company)
+            if not competitor_data:
+                return jsonify({
+                    'success': False,
+                    'error': 'Could not fetch data from the provided URL'
+                }), 400
 
-        analysis_result = analyzer.analyze_competitor(
-            competitor_company=competitor_url,
-            your_company=your_company,
-            product_domain=product_domain
-        )
+            analysis_result = registry.analyzer.analyze_competitor(
+                competitor_company=competitor_url,
+                your_company=your_company,
+                product_domain=product_domain,
+                website_data=competitor_data
+            )
 
-        return jsonify({
+        return payload_response(encode_payload({
             'success': True,
             'analysis': format_analysis_data(analysis_result)
-        })
+        }), request)
 
+    except Overloaded as e:
+        app.logger.warning(f"Shedding API analysis request: {str(e)}")
+        return overloaded_response(e)
     except Exception as e:
         app.logger.error(f"API Analysis error: {str(e)}")
         return jsonify({
@@ -228,13 +548,10 @@ def export_pdf():
             return render_template('error.html',
                 error_message="No analysis data found. Please perform an analysis first.")
             
-        analysis_data = analysis_cache[cache_key]
-        pdf_path = generate_pdf_report(analysis_data)
-        
-        return send_file(
-            pdf_path,
-            as_attachment=True,
-            download_name=f"competitive_analysis_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+        etag, pdf_bytes = get_export_artifact(cache_key, 'pdf')
+        return export_response(
+            pdf_bytes, etag, 'application/pdf',
+            filename=f"competitive_analysis_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
         )
         
     except Exception as e:
@@ -251,13 +568,80 @@ def export_json():
         if not cache_key or cache_key not in analysis_cache:
             return jsonify({"error": "No analysis data found"}), 404
             
-        return jsonify(analysis_cache[cache_key])
+        # Validated by the analysis hash, which analysis pages carry as data-etag
+        etag, payload = get_export_artifact(cache_key, 'json')
+        return payload_response(payload, request, etag=etag)
         
     except Exception as e:
         app.logger.error(f"JSON export error: {str(e)}")
         return jsonify({"error": "Error exporting data"}), 500
 
 
+@app.route('/export/csv')
+def export_csv():
+    """Export analysis data as CSV"""
+    try:
+        cache_key = request.args.get('key')
+        if not cache_key or cache_key not in analysis_cache:
+            return jsonify({"error": "No analysis data found"}), 404
+
+        etag, csv_bytes = get_export_artifact(cache_key, 'csv')
+        return export_response(
+            csv_bytes, etag, 'text/csv',
+            filename=f"competitive_analysis_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        )
+
+    except Exception as e:
+        app.logger.error(f"CSV export error: {str(e)}")
+        return jsonify({"error": "Error exporting data"}), 500
+
+
+@app.route('/export/report', methods=['GET', 'POST'])
+def export_report():
+    """Stream one PDF report covering several cached analyses"""
+    keys = request.args.getlist('key')
+    if not keys and request.method == 'POST':
+        keys = (request.get_json(silent=True) or {}).get('keys') or request.form.getlist('key')
+    if not isinstance(keys, list) or not all(isinstance(key, str) for key in keys):
+        return jsonify({"error": "keys must be a list of analysis keys"}), 400
+    keys = list(dict.fromkeys(keys))
+    if not keys:
+        return jsonify({"error": "No analysis keys given"}), 400
+    if len(keys) > app.config['REPORT_MAX_ANALYSES']:
+        return jsonify({"error": f"At most {app.config['REPORT_MAX_ANALYSES']} analyses per report"}), 400
+    missing = [key for key in keys if key not in analysis_cache]
+    if missing:
+        return jsonify({"error": "No analysis data found", "missing": missing}), 404
+
+    # The slot is held until the last byte is sent, not just until the view returns
+    slot = ExitStack()
+    try:
+        slot.enter_context(admission.admit('report'))
+    except Overloaded as e:
+        return overloaded_response(e)
+
+    def sections():
+        # Analyses are read one at a time as the report is written
+        for key in keys:
+            analysis = analysis_cache.get(key)
+            if analysis is None:
+                continue
+            overview = analysis.get('company_overview') or {}
+            title = ' - '.join(str(v) for v in (overview.get('name'), overview.get('industry')) if v) or key
+            yield title, analysis
+
+    app.logger.info(f"Streaming report covering {len(keys)} analyses")
+    response = app.response_class(
+        stream_report(sections(), pool=report_pool if len(keys) >= app.config['REPORT_POOL_MIN_SECTIONS'] else None),
+        mimetype='application/pdf'
+    )
+    response.headers['Content-Disposition'] = (
+        f"attachment; filename=competitive_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+    )
+    response.call_on_close(slot.close)
+    return response
+
+
 @app.route('/api/insights')
 def get_insights():
     """Get AI-powered insights"""
@@ -266,13 +650,37 @@ def get_insights():
         if not cache_key or cache_key not in analysis_cache:
             return jsonify({"error": "No analysis data found"}), 404
             
-        return jsonify(analysis_cache[cache_key].get('ai_insights', {}))
+        _, payload = get_export_artifact(cache_key, 'insights')
+        return payload_response(payload, request)
         
     except Exception as e:
         app.logger.error(f"API error: {str(e)}")
         return jsonify({"error": "Error retrieving insights"}), 500
 
 
+@app.route('/api/charts')
+def get_charts():
+    """Get the chart datasets of an analysis"""
+    try:
+        cache_key = request.args.get('key')
+        if not cache_key or cache_key not in analysis_cache:
+            return jsonify({"error": "No analysis data found"}), 404
+
+        etag, payload = get_export_artifact(cache_key, 'charts')
+        # A URL versioned with the current analysis hash never changes content
+        return payload_response(payload, request, immutable=request.args.get('v') == etag)
+
+    except Exception as e:
+        app.logger.error(f"API error: {str(e)}")
+        return jsonify({"error": "Error retrieving chart data"}), 500
+
+
+@app.route('/assets/<path:filename>')
+def asset(filename):
+    """Fingerprinted static files"""
+    return assets.response(filename, request)
+
+
 @app.route('/api/market-data')
 def get_market_data():
     """Get market data"""
@@ -281,13 +689,179 @@ def get_market_data():
         if not cache_key or cache_key not in analysis_cache:
             return jsonify({"error": "No analysis data found"}), 404
             
-        return jsonify(analysis_cache[cache_key].get('market_data', {}))
+        _, payload = get_export_artifact(cache_key, 'market_data')
+        return payload_response(payload, request)
         
     except Exception as e:
         app.logger.error(f"API error: {str(e)}")
         return jsonify({"error": "Error retrieving market data"}), 500
 
 
+@app.route('/api/history')
+def get_history():
+    """Trend series of numeric analysis fields.
+
+    Filters: repeated ``company``, ``metric`` and ``domain`` parameters (or
+    comma-separated values) and a ``start``/``end`` range as epoch seconds or
+    ISO dates.
+    """
+    if not app.config['HISTORY_ENABLED']:
+        return jsonify({"error": "History is disabled"}), 404
+
+    def values(name):
+        items = [v.strip() for arg in request.args.getlist(name) for v in arg.split(',') if v.strip()]
+        return items or None
+
+    try:
+        from services.history_store import parse_time
+        start = parse_time(request.args.get('start'))
+        end = parse_time(request.args.get('end'))
+    except ValueError:
+        return jsonify({"error": "start and end must be epoch seconds or ISO dates"}), 400
+
+    try:
+        series = registry.history.query(
+            companies=values('company'),
+            metrics=values('metric'),
+            domains=values('domain'),
+            start=start,
+            end=end
+        )
+        return payload_response(encode_payload({'series': series}), request)
+
+    except Exception as e:
+        app.logger.error(f"History query error: {str(e)}")
+        return jsonify({"error": "Error retrieving history"}), 500
+
+
+@app.route('/api/search')
+def search_pages():
+    """BM25 search over scraped competitor pages; quote phrases with double quotes"""
+    if registry.search_index is None:
+        return jsonify({"error": "Search is disabled"}), 404
+
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"error": "Query parameter q is required"}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', 10)), 1), 100)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+
+    try:
+        with span('search.query'):
+            results = registry.search_index.search(query, limit=limit)
+        return jsonify({'query': query, **results})
+    except Exception as e:
+        app.logger.error(f"Search error: {str(e)}")
+        return jsonify({"error": "Error searching pages"}), 500
+
+
+@app.route('/api/similar')
+def similar_companies():
+    """Most similar scraped sites to a company (hostname match) or URL"""
+    if registry.similarity is None:
+        return jsonify({"error": "Similarity search is disabled"}), 404
+
+    company = (request.args.get('company') or request.args.get('url') or '').strip()
+    if not company:
+        return jsonify({"error": "company or url is required"}), 400
+    try:
+        k = min(max(int(request.args.get('k', 10)), 1), 100)
+    except ValueError:
+        return jsonify({"error": "k must be an integer"}), 400
+
+    try:
+        with span('similarity.query'):
+            results = registry.similarity.most_similar(company, k=k, domain=request.args.get('domain') or None)
+        if results is None:
+            return jsonify({"error": "No scraped site found for this company"}), 404
+        return jsonify({'company': company, 'results': results})
+    except Exception as e:
+        app.logger.error(f"Similarity error: {str(e)}")
+        return jsonify({"error": "Error finding similar companies"}), 500
+
+
+@app.route('/api/clusters')
+def company_clusters():
+    """Group the scraped sites of a product domain into clusters"""
+    if registry.similarity is None:
+        return jsonify({"error": "Similarity search is disabled"}), 404
+    try:
+        k = min(max(int(request.args.get('k', 5)), 1), 50)
+    except ValueError:
+        return jsonify({"error": "k must be an integer"}), 400
+
+    try:
+        with span('similarity.clusters'):
+            clusters = registry.similarity.clusters(domain=request.args.get('domain') or None, k=k)
+        return jsonify({'domain': request.args.get('domain'), 'clusters': clusters})
+    except Exception as e:
+        app.logger.error(f"Clustering error: {str(e)}")
+        return jsonify({"error": "Error clustering companies"}), 500
+
+
+@app.route('/api/watchlist', methods=['GET', 'POST', 'DELETE'])
+def watchlist():
+    """List, add or remove watched (competitor, company, domain) triples"""
+    if request.method == 'GET':
+        return jsonify({'items': scheduler.items(), 'budgets': scheduler.budgets()})
+
+    data = request.get_json(silent=True) or request.form
+    competitor_company = (data.get('competitor_company') or '').strip()
+    your_company = (data.get('your_company') or '').strip()
+    product_domain = (data.get('product_domain') or '').strip()
+    if not all([competitor_company, your_company, product_domain]):
+        return jsonify({
+            'success': False,
+            'error': 'competitor_company, your_company and product_domain are required'
+        }), 400
+
+    if request.method == 'DELETE':
+        removed = scheduler.unwatch(competitor_company, your_company, product_domain)
+        if removed:
+            try:
+                os.remove(refreshed_analysis_path(analysis_cache_key(competitor_company, your_company, product_domain)))
+            except OSError:
+                pass
+        return jsonify({'success': removed}), 200 if removed else 404
+
+    try:
+        interval = float(data['interval']) if data.get('interval') else None
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'interval must be a number of seconds'}), 400
+    item = scheduler.watch(competitor_company, your_company, product_domain, interval=interval)
+    return jsonify({'success': True, 'item': item.to_dict()}), 201
+
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus-style metrics for this worker process"""
+    return metrics.REGISTRY.expose(), 200, {'Content-Type': metrics.CONTENT_TYPE}
+
+
+@app.route('/debug/traces')
+def debug_traces():
+    """Recent request traces with a waterfall view of their spans"""
+    if not app.config['DEBUG_TRACES']:
+        return not_found_error(None)
+
+    trace_id = request.args.get('trace_id')
+    if trace_id:
+        spans = trace_buffer.get(trace_id)
+        if not spans:
+            return jsonify({"error": "Trace not found"}), 404
+        if request.args.get('format') == 'json':
+            return jsonify(spans)
+        total = max(s['offset_ms'] + (s['duration_ms'] or 0) for s in spans) or 1
+        return render_template('traces.html', trace_id=trace_id, spans=spans, total_ms=total)
+
+    traces = trace_buffer.traces()
+    if request.args.get('format') == 'json':
+        return jsonify(traces)
+    return render_template('traces.html', traces=traces)
+
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('error.html',
@@ -312,5 +886,10 @@ else:
 def run_demo():
     """Trigger the Smithery agent demo workflow and return JSON summary."""
     demo_command = "Analyze our competitors Acme Corp and Globex for their latest pricing and features, then update the Notion report and notify the team on Slack."
-    result = agent.run_command(demo_command)
+    try:
+        with admission.admit('run_demo'):
+            result = registry.agent.run_command(demo_command)
+    except Overloaded as e:
+        app.logger.warning(f"Shedding agent demo request: {str(e)}")
+        return overloaded_response(e)
     return jsonify(result)
\ No newline at end of file
@@ -0,0 +1,8 @@
+"""
+Reproducible benchmarks for the competitor analysis app.
+
+External services are replaced by local stand-ins: ``fake_openai`` serves an
+OpenAI-compatible chat completions API with configurable latency and errors,
+and ``fixture_sites`` serves recorded competitor pages. ``run`` drives the
+scenarios and writes machine-readable results; see ``python -m benchmarks.run -h``.
+"""
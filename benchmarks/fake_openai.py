@@ -0,0 +1,167 @@
+"""
+A local OpenAI-compatible chat completions server for benchmarks.
+
+    python -m benchmarks.fake_openai --port 8089 --latency 0.2 --error-rate 0.05
+
+Point the app at it with ``OPENAI_BASE_URL=http://127.0.0.1:8089/v1``.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+COMPARE_PATTERN = re.compile(r"Compare (?P<competitor>.+?) vs (?P<company>.+?) in (?P<domain>.+?) market")
+
+
+def build_analysis(competitor, company, domain):
+    """A response in the shape the analysis template expects"""
+    rnd = random.Random(f"{competitor}|{company}|{domain}")
+    comp_share = rnd.randint(25, 45)
+    your_share = rnd.randint(15, 35)
+    return {
+        "company_overview": {"name": competitor, "industry": domain, "target_audience": "Mid-market and enterprise"},
+        "market_analysis": {
+            "market_share": {competitor: f"{comp_share}%", company: f"{your_share}%",
+                             "others": f"{100 - comp_share - your_share}%"},
+            "revenue_trends": {
+                "labels": ["2020", "2021", "2022", "2023", "2024"],
+                "datasets": [
+                    {"label": competitor, "data": sorted(rnd.randint(80, 220) for _ in range(5))},
+                    {"label": company, "data": sorted(rnd.randint(70, 200) for _ in range(5))},
+                ],
+            },
+        },
+        "visualization_data": {
+            "market_share_data": {"labels": [competitor, company, "Others"],
+                                  "values": [comp_share, your_share, 100 - comp_share - your_share]},
+            "product_comparison": {
+                "categories": ["Innovation", "Price", "Quality", "Market Share", "Brand Value"],
+                "datasets": [
+                    {"label": competitor, "data": [rnd.randint(5, 10) for _ in range(5)]},
+                    {"label": company, "data": [rnd.randint(5, 10) for _ in range(5)]},
+                ],
+            },
+        },
+        "swot_analysis": {
+            "strengths": [f"Established presence in {domain}", "Broad integration ecosystem"],
+            "weaknesses": ["Complex pricing", "Slow enterprise onboarding"],
+            "opportunities": ["Usage-based pricing adoption", "Expansion into EMEA"],
+            "threats": ["Open-source alternatives", "Consolidation among incumbents"],
+        },
+    }
+
+
+class FakeOpenAIServer:
+    """Serves ``POST /v1/chat/completions`` on a background thread"""
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-openai', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _next_delay_and_failure(self):
+        with self._lock:
+            self.requests += 1
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+            return delay, failed
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, payload):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                try:
+                    request = json.loads(self.rfile.read(length) or b'{}')
+                except ValueError:
+                    return self._send(400, {"error": {"message": "invalid JSON", "type": "invalid_request_error"}})
+                if not self.path.rstrip('/').endswith('/chat/completions'):
+                    return self._send(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+
+                delay, failed = server._next_delay_and_failure()
+                time.sleep(delay)
+                if failed:
+                    return self._send(500, {"error": {"message": "injected failure", "type": "server_error"}})
+
+                prompt = ' '.join(m.get('content', '') for m in request.get('messages', []))
+                match = COMPARE_PATTERN.search(prompt)
+                fields = match.groupdict() if match else {'competitor': 'Competitor', 'company': 'Company', 'domain': 'general'}
+                content = json.dumps(build_analysis(fields['competitor'], fields['company'], fields['domain']))
+                prompt_tokens = max(1, len(prompt) // 4)
+                completion_tokens = max(1, len(content) // 4)
+                self._send(200, {
+                    "id": f"chatcmpl-fake{server.requests}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request.get('model', 'gpt-3.5-turbo'),
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                        "total_tokens": prompt_tokens + completion_tokens,
+                    },
+                })
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a fake OpenAI-compatible server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to each completion')
+    parser.add_argument('--jitter', type=float, default=0.0, help='uniform +/- jitter in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with 500')
+    args = parser.parse_args()
+    server = FakeOpenAIServer(args.host, args.port, args.latency, args.jitter, args.error_rate)
+    print(f"Fake OpenAI listening on {server.url}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Serves recorded competitor pages from ``benchmarks/fixtures/sites``.
+
+``/<name>`` returns ``<name>.html``, so the scraper can be pointed at it with
+``SCRAPER_URL_TEMPLATE=http://127.0.0.1:<port>/{name}``.
+
+    python -m benchmarks.fixture_sites --port 8090
+"""
+import argparse
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'sites')
+
+
+def load_pages(directory=FIXTURE_DIR):
+    """Map of page name to raw HTML bytes"""
+    pages = {}
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith('.html'):
+            with open(os.path.join(directory, filename), 'rb') as fh:
+                pages[filename[:-len('.html')]] = fh.read()
+    return pages
+
+
+class FixtureSiteServer:
+    def __init__(self, host='127.0.0.1', port=0, directory=FIXTURE_DIR):
+        self.pages = load_pages(directory)
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def url_template(self):
+        return self.base_url + '/{name}'
+
+    def url(self, name):
+        return f"{self.base_url}/{name}"
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name='fixture-sites', daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        pages = self.pages
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                name = self.path.strip('/').split('?')[0].split('/')[0].lower()
+                body = pages.get(name)
+                if body is None:
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Server', 'nginx')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve recorded competitor pages')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    args = parser.parse_args()
+    server = FixtureSiteServer(args.host, args.port)
+    print(f"Serving {len(server.pages)} fixture pages at {server.url_template}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,400 @@
+"""
+Load-test the app under gunicorn and produce a capacity report.
+
+Starts the stub services, then for each worker class launches gunicorn with
+the app pointed at the stubs and drives a weighted mix of /analyze, export and
+/api/* requests at rising concurrency. Each level records throughput,
+p50/p95/p99 latency, status codes, and RSS and CPU time per worker. The report
+recommends workers per core from the measured CPU cost of a saturated worker.
+
+    python -m benchmarks.loadtest --worker-classes sync,gthread --concurrency 1,4,16,32 \\
+        --duration 20 --openai-latency 0.8 --report capacity.md --output capacity.json
+
+Caches are per worker process, so export and /api/* requests for a key may
+land on a worker that has not analyzed it yet; those show up as 404s in the
+status breakdown rather than as errors.
+"""
+import argparse
+import http.client
+import importlib.util
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import urlencode
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from benchmarks.run import percentile, git_commit
+from benchmarks.stubs import StubServices
+
+# Async worker classes need their event loop library installed
+WORKER_CLASS_REQUIREMENTS = {'gevent': 'gevent', 'eventlet': 'eventlet'}
+
+COMPANIES = ['Acme', 'Globex', 'Initech', 'Umbrella', 'Hooli', 'Stark', 'Wayne', 'Wonka', 'Cyberdyne', 'Soylent']
+DOMAINS = ['Analytics', 'CRM', 'Payments', 'Security']
+
+# (name, weight) of the request mix
+DEFAULT_MIX = {
+    'analyze': 30,
+    'export_pdf': 10,
+    'export_json': 10,
+    'insights': 20,
+    'market_data': 20,
+    'api_analyze': 10,
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def worker_pids(master_pid):
+    """PIDs of processes whose parent is the gunicorn master"""
+    pids = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as fh:
+                fields = fh.read().rsplit(')', 1)[1].split()
+            if int(fields[1]) == master_pid:
+                pids.append(int(entry))
+        except (OSError, IndexError, ValueError):
+            continue
+    return pids
+
+
+def process_stats(pid):
+    """(rss_bytes, cpu_seconds) for a process, or None if it is gone"""
+    try:
+        with open(f'/proc/{pid}/status') as fh:
+            rss = next(int(line.split()[1]) * 1024 for line in fh if line.startswith('VmRSS:'))
+        with open(f'/proc/{pid}/stat') as fh:
+            fields = fh.read().rsplit(')', 1)[1].split()
+        ticks = os.sysconf('SC_CLK_TCK')
+        return rss, (int(fields[11]) + int(fields[12])) / ticks
+    except (OSError, StopIteration, IndexError, ValueError):
+        return None
+
+
+class GunicornServer:
+    def __init__(self, worker_class, workers, threads, env):
+        self.worker_class = worker_class
+        self.workers = workers
+        self.threads = threads
+        self.port = free_port()
+        self.env = {**os.environ, **env}
+        self.process = None
+
+    def start(self, timeout=30):
+        cmd = [sys.executable, '-m', 'gunicorn', 'app:app',
+               '--bind', f'127.0.0.1:{self.port}',
+               '--workers', str(self.workers),
+               '--worker-class', self.worker_class,
+               '--timeout', '120',
+               '--log-level', 'warning']
+        if self.worker_class == 'gthread':
+            cmd += ['--threads', str(self.threads)]
+        elif self.worker_class in WORKER_CLASS_REQUIREMENTS:
+            cmd += ['--worker-connections', '1000']
+        self.process = subprocess.Popen(cmd, cwd=PROJECT_ROOT, env=self.env,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f'gunicorn ({self.worker_class}) exited with {self.process.returncode}')
+            try:
+                conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=2)
+                conn.request('GET', '/')
+                conn.getresponse().read()
+                conn.close()
+                if len(worker_pids(self.process.pid)) >= self.workers:
+                    return self
+            except OSError:
+                pass
+            time.sleep(0.2)
+        self.stop()
+        raise RuntimeError(f'gunicorn ({self.worker_class}) did not become ready')
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.send_signal(signal.SIGTERM)
+            try:
+                self.process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+    def worker_stats(self):
+        stats = {}
+        for pid in worker_pids(self.process.pid):
+            values = process_stats(pid)
+            if values:
+                stats[pid] = values
+        return stats
+
+
+class LoadGenerator:
+    """Closed-loop load: each client thread issues its next request when the previous completes"""
+
+    def __init__(self, port, mix, fixture_url, seed=0, timeout=60):
+        self.port = port
+        self.mix = mix
+        self.fixture_url = fixture_url
+        self.seed = seed
+        self.timeout = timeout
+
+    def _request(self, rnd):
+        kind = rnd.choices(list(self.mix), weights=list(self.mix.values()))[0]
+        competitor, company = rnd.sample(COMPANIES, 2)
+        domain = rnd.choice(DOMAINS)
+        key = f"{competitor}_{company}_{domain}"
+        headers = {'Accept-Encoding': 'gzip'}
+        if kind == 'analyze':
+            body = urlencode({'competitor_company': competitor, 'your_company': company, 'product_domain': domain})
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            return kind, 'POST', '/analyze', body, headers
+        if kind == 'api_analyze':
+            body = json.dumps({'competitor_url': self.fixture_url, 'your_company': company, 'product_domain': domain})
+            headers['Content-Type'] = 'application/json'
+            return kind, 'POST', '/api/analyze', body, headers
+        path = {
+            'export_pdf': '/export/pdf',
+            'export_json': '/export/json',
+            'insights': '/api/insights',
+            'market_data': '/api/market-data',
+        }[kind]
+        return kind, 'GET', f"{path}?{urlencode({'key': key})}", None, headers
+
+    def run(self, concurrency, duration):
+        deadline = time.perf_counter() + duration
+        samples = []
+        lock = threading.Lock()
+
+        def client(index):
+            rnd = random.Random(self.seed * 1000 + index)
+            local = []
+            while time.perf_counter() < deadline:
+                kind, method, path, body, headers = self._request(rnd)
+                start = time.perf_counter()
+                try:
+                    conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=self.timeout)
+                    conn.request(method, path, body=body, headers=headers)
+                    response = conn.getresponse()
+                    response.read()
+                    status = response.status
+                    conn.close()
+                except OSError as e:
+                    status = f'error:{type(e).__name__}'
+                local.append((kind, status, time.perf_counter() - start))
+            with lock:
+                samples.extend(local)
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return samples, time.perf_counter() - started
+
+
+def summarize_level(samples, elapsed, before, after, workers):
+    latencies = sorted(s[2] for s in samples)
+    statuses = Counter(str(s[1]) for s in samples)
+    errors = sum(n for status, n in statuses.items() if status.startswith('error') or status.startswith('5'))
+    cpu = sum(after[pid][1] - before[pid][1] for pid in after if pid in before)
+    rss = [after[pid][0] for pid in after]
+    by_kind = {}
+    for kind in sorted({s[0] for s in samples}):
+        kind_latencies = sorted(s[2] for s in samples if s[0] == kind)
+        by_kind[kind] = {
+            'requests': len(kind_latencies),
+            'p50_ms': round(percentile(kind_latencies, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(kind_latencies, 0.95) * 1000, 2),
+        }
+    return {
+        'requests': len(samples),
+        'throughput_rps': round(len(samples) / elapsed, 2) if elapsed else 0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'errors': errors,
+        'statuses': dict(statuses),
+        'rss_per_worker_mb': round(sum(rss) / len(rss) / 2 ** 20, 1) if rss else None,
+        'rss_max_worker_mb': round(max(rss) / 2 ** 20, 1) if rss else None,
+        # Fraction of one core each worker used while under this load
+        'cpu_per_worker': round(cpu / elapsed / workers, 3) if elapsed and workers else None,
+        'cpu_ms_per_request': round(cpu / len(samples) * 1000, 2) if samples else None,
+        'by_kind': by_kind,
+    }
+
+
+def recommend(results, slo_p95_ms, memory_budget_mb, cores):
+    """Per worker class: the best level within the SLO and a workers-per-core estimate"""
+    recommendations = {}
+    for worker_class, data in results.items():
+        levels = data.get('levels') or {}
+        within = [(c, lvl) for c, lvl in levels.items()
+                  if lvl['p95_ms'] <= slo_p95_ms and lvl['errors'] == 0 and lvl['requests']]
+        if not within:
+            recommendations[worker_class] = {'note': f'no level met p95 <= {slo_p95_ms} ms without errors'}
+            continue
+        concurrency, best = max(within, key=lambda item: item[1]['throughput_rps'])
+        utilisation = best['cpu_per_worker'] or 0
+        # A worker using fraction u of a core at saturation leaves room for 1/u workers per core
+        per_core = max(1, min(16, int(1 / utilisation))) if utilisation > 0 else 16
+        rec = {
+            'best_concurrency': int(concurrency),
+            'throughput_rps': best['throughput_rps'],
+            'throughput_per_worker_rps': round(best['throughput_rps'] / data['workers'], 2),
+            'p95_ms': best['p95_ms'],
+            'cpu_per_worker': utilisation,
+            'workers_per_core': per_core,
+            'workers_for_host': per_core * cores,
+        }
+        if memory_budget_mb and best['rss_max_worker_mb']:
+            by_memory = int(memory_budget_mb // best['rss_max_worker_mb'])
+            rec['workers_by_memory'] = by_memory
+            rec['workers_for_host'] = min(rec['workers_for_host'], by_memory)
+        if worker_class == 'gthread':
+            rec['threads'] = data['threads']
+        recommendations[worker_class] = rec
+    return recommendations
+
+
+def render_report(report):
+    lines = [
+        '# Capacity report',
+        '',
+        f"- Commit: `{report['commit']}`  ",
+        f"- Measured: {report['timestamp']} on {report['cores']} cores  ",
+        f"- Workers per run: {report['settings']['workers']}, "
+        f"{report['settings']['duration']} s per level, fake OpenAI latency {report['settings']['openai_latency']} s  ",
+        f"- SLO: p95 <= {report['settings']['slo_p95_ms']} ms with no errors",
+        '',
+    ]
+    for worker_class, data in report['results'].items():
+        lines += [f"## {worker_class}", '']
+        if data.get('error'):
+            lines += [f"Skipped: {data['error']}", '']
+            continue
+        lines += ['| concurrency | rps | p50 ms | p95 ms | p99 ms | errors | RSS/worker MB | CPU/worker |',
+                  '|---:|---:|---:|---:|---:|---:|---:|---:|']
+        for concurrency, lvl in data['levels'].items():
+            lines.append(f"| {concurrency} | {lvl['throughput_rps']} | {lvl['p50_ms']} | {lvl['p95_ms']} | "
+                         f"{lvl['p99_ms']} | {lvl['errors']} | {lvl['rss_per_worker_mb']} | {lvl['cpu_per_worker']} |")
+        lines.append('')
+
+    lines += ['## Recommendation', '']
+    viable = {k: v for k, v in report['recommendations'].items() if 'workers_per_core' in v}
+    for worker_class, rec in report['recommendations'].items():
+        if 'workers_per_core' not in rec:
+            lines.append(f"- **{worker_class}**: {rec['note']}")
+            continue
+        lines.append(
+            f"- **{worker_class}**: {rec['throughput_rps']} rps at concurrency {rec['best_concurrency']} "
+            f"(p95 {rec['p95_ms']} ms), {rec['cpu_per_worker']:.0%} of a core per worker "
+            f"→ **{rec['workers_per_core']} workers per core** ({rec['workers_for_host']} on this host)"
+        )
+    if viable:
+        best_class = max(viable, key=lambda k: viable[k]['throughput_per_worker_rps'])
+        rec = viable[best_class]
+        extra = f" --threads {rec['threads']}" if 'threads' in rec else ''
+        lines += ['', f"Suggested: `gunicorn app:app -k {best_class} -w {rec['workers_for_host']}{extra}`"]
+    return '\n'.join(lines) + '\n'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test the app under gunicorn worker classes')
+    parser.add_argument('--worker-classes', default='sync,gthread,gevent')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--threads', type=int, default=8, help='threads per gthread worker')
+    parser.add_argument('--concurrency', default='1,2,4,8,16,32', help='comma-separated client counts')
+    parser.add_argument('--duration', type=float, default=15.0, help='seconds per concurrency level')
+    parser.add_argument('--openai-latency', type=float, default=0.5)
+    parser.add_argument('--openai-error-rate', type=float, default=0.0)
+    parser.add_argument('--slo-p95-ms', type=float, default=1000.0)
+    parser.add_argument('--memory-budget-mb', type=float, help='RAM available to workers on the target host')
+    parser.add_argument('--output', help='write raw results JSON here')
+    parser.add_argument('--report', help='write the markdown capacity report here (default: stdout)')
+    args = parser.parse_args()
+
+    if importlib.util.find_spec('gunicorn') is None:
+        parser.error('gunicorn is not installed')
+
+    levels = [int(c) for c in args.concurrency.split(',') if c.strip()]
+    stubs = StubServices(openai_latency=args.openai_latency, openai_error_rate=args.openai_error_rate).start()
+    cores = os.cpu_count() or 1
+
+    results = {}
+    try:
+        for worker_class in [c.strip() for c in args.worker_classes.split(',') if c.strip()]:
+            requirement = WORKER_CLASS_REQUIREMENTS.get(worker_class)
+            if requirement and importlib.util.find_spec(requirement) is None:
+                results[worker_class] = {'error': f'{requirement} is not installed'}
+                continue
+            print(f"[{worker_class}] starting {args.workers} workers", file=sys.stderr)
+            # A fresh data directory per worker class keeps earlier runs' stores out of the numbers
+            server = GunicornServer(worker_class, args.workers, args.threads, stubs.environment())
+            try:
+                server.start()
+            except RuntimeError as e:
+                results[worker_class] = {'error': str(e)}
+                continue
+            data = results[worker_class] = {'workers': args.workers, 'threads': args.threads, 'levels': {}}
+            generator = LoadGenerator(server.port, DEFAULT_MIX, stubs.sites.url('acme'))
+            try:
+                for concurrency in levels:
+                    before = server.worker_stats()
+                    samples, elapsed = generator.run(concurrency, args.duration)
+                    after = server.worker_stats()
+                    level = summarize_level(samples, elapsed, before, after, args.workers)
+                    data['levels'][str(concurrency)] = level
+                    print(f"[{worker_class}] c={concurrency}: {level['throughput_rps']} rps, "
+                          f"p95 {level['p95_ms']} ms, errors {level['errors']}", file=sys.stderr)
+            finally:
+                server.stop()
+    finally:
+        stubs.stop()
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'cores': cores,
+        'settings': {
+            'workers': args.workers,
+            'threads': args.threads,
+            'duration': args.duration,
+            'concurrency': levels,
+            'openai_latency': args.openai_latency,
+            'openai_error_rate': args.openai_error_rate,
+            'slo_p95_ms': args.slo_p95_ms,
+            'mix': DEFAULT_MIX,
+        },
+        'results': results,
+        'recommendations': recommend(results, args.slo_p95_ms, args.memory_budget_mb, cores),
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2) + '\n')
+    markdown = render_report(report)
+    if args.report:
+        Path(args.report).write_text(markdown)
+    else:
+        print(markdown)
+
+
+if __name__ == '__main__':
+    main()
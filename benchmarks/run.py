@@ -0,0 +1,271 @@
+"""
+Run the benchmark scenarios against the app with stubbed external services.
+
+    python -m benchmarks.run --iterations 50 --output bench.json
+    python -m benchmarks.run --compare bench.json --threshold 0.15
+
+Results are JSON: one entry per scenario with latency percentiles and
+throughput, plus the git commit and interpreter they were measured on.
+``--compare`` exits with status 1 when any scenario's p50 regressed by more
+than ``--threshold`` relative to the baseline file.
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from benchmarks.stubs import StubServices
+
+DEMO_COMMAND = ("Analyze our competitors Acme and Globex for their latest pricing and features, "
+                "then update the Notion report and notify the team on Slack.")
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+def summarize(samples, extra=None):
+    ordered = sorted(samples)
+    total = sum(ordered)
+    result = {
+        'iterations': len(ordered),
+        'mean_ms': round(total / len(ordered) * 1000, 3),
+        'min_ms': round(ordered[0] * 1000, 3),
+        'p50_ms': round(percentile(ordered, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(ordered, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(ordered, 0.99) * 1000, 3),
+        'ops_per_sec': round(len(ordered) / total, 2) if total else None,
+    }
+    result.update(extra or {})
+    return result
+
+
+class Context:
+    """Shared state for scenarios: the imported app, its test client and the stubs"""
+
+    def __init__(self, app_module, stubs):
+        self.app_module = app_module
+        self.app = app_module.app
+        self.client = app_module.app.test_client()
+        self.stubs = stubs
+        self.counter = 0
+
+    def unique(self, prefix):
+        self.counter += 1
+        return f"{prefix}{self.counter}"
+
+    def analyze(self, competitor, company='Globex', domain='Analytics'):
+        response = self.client.post('/analyze', data={
+            'competitor_company': competitor, 'your_company': company, 'product_domain': domain})
+        assert response.status_code == 200, response.status_code
+        return f"{competitor}_{company}_{domain}"
+
+
+# Each scenario takes the context and returns (step, extra_fn): ``step`` is
+# timed once per iteration, ``extra_fn`` optionally adds derived figures.
+
+def scenario_analyze_cold(ctx):
+    return lambda: ctx.analyze(ctx.unique('ColdCo')), None
+
+
+def scenario_analyze_warm(ctx):
+    ctx.analyze('WarmCo')
+    return lambda: ctx.analyze('WarmCo'), None
+
+
+def scenario_api_analyze(ctx):
+    url = ctx.stubs.sites.url('acme')
+
+    def step():
+        response = ctx.client.post('/api/analyze', json={
+            'competitor_url': url, 'your_company': 'Globex', 'product_domain': 'Analytics'})
+        assert response.status_code == 200, response.status_code
+    return step, None
+
+
+def _export(ctx, path, key, clear):
+    def step():
+        if clear:
+            ctx.app_module.export_cache.discard_matching(lambda k: True)
+        response = ctx.client.get(f"{path}?key={key}", headers={'Accept-Encoding': 'gzip'})
+        assert response.status_code == 200, response.status_code
+    return step
+
+
+def scenario_export_pdf_cold(ctx):
+    return _export(ctx, '/export/pdf', ctx.analyze('PdfCo'), clear=True), None
+
+
+def scenario_export_pdf_warm(ctx):
+    return _export(ctx, '/export/pdf', ctx.analyze('PdfCo'), clear=False), None
+
+
+def scenario_export_json_cold(ctx):
+    return _export(ctx, '/export/json', ctx.analyze('JsonCo'), clear=True), None
+
+
+def scenario_export_json_warm(ctx):
+    return _export(ctx, '/export/json', ctx.analyze('JsonCo'), clear=False), None
+
+
+def scenario_data_fetcher_parse(ctx):
+    fetcher = ctx.app_module.registry.data_fetcher
+    pages = list(ctx.stubs.sites.pages.items())
+    page_bytes = sum(len(html) for _, html in pages)
+
+    def step():
+        for name, html in pages:
+            fetcher.parse_website(html, f"https://{name}.example", {'Server': 'nginx'})
+
+    def extra(summary):
+        seconds = summary['mean_ms'] / 1000
+        return {'pages_per_sec': round(len(pages) / seconds, 1),
+                'mb_per_sec': round(page_bytes / seconds / 1e6, 3)}
+    return step, extra
+
+
+def scenario_data_fetcher_fetch(ctx):
+    fetcher = ctx.app_module.registry.data_fetcher
+    url = ctx.stubs.sites.url('globex')
+
+    def step():
+        assert fetcher.fetch_website_data(url) is not None
+    return step, None
+
+
+def scenario_agent_run(ctx):
+    agent = ctx.app_module.registry.agent
+    return lambda: agent.run_command(DEMO_COMMAND), None
+
+
+SCENARIOS = {
+    'analyze_cold': scenario_analyze_cold,
+    'analyze_warm': scenario_analyze_warm,
+    'api_analyze': scenario_api_analyze,
+    'export_pdf_cold': scenario_export_pdf_cold,
+    'export_pdf_warm': scenario_export_pdf_warm,
+    'export_json_cold': scenario_export_json_cold,
+    'export_json_warm': scenario_export_json_warm,
+    'data_fetcher_parse': scenario_data_fetcher_parse,
+    'data_fetcher_fetch': scenario_data_fetcher_fetch,
+    'agent_run': scenario_agent_run,
+}
+
+
+def run_scenario(ctx, name, iterations, warmup):
+    step, extra = SCENARIOS[name](ctx)
+    for _ in range(warmup):
+        step()
+    gc.collect()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        step()
+        samples.append(time.perf_counter() - start)
+    summary = summarize(samples)
+    if extra:
+        summary.update(extra(summary))
+    return summary
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(results, baseline_path, threshold):
+    """Print p50 deltas against a baseline; returns the regressed scenario names"""
+    baseline = json.loads(Path(baseline_path).read_text())['scenarios']
+    regressions = []
+    print(f"\n{'scenario':<22}{'baseline p50':>14}{'current p50':>14}{'change':>10}")
+    for name, current in results['scenarios'].items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]['p50_ms'], current['p50_ms']
+        change = (after - before) / before if before else 0.0
+        flag = '  REGRESSION' if change > threshold else ''
+        print(f"{name:<22}{before:>14.3f}{after:>14.3f}{change:>+10.1%}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run app benchmarks with stubbed external services')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help='comma-separated subset of: ' + ', '.join(SCENARIOS))
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--openai-latency', type=float, default=0.0, help='fake OpenAI latency in seconds')
+    parser.add_argument('--openai-jitter', type=float, default=0.0)
+    parser.add_argument('--openai-error-rate', type=float, default=0.0)
+    parser.add_argument('--output', help='write results JSON to this file (default: stdout)')
+    parser.add_argument('--compare', help='baseline results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10, help='allowed p50 slowdown before failing')
+    args = parser.parse_args()
+
+    names = [n.strip() for n in args.scenarios.split(',') if n.strip()]
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    stubs = StubServices(args.openai_latency, args.openai_jitter, args.openai_error_rate).start()
+    os.environ.update(stubs.environment())
+    import app as app_module
+    logging.getLogger().setLevel(logging.ERROR)
+
+    ctx = Context(app_module, stubs)
+    results = {
+        'commit': git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {
+            'iterations': args.iterations,
+            'warmup': args.warmup,
+            'openai_latency': args.openai_latency,
+            'openai_jitter': args.openai_jitter,
+            'openai_error_rate': args.openai_error_rate,
+        },
+        'scenarios': {},
+    }
+    try:
+        for name in names:
+            print(f"running {name} ...", file=sys.stderr)
+            results['scenarios'][name] = run_scenario(ctx, name, args.iterations, args.warmup)
+    finally:
+        stubs.stop()
+    results['openai_requests'] = stubs.openai.requests
+
+    encoded = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(encoded + '\n')
+    else:
+        print(encoded)
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} scenario(s) regressed beyond {args.threshold:.0%}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
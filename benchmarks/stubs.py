@@ -0,0 +1,57 @@
+"""Starts the local stand-ins for external services and builds the app environment."""
+import atexit
+import os
+import shutil
+import tempfile
+
+from benchmarks.fake_openai import FakeOpenAIServer
+from benchmarks.fixture_sites import FixtureSiteServer
+
+
+class StubServices:
+    def __init__(self, openai_latency=0.0, openai_jitter=0.0, openai_error_rate=0.0):
+        self.openai = FakeOpenAIServer(latency=openai_latency, jitter=openai_jitter, error_rate=openai_error_rate)
+        self.sites = FixtureSiteServer()
+        self._data_dirs = []
+
+    def start(self):
+        self.openai.start()
+        self.sites.start()
+        # Registered before the app is imported, so it runs after the stores' own exit flushes
+        atexit.register(self.remove_data_dirs)
+        return self
+
+    def stop(self):
+        self.openai.stop()
+        self.sites.stop()
+        self.remove_data_dirs()
+
+    def remove_data_dirs(self):
+        for directory in self._data_dirs:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def environment(self):
+        """Environment variables that route the app's external calls to the stubs.
+
+        Each call gets a fresh, empty data directory for the persistent stores
+        (snapshots, history, search, similarity, watchlist), so results never
+        depend on what earlier runs left behind; ``stop`` removes them.
+        """
+        data_dir = tempfile.mkdtemp(prefix='tracksmith-bench-')
+        self._data_dirs.append(data_dir)
+        return {
+            'OPENAI_API_KEY': 'sk-benchmark',
+            'OPENAI_BASE_URL': self.openai.url,
+            'SCRAPER_URL_TEMPLATE': self.sites.url_template,
+            # Keep third-party integrations and background work out of the measurements
+            'NOTION_API_KEY': '',
+            'SLACK_WEBHOOK_URL': '',
+            'AI_SCREENSHOT_API_KEY': '',
+            'PRERENDER_EXPORTS': 'false',
+            'DATA_DIR': data_dir,
+            'SNAPSHOT_DIR': os.path.join(data_dir, 'snapshots'),
+            'HISTORY_DIR': os.path.join(data_dir, 'history'),
+            'SEARCH_INDEX_FILE': os.path.join(data_dir, 'search-index.jsonl'),
+            'SIMILARITY_DIR': os.path.join(data_dir, 'similarity'),
+            'WATCHLIST_FILE': os.path.join(data_dir, 'watchlist.json'),
+        }
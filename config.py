@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -6,4 +7,85 @@ load_dotenv()
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY')
     OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
-    DEBUG = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
\ No newline at end of file
+    # Alternative OpenAI-compatible endpoint (e.g. the benchmark fake server)
+    OPENAI_BASE_URL = os.environ.get('OPENAI_BASE_URL') or None
+    DEBUG = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
+    # Private (0700, owner-checked) directory for the persistent stores shared by all workers
+    DATA_DIR = os.environ.get('DATA_DIR', os.path.join(
+        tempfile.gettempdir(), f"tracksmith-{os.geteuid() if hasattr(os, 'geteuid') else 'data'}"))
+    # Cached analyses beyond the most recently used ones are stored compressed
+    ANALYSIS_CACHE_HOT_ENTRIES = int(os.environ.get('ANALYSIS_CACHE_HOT_ENTRIES', 64))
+    ANALYSIS_CACHE_COMPRESS = os.environ.get('ANALYSIS_CACHE_COMPRESS', 'True').lower() == 'true'
+    # Least recently used analyses are evicted beyond these bounds
+    ANALYSIS_CACHE_MAX_ENTRIES = int(os.environ.get('ANALYSIS_CACHE_MAX_ENTRIES', 1024))
+    ANALYSIS_CACHE_MAX_BYTES = int(os.environ.get('ANALYSIS_CACHE_MAX_BYTES', 128 * 1024 * 1024))
+    # Upper bound for rendered export artifacts (PDF) kept in memory
+    EXPORT_CACHE_MAX_BYTES = int(os.environ.get('EXPORT_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    # Background pre-rendering of export artifacts after an analysis completes
+    PRERENDER_EXPORTS = os.environ.get('PRERENDER_EXPORTS', 'True').lower() == 'true'
+    PRERENDER_QUEUE_SIZE = int(os.environ.get('PRERENDER_QUEUE_SIZE', 32))
+    PRERENDER_MAX_INFLIGHT = int(os.environ.get('PRERENDER_MAX_INFLIGHT', 4))
+    # Rendered analysis pages kept in memory for cache hits
+    PAGE_CACHE_MAX_BYTES = int(os.environ.get('PAGE_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+    # Request tracing: in-memory buffer for /debug/traces, optional JSON-lines file
+    TRACING_ENABLED = os.environ.get('TRACING_ENABLED', 'True').lower() == 'true'
+    TRACE_FILE = os.environ.get('TRACE_FILE')
+    TRACE_BUFFER_SIZE = int(os.environ.get('TRACE_BUFFER_SIZE', 200))
+    DEBUG_TRACES = os.environ.get('DEBUG_TRACES', os.environ.get('FLASK_DEBUG', 'False')).lower() == 'true'
+    # Opt-in request profiling (see utils/profiling.py)
+    PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0.0))
+    PROFILE_MODE = os.environ.get('PROFILE_MODE', 'sample')
+    PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN')
+    PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'tracksmith-profiles'))
+    PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', 5))
+    # Columnar history of numeric analysis fields (see services/history_store.py)
+    HISTORY_ENABLED = os.environ.get('HISTORY_ENABLED', 'True').lower() == 'true'
+    HISTORY_DIR = os.environ.get('HISTORY_DIR', os.path.join(DATA_DIR, 'history'))
+    HISTORY_FLUSH_ROWS = int(os.environ.get('HISTORY_FLUSH_ROWS', 2048))
+    HISTORY_FLUSH_INTERVAL = float(os.environ.get('HISTORY_FLUSH_INTERVAL', 60))
+    # Snapshots of scraped pages; unchanged pages reuse the previous AI analysis
+    SNAPSHOTS_ENABLED = os.environ.get('SNAPSHOTS_ENABLED', 'True').lower() == 'true'
+    SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', os.path.join(DATA_DIR, 'snapshots'))
+    # Entries kept per URL, and how long remembered analyses (and their snapshots) are kept
+    SNAPSHOT_HISTORY = int(os.environ.get('SNAPSHOT_HISTORY', 100))
+    SNAPSHOT_RETENTION_DAYS = float(os.environ.get('SNAPSHOT_RETENTION_DAYS', 30))
+    # Generate analyses section by section and re-prompt only sections whose inputs changed
+    SECTION_ANALYSIS = os.environ.get('SECTION_ANALYSIS', 'True').lower() == 'true'
+    SECTION_CACHE_MAX_BYTES = int(os.environ.get('SECTION_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+    # Background refresh of watched analyses (run by one elected worker process)
+    SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', 'False').lower() == 'true'
+    SCHEDULER_AUTO_WATCH = os.environ.get('SCHEDULER_AUTO_WATCH', 'False').lower() == 'true'
+    WATCHLIST_FILE = os.environ.get('WATCHLIST_FILE', os.path.join(DATA_DIR, 'watchlist.json'))
+    # Refreshed analyses are published here for the workers that did not run the refresh
+    SCHEDULER_RESULTS_DIR = os.environ.get('SCHEDULER_RESULTS_DIR', os.path.join(DATA_DIR, 'refreshed'))
+    SCHEDULER_INTERVAL = float(os.environ.get('SCHEDULER_INTERVAL', 6 * 3600))
+    SCHEDULER_MIN_INTERVAL = float(os.environ.get('SCHEDULER_MIN_INTERVAL', 300))
+    SCHEDULER_MAX_CONCURRENT = int(os.environ.get('SCHEDULER_MAX_CONCURRENT', 2))
+    SCHEDULER_REQUESTS_PER_MINUTE = float(os.environ.get('SCHEDULER_REQUESTS_PER_MINUTE', 10))
+    SCHEDULER_TOKENS_PER_DAY = int(os.environ.get('SCHEDULER_TOKENS_PER_DAY', 200000))
+    # Full-text index of scraped pages behind /api/search
+    SEARCH_ENABLED = os.environ.get('SEARCH_ENABLED', 'True').lower() == 'true'
+    SEARCH_INDEX_FILE = os.environ.get('SEARCH_INDEX_FILE', os.path.join(DATA_DIR, 'search-index.jsonl'))
+    # Hashed TF-IDF vectors of scraped sites for /api/similar and /api/clusters
+    SIMILARITY_ENABLED = os.environ.get('SIMILARITY_ENABLED', 'True').lower() == 'true'
+    SIMILARITY_DIR = os.environ.get('SIMILARITY_DIR', os.path.join(DATA_DIR, 'similarity'))
+    # Local market dataset (CSV/Parquet, converted to memory-mapped columns) used before the static figures
+    MARKET_DATASET = os.environ.get('MARKET_DATASET')
+    MARKET_DATASET_DIR = os.environ.get('MARKET_DATASET_DIR')
+    MARKET_DATA_CACHE_ENTRIES = int(os.environ.get('MARKET_DATA_CACHE_ENTRIES', 4096))
+    # Local sentiment scoring of scraped pages; SENTIMENT_MODEL is an optional trained linear model (.npz)
+    SENTIMENT_ENABLED = os.environ.get('SENTIMENT_ENABLED', 'True').lower() == 'true'
+    SENTIMENT_MODEL = os.environ.get('SENTIMENT_MODEL')
+    SENTIMENT_DIR = os.environ.get('SENTIMENT_DIR', os.path.join(DATA_DIR, 'sentiment'))
+    # Admission control for expensive endpoints (per worker): concurrency limits and a bounded wait queue
+    ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', 'True').lower() == 'true'
+    ADMISSION_ANALYZE_LIMIT = int(os.environ.get('ADMISSION_ANALYZE_LIMIT', 4))
+    ADMISSION_AGENT_LIMIT = int(os.environ.get('ADMISSION_AGENT_LIMIT', 1))
+    ADMISSION_QUEUE_SIZE = int(os.environ.get('ADMISSION_QUEUE_SIZE', 8))
+    ADMISSION_TIMEOUT = float(os.environ.get('ADMISSION_TIMEOUT', 10))
+    ADMISSION_REPORT_LIMIT = int(os.environ.get('ADMISSION_REPORT_LIMIT', 2))
+    # Multi-analysis PDF reports (/export/report). Sections render inline unless REPORT_WORKERS is above 1;
+    # then reports with at least REPORT_POOL_MIN_SECTIONS analyses use a process pool started with the app
+    REPORT_WORKERS = int(os.environ.get('REPORT_WORKERS', 0))
+    REPORT_POOL_MIN_SECTIONS = int(os.environ.get('REPORT_POOL_MIN_SECTIONS', 50))
+    REPORT_MAX_ANALYSES = int(os.environ.get('REPORT_MAX_ANALYSES', 500))
@@ -0,0 +1,273 @@
+"""Run competitor analyses for many (competitor, company, domain) triples.
+
+Reads triples from a CSV (``competitor,company,domain`` header; the form
+names ``competitor_company,your_company,product_domain`` also work) or JSONL
+file and analyzes them on a thread or process pool, optionally rate limited.
+Results are streamed to JSONL, or to a directory of Parquet part files when
+the output ends in ``.parquet`` (requires pyarrow), in batches.
+
+The output doubles as the checkpoint: re-running the same command skips
+triples whose results were already written, so an interrupted run resumes
+where it stopped. Failed triples are retried; their error records are removed
+from the output first, so every id appears once.
+
+``--offline`` skips scraping and the LLM entirely and computes the
+deterministic basic analyses with the vectorized batch generator. Market data
+comes from the same local providers (dataset, static figures) either way.
+
+    python scripts/bulk_analyze.py pairs.csv results.jsonl --workers 8 --rate 120
+    python scripts/bulk_analyze.py pairs.csv results.parquet --offline
+"""
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from pathlib import Path
+
+# ensure project root is on sys.path so local packages (services, utils) import correctly
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from services.scheduler import TokenBucket
+from utils.serialization import dumps
+
+FIELD_ALIASES = {
+    'competitor': ('competitor', 'competitor_company'),
+    'company': ('company', 'your_company'),
+    'domain': ('domain', 'product_domain'),
+}
+
+
+def read_triples(path):
+    """(competitor, company, domain) triples in input order"""
+    with open(path, newline='', encoding='utf-8') as fh:
+        rows = (json.loads(line) for line in fh if line.strip()) if path.endswith('.jsonl') else csv.DictReader(fh)
+        triples = []
+        for row in rows:
+            values = []
+            for aliases in FIELD_ALIASES.values():
+                values.append(next((str(row[a]).strip() for a in aliases if row.get(a) is not None), ''))
+            triples.append(tuple(values))
+    return triples
+
+
+# -- output --------------------------------------------------------------------
+
+class JsonLinesWriter:
+    def __init__(self, path):
+        self.path = path
+
+    def completed(self):
+        """Ids already written successfully; drops a partially written last line and
+        the records of failed ids (the last record per id wins)"""
+        if not os.path.exists(self.path):
+            return set()
+        with open(self.path, 'rb') as fh:
+            lines = fh.read().split(b'\n')[:-1]
+        last = {}
+        for line in lines:
+            record = json.loads(line)
+            last[record['id']] = (record.get('status'), line)
+        kept = [line for status, line in last.values() if status != 'error']
+        if len(kept) < len(lines) or os.path.getsize(self.path) != sum(len(line) + 1 for line in lines):
+            with open(self.path + '.tmp', 'wb') as fh:
+                fh.write(b''.join(line + b'\n' for line in kept))
+                fh.flush()
+                os.fsync(fh.fileno())
+            os.replace(self.path + '.tmp', self.path)
+        return {i for i, (status, _) in last.items() if status != 'error'}
+
+    def write(self, records):
+        with open(self.path, 'ab') as fh:
+            fh.write(b''.join(dumps(record) + b'\n' for record in records))
+            fh.flush()
+            os.fsync(fh.fileno())
+
+
+class ParquetWriter:
+    def __init__(self, path):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise SystemExit('Parquet output requires pyarrow; use a .jsonl output instead')
+        self.pa, self.pq = pyarrow, pyarrow.parquet
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.parts = len(glob.glob(os.path.join(path, 'part-*.parquet')))
+
+    def completed(self):
+        """Ids already written successfully; rewrites parts holding failed ids without them"""
+        done = set()
+        for part in glob.glob(os.path.join(self.path, 'part-*.parquet')):
+            table = self.pq.read_table(part, columns=['id', 'status']).to_pydict()
+            ok = [status != 'error' for status in table['status']]
+            if not all(ok):
+                tmp = os.path.join(self.path, '.rewrite.tmp')
+                self.pq.write_table(self.pq.read_table(part).filter(self.pa.array(ok)), tmp)
+                os.replace(tmp, part)
+            done.update(i for i, keep in zip(table['id'], ok) if keep)
+        return done
+
+    def write(self, records):
+        columns = {name: [r.get(name) for r in records]
+                   for name in ('id', 'competitor', 'company', 'domain', 'status', 'is_fallback', 'seconds', 'error')}
+        columns['analysis'] = [dumps(r['analysis']).decode('utf-8') if r.get('analysis') is not None else None
+                               for r in records]
+        tmp = os.path.join(self.path, f'.part-{self.parts:05d}.tmp')
+        self.pq.write_table(self.pa.table(columns), tmp)
+        # Parts appear atomically, so a crash never leaves a truncated one behind
+        os.replace(tmp, os.path.join(self.path, f'part-{self.parts:05d}.parquet'))
+        self.parts += 1
+
+
+# -- analysis --------------------------------------------------------------------
+
+_registry = None
+
+
+def _init_worker():
+    global _registry
+    import logging
+    from services.registry import ServiceRegistry
+    logging.getLogger().setLevel(logging.WARNING)
+    _registry = ServiceRegistry()
+
+
+def analyze_one(task):
+    """Full analysis of one triple (runs in a pool worker)"""
+    index, (competitor, company, domain) = task
+    if _registry is None:
+        _init_worker()
+    started = time.perf_counter()
+    record = {'id': index, 'competitor': competitor, 'company': company, 'domain': domain}
+    try:
+        market_data = _registry.data_fetcher.fetch_market_data(competitor, company, domain)
+        analysis = _registry.analyzer.analyze_competitor(competitor, company, domain, market_data=market_data)
+        analysis['market_data'] = market_data
+        record.update(status='ok', is_fallback=bool(analysis.get('is_fallback')), analysis=analysis)
+    except Exception as e:
+        record.update(status='error', error=f'{type(e).__name__}: {e}')
+    record['seconds'] = round(time.perf_counter() - started, 4)
+    return record
+
+
+def analyze_offline(tasks, chunk_size):
+    """Deterministic basic analyses, a vectorized chunk at a time"""
+    from services.baseline_batch import batch_basic_analysis
+    from services.data_fetcher import DataFetcher
+    from services.registry import ServiceRegistry
+    # Local providers only; nothing has been scraped, so there is no measured sentiment
+    fetcher = DataFetcher(market_data_providers=ServiceRegistry().market_data_providers)
+    for start in range(0, len(tasks), chunk_size):
+        chunk = tasks[start:start + chunk_size]
+        started = time.perf_counter()
+        analyses = batch_basic_analysis([triple for _, triple in chunk])
+        for (_, triple), analysis in zip(chunk, analyses):
+            analysis['market_data'] = fetcher.fetch_market_data(*triple)
+        seconds = round((time.perf_counter() - started) / max(len(chunk), 1), 6)
+        yield [
+            {'id': index, 'competitor': c, 'company': y, 'domain': d, 'status': 'ok',
+             'is_fallback': True, 'analysis': analysis, 'seconds': seconds}
+            for (index, (c, y, d)), analysis in zip(chunk, analyses)
+        ]
+
+
+def analyze_parallel(tasks, workers, mode, rate):
+    """Yield records as they complete, keeping at most ``2 x workers`` tasks in flight"""
+    bucket = TokenBucket(rate) if rate else None
+    pool = (ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) if mode == 'process'
+            else ThreadPoolExecutor(max_workers=workers, initializer=_init_worker))
+    pending = set()
+    with pool:
+        for task in tasks:
+            while len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                yield [future.result() for future in done]
+            while bucket is not None and not bucket.take():
+                time.sleep(0.05)
+            pending.add(pool.submit(analyze_one, task))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            yield [future.result() for future in done]
+
+
+# -- driver ----------------------------------------------------------------------
+
+class Progress:
+    def __init__(self, total, every):
+        self.total = total
+        self.every = every
+        self.started = self.last = time.perf_counter()
+        self.counts = {'ok': 0, 'fallback': 0, 'error': 0}
+        self.latencies = []
+
+    def add(self, records):
+        for record in records:
+            if record['status'] == 'error':
+                self.counts['error'] += 1
+            else:
+                self.counts['fallback' if record.get('is_fallback') else 'ok'] += 1
+            self.latencies.append(record['seconds'])
+        now = time.perf_counter()
+        if now - self.last >= self.every:
+            self.last = now
+            self.report(final=False)
+
+    def report(self, final):
+        done = sum(self.counts.values())
+        elapsed = time.perf_counter() - self.started
+        rate = done / elapsed if elapsed else 0.0
+        line = (f"{done}/{self.total} done in {elapsed:.1f}s ({rate:,.1f}/s) "
+                f"ok={self.counts['ok']} fallback={self.counts['fallback']} error={self.counts['error']}")
+        if not final and rate:
+            line += f" eta {(self.total - done) / rate:.0f}s"
+        if final and self.latencies:
+            latencies = sorted(self.latencies)
+            p50 = latencies[len(latencies) // 2]
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            line += f" latency p50={p50 * 1000:.1f}ms p95={p95 * 1000:.1f}ms"
+        print(line, file=sys.stderr, flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('input', help='CSV or JSONL file of triples')
+    parser.add_argument('output', help='.jsonl file or .parquet directory')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--mode', choices=('thread', 'process'), default='thread')
+    parser.add_argument('--rate', type=float, default=0, help='max analyses started per minute (0 = unlimited)')
+    parser.add_argument('--offline', action='store_true', help='deterministic basic analyses only, no network')
+    parser.add_argument('--batch', type=int, default=100, help='records per output write (checkpoint interval)')
+    parser.add_argument('--progress', type=float, default=5.0, help='seconds between progress lines')
+    args = parser.parse_args()
+
+    triples = read_triples(args.input)
+    writer = ParquetWriter(args.output) if args.output.endswith('.parquet') else JsonLinesWriter(args.output)
+    done = writer.completed()
+    tasks = [(i, triple) for i, triple in enumerate(triples) if i not in done]
+    if done:
+        print(f"resuming: {len(done)} of {len(triples)} already done", file=sys.stderr)
+
+    progress = Progress(len(tasks), args.progress)
+    results = (analyze_offline(tasks, args.batch) if args.offline
+               else analyze_parallel(tasks, args.workers, args.mode, args.rate))
+    buffer = []
+    for records in results:
+        buffer.extend(records)
+        progress.add(records)
+        if len(buffer) >= args.batch:
+            writer.write(buffer)
+            buffer = []
+    if buffer:
+        writer.write(buffer)
+    progress.report(final=True)
+
+
+if __name__ == '__main__':
+    main()
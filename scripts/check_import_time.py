@@ -0,0 +1,61 @@
+"""Check that importing the app stays within a cold-start budget.
+
+Runs ``import app`` in a fresh interpreter, reports the wall time and fails
+(exit code 1) if it exceeds the budget or if heavy client libraries that
+should be deferred until first use were imported.
+
+    python scripts/check_import_time.py --budget 1.5
+"""
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+
+# Modules that must not be imported before the first request needs them
+DEFERRED_MODULES = ('openai', 'requests', 'bs4', 'reportlab')
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    'seconds': elapsed,
+    'loaded': [m for m in %r if m in sys.modules],
+}))
+""" % (DEFERRED_MODULES,)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--budget', type=float, default=1.0, help='maximum import time in seconds')
+    parser.add_argument('--runs', type=int, default=3, help='take the best of N fresh imports')
+    args = parser.parse_args()
+
+    results = []
+    for _ in range(args.runs):
+        out = subprocess.run(
+            [sys.executable, '-c', PROBE],
+            cwd=PROJECT_ROOT, capture_output=True, text=True, check=True
+        ).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+
+    best = min(r['seconds'] for r in results)
+    loaded = sorted({m for r in results for m in r['loaded']})
+    print(f"import app: {best * 1000:.1f} ms (budget {args.budget * 1000:.0f} ms)")
+
+    failed = False
+    if best > args.budget:
+        print('FAIL: import time over budget')
+        failed = True
+    if loaded:
+        print(f"FAIL: deferred modules imported at startup: {', '.join(loaded)}")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Check that search results survive re-scrapes and removals.
+
+Indexes a set of pages, re-scrapes and removes some of them (leaving
+tombstones), and compares every query against an index built fresh from the
+live pages only: the same URLs must match with the same scores. Exits with
+status 1 on the first mismatch.
+
+    python scripts/check_search_index.py --pages 300 --rounds 5
+"""
+import argparse
+import random
+import sys
+from pathlib import Path
+
+# ensure project root is on sys.path so local packages (services, utils) import correctly
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from services.search_index import SearchIndex
+
+WORDS = ('pricing plans enterprise usage based billing free trial analytics dashboard integrations '
+         'security compliance support onboarding api mobile team collaboration reports').split()
+QUERIES = ('pricing', 'enterprise pricing', '"usage based pricing"', 'free trial', 'api security', 'missing')
+
+
+def random_page(rnd, url):
+    return {
+        'url': url,
+        'title': ' '.join(rnd.sample(WORDS, 3)),
+        'description': ' '.join(rnd.choices(WORDS, k=12)),
+        'content': ' '.join(rnd.choices(WORDS + ['usage based pricing'], k=rnd.randint(20, 200))),
+    }
+
+
+def results(index, query):
+    found = index.search(query, limit=10 ** 6)
+    return found['total'], {r['url']: r['score'] for r in found['results']}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=300)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    urls = [f'https://example{i}.com/pricing' for i in range(args.pages)]
+    # Never rebuild, so every query runs against tombstoned postings
+    index = SearchIndex(max_deleted_ratio=10 ** 6)
+    live = {}
+    for url in urls:
+        live[url] = random_page(rnd, url)
+        index.add_page(live[url])
+
+    for round_ in range(args.rounds):
+        for url in rnd.sample(urls, len(urls) // 2):
+            live[url] = random_page(rnd, url)
+            index.add_page(live[url])
+        for url in rnd.sample(sorted(live), len(live) // 20):
+            index.remove_page(url)
+            del live[url]
+
+        fresh = SearchIndex()
+        for page in live.values():
+            fresh.add_page(page)
+        for query in QUERIES:
+            expected, actual = results(fresh, query), results(index, query)
+            if expected[0] != actual[0] or expected[1].keys() != actual[1].keys() or any(
+                    abs(expected[1][url] - actual[1][url]) > 1e-3 for url in expected[1]):
+                print(f"MISMATCH in round {round_} for {query!r}: "
+                      f"{actual[0]} results, expected {expected[0]}")
+                sys.exit(1)
+        print(f"round {round_}: {len(index)} live, {index.stats()['tombstones']} tombstones, "
+              f"{len(QUERIES)} queries identical")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""Train the hashed linear sentiment model from labelled text.
+
+Reads a CSV with ``text`` and ``label`` (negative, neutral or positive)
+columns, holds out a share of the rows for evaluation and writes the model
+used via ``SENTIMENT_MODEL``.
+
+    python scripts/train_sentiment.py reviews.csv sentiment.npz --epochs 30
+"""
+import argparse
+import csv
+import random
+import sys
+import time
+from pathlib import Path
+
+# ensure project root is on sys.path so local packages (services, utils) import correctly
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from services.sentiment import LABELS, SentimentScorer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('source')
+    parser.add_argument('output')
+    parser.add_argument('--epochs', type=int, default=30)
+    parser.add_argument('--lr', type=float, default=0.5)
+    parser.add_argument('--holdout', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with open(args.source, newline='', encoding='utf-8') as fh:
+        rows = [(row['text'], row['label'].strip().lower()) for row in csv.DictReader(fh)
+                if row.get('text') and row.get('label', '').strip().lower() in LABELS]
+    random.Random(args.seed).shuffle(rows)
+    split = int(len(rows) * (1 - args.holdout))
+    train, test = rows[:split], rows[split:]
+
+    started = time.perf_counter()
+    scorer = SentimentScorer().fit([t for t, _ in train], [l for _, l in train], epochs=args.epochs, lr=args.lr)
+    print(f"trained on {len(train)} rows in {time.perf_counter() - started:.1f}s")
+
+    if test:
+        started = time.perf_counter()
+        predicted, _ = scorer.score_batch([t for t, _ in test])
+        elapsed = time.perf_counter() - started
+        accuracy = sum(LABELS[p] == l for p, (_, l) in zip(predicted, test)) / len(test)
+        print(f"holdout accuracy {accuracy:.3f} on {len(test)} rows ({len(test) / elapsed:,.0f} docs/s)")
+
+    scorer.save(args.output)
+    print(f"wrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
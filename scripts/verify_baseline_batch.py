@@ -0,0 +1,69 @@
+"""Check that the vectorized baseline generator matches the scalar one exactly.
+
+Generates random (competitor, company, domain) triples, including unicode and
+empty strings, and compares ``batch_basic_analysis`` output with
+``CompetitorAnalyzer._get_basic_analysis`` field by field (values and types).
+Exits with status 1 on the first mismatch.
+
+    python scripts/verify_baseline_batch.py --count 100000
+"""
+import argparse
+import json
+import random
+import string
+import sys
+import time
+from pathlib import Path
+
+# ensure project root is on sys.path so local packages (services, utils) import correctly
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from services.competitor_analysis import CompetitorAnalyzer
+from services.baseline_batch import batch_basic_analysis
+
+ALPHABET = string.ascii_letters + string.digits + ' -_&.' + 'éüß東京'
+
+
+def random_name(rnd):
+    return ''.join(rnd.choice(ALPHABET) for _ in range(rnd.randint(0, 24)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    triples = [('Samsung', 'Lenovo', 'Laptops'), ('Apple', 'Samsung', 'Mobiles'), ('', '', '')]
+    triples += [(random_name(rnd), random_name(rnd), random_name(rnd)) for _ in range(args.count)]
+
+    analyzer = CompetitorAnalyzer()
+    start = time.perf_counter()
+    scalar = [analyzer._get_basic_analysis(*t) for t in triples]
+    scalar_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = batch_basic_analysis(triples)
+    batch_seconds = time.perf_counter() - start
+
+    for triple, expected, actual in zip(triples, scalar, batch):
+        # JSON encoding compares values and int/float/str types exactly
+        if json.dumps(expected, sort_keys=True) != json.dumps(actual, sort_keys=True):
+            print(f"MISMATCH for {triple!r}")
+            print(' scalar:', json.dumps(expected, sort_keys=True))
+            print(' batch: ', json.dumps(actual, sort_keys=True))
+            sys.exit(1)
+
+    start = time.perf_counter()
+    batch_basic_analysis(triples, columnar=True)
+    columnar_seconds = time.perf_counter() - start
+
+    print(f"{len(triples)} triples identical")
+    print(f"scalar {scalar_seconds:.3f}s, batch dicts {batch_seconds:.3f}s, batch columnar {columnar_seconds:.3f}s")
+
+
+if __name__ == '__main__':
+    main()
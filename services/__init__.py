@@ -4,5 +4,6 @@ Services package initialization
 from .openai_service import OpenAIService
 from .competitor_analysis import CompetitorAnalyzer
 from .data_fetcher import DataFetcher
+from .registry import ServiceRegistry
 
-__all__ = ["OpenAIService", "CompetitorAnalyzer", "DataFetcher"]
+__all__ = ["OpenAIService", "CompetitorAnalyzer", "DataFetcher", "ServiceRegistry"]
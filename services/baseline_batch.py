@@ -0,0 +1,89 @@
+"""
+Vectorized batch version of ``CompetitorAnalyzer._get_basic_analysis``.
+
+Produces the same deterministic market share, revenue series and product
+comparison scores for many (competitor, company, domain) triples at once.
+Only the MD5 seeding runs per triple; every derived number is computed with
+NumPy array operations over the whole batch.
+"""
+import hashlib
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from .competitor_analysis import build_basic_analysis
+
+# Per-column (offset, shift, modulus) of the product comparison scores
+_COMP_SCORE_TERMS = np.array([(7, 2, 4), (6, 4, 4), (7, 6, 4), (6, 8, 4), (7, 10, 4)], dtype=np.int64)
+_YOUR_SCORE_TERMS = np.array([(6, 3, 4), (7, 5, 4), (6, 7, 4), (7, 9, 4), (6, 11, 4)], dtype=np.int64)
+
+_STEPS = np.arange(5, dtype=np.int64)
+_COMP_SERIES_SHIFTS = _STEPS % 7
+_YOUR_SERIES_SHIFTS = (_STEPS + 2) % 11
+
+
+def batch_seeds(triples: Sequence[Tuple[str, str, str]]) -> np.ndarray:
+    """MD5-derived seeds, identical to the scalar version's ``seed``"""
+    return np.fromiter(
+        (int(hashlib.md5(f"{c}|{y}|{d}".encode('utf-8')).hexdigest()[:8], 16) for c, y, d in triples),
+        dtype=np.int64, count=len(triples)
+    )
+
+
+def _scores(seeds: np.ndarray, terms: np.ndarray) -> np.ndarray:
+    return terms[:, 0] + ((seeds[:, None] >> terms[:, 1]) % terms[:, 2])
+
+
+def batch_basic_numbers(seeds: np.ndarray) -> Dict[str, np.ndarray]:
+    """All numeric fields of the basic analysis for a batch of seeds"""
+    seeds = np.asarray(seeds, dtype=np.int64)
+    comp_share = 30 + seeds % 21
+    your_share = 20 + (seeds >> 5) % 21
+    others = np.maximum(0, 100 - (comp_share + your_share))
+
+    base_c = 80 + seeds % 50
+    base_y = 70 + (seeds >> 3) % 50
+    comp_series = base_c[:, None] + _STEPS * ((seeds[:, None] >> _COMP_SERIES_SHIFTS) % 12)
+    your_series = base_y[:, None] + _STEPS * ((seeds[:, None] >> _YOUR_SERIES_SHIFTS) % 11)
+
+    return {
+        'comp_share': comp_share,
+        'your_share': your_share,
+        'others': others,
+        'comp_series': comp_series,
+        'your_series': your_series,
+        'comp_scores': _scores(seeds, _COMP_SCORE_TERMS),
+        'your_scores': _scores(seeds, _YOUR_SCORE_TERMS),
+    }
+
+
+def batch_basic_analysis(triples: Iterable[Tuple[str, str, str]], columnar: bool = False):
+    """Basic analyses for many (competitor, company, domain) triples.
+
+    Returns a list of dicts shaped exactly like ``_get_basic_analysis`` output,
+    or with ``columnar=True`` a table of NumPy columns: ``competitor``,
+    ``company`` and ``domain`` string arrays plus the arrays from
+    ``batch_basic_numbers`` (series and scores are ``N x 5``).
+    """
+    triples = [tuple(t) for t in triples]
+    numbers = batch_basic_numbers(batch_seeds(triples))
+    if columnar:
+        table = {
+            'competitor': np.array([t[0] for t in triples], dtype=object),
+            'company': np.array([t[1] for t in triples], dtype=object),
+            'domain': np.array([t[2] for t in triples], dtype=object),
+        }
+        table.update(numbers)
+        return table
+
+    # Convert to Python ints once per column rather than per element
+    columns = {name: values.tolist() for name, values in numbers.items()}
+    results: List[Dict] = []
+    for i, (competitor, company, domain) in enumerate(triples):
+        results.append(build_basic_analysis(
+            competitor, company, domain,
+            columns['comp_share'][i], columns['your_share'][i], columns['others'][i],
+            columns['comp_series'][i], columns['your_series'][i],
+            columns['comp_scores'][i], columns['your_scores'][i]
+        ))
+    return results
@@ -1,13 +1,168 @@
 ﻿import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from .openai_service import OpenAIService
+from utils.helpers import content_hash
+from utils.metrics import ANALYSIS_RESULTS, STAGE_LATENCY
+from utils.serialization import dumps
+from utils.tracing import span, propagate
+
+# Sections generated by separate prompts. Each lists the input fields it
+# depends on (dotted paths into the analysis inputs); a section is only
+# re-prompted when the digest of those fields changes.
+SECTIONS = {
+    'company_overview': {
+        'inputs': ('competitor', 'domain', 'website.title', 'website.description', 'website.meta_data'),
+        'instructions': 'an object with name, industry and target_audience',
+        'max_tokens': 300,
+    },
+    'market_analysis': {
+        'inputs': ('competitor', 'your_company', 'domain', 'market_data.market_size',
+                   'market_data.growth_rate', 'market_data.market_shares', 'market_data.sources'),
+        'instructions': ('an object with market_share (company name to a "NN%" string) and revenue_trends '
+                         '(Chart.js labels for 2020-2024 and one dataset per company)'),
+        'max_tokens': 500,
+    },
+    'visualization_data': {
+        'inputs': ('competitor', 'your_company', 'domain', 'market_data.market_shares', 'market_data.sources',
+                   'website.technologies', 'website.navigation'),
+        'instructions': ('an object with market_share_data (labels, values) and product_comparison '
+                         '(categories Innovation, Price, Quality, Market Share, Brand Value and one dataset '
+                         'of 1-10 scores per company)'),
+        'max_tokens': 500,
+    },
+    'swot_analysis': {
+        'inputs': ('competitor', 'your_company', 'domain', 'website.content', 'website.navigation',
+                   'market_data.sentiment_analysis', 'market_data.trend_indicators', 'market_data.sources'),
+        'instructions': 'an object with strengths, weaknesses, opportunities and threats, each a list of short strings',
+        'max_tokens': 600,
+    },
+}
+
+
+def section_inputs(paths, inputs):
+    """Pick the dotted ``paths`` out of the analysis inputs"""
+    values = {}
+    for path in paths:
+        value = inputs
+        for part in path.split('.'):
+            value = value.get(part) if isinstance(value, dict) else None
+        values[path] = value
+    return values
+
 
 class CompetitorAnalyzer:
-    def __init__(self):
-        self.openai_service = OpenAIService()
+    def __init__(self, openai_service=None, snapshot_store=None, section_cache=None):
+        self.openai_service = openai_service or OpenAIService()
+        # Optional SnapshotStore; enables reusing AI results for unchanged pages
+        self.snapshot_store = snapshot_store
+        # Optional BoundedCache of generated sections; enables section-level analysis
+        self.section_cache = section_cache
 
-    def analyze_competitor(self, competitor_company, your_company, product_domain):
+    def analyze_competitor(self, competitor_company, your_company, product_domain, website_data=None,
+                           market_data=None):
         """Main method to analyze competitor company"""
+        with span('analyzer.analyze_competitor', competitor=competitor_company, domain=product_domain), \
+                STAGE_LATENCY.time(stage='analysis'):
+            analysis = self._analyze_competitor(competitor_company, your_company, product_domain,
+                                                website_data, market_data)
+        if isinstance(analysis, dict) and analysis.get('snapshot', {}).get('reused'):
+            result = 'reused'
+        elif isinstance(analysis, dict) and analysis.get('is_fallback') is False:
+            result = 'ai'
+        else:
+            result = 'fallback'
+        ANALYSIS_RESULTS.inc(result=result)
+        return analysis
+
+    def _analyze_competitor(self, competitor_company, your_company, product_domain, website_data=None,
+                            market_data=None):
+        snapshot = self._record_snapshot(website_data)
+        result_key = f"{competitor_company}|{your_company}|{product_domain}|{content_hash(market_data or {})[:16]}"
+        if snapshot is not None and not snapshot['changed']:
+            previous = self.snapshot_store.reusable_result(result_key, [snapshot['id']])
+            if previous is not None:
+                logging.info(f"No material change on {snapshot['url']}, reusing analysis from {previous['ts']}")
+                analysis = previous['result']
+                analysis['snapshot'] = {'id': snapshot['id'], 'changed': False, 'reused': True,
+                                        'analyzed_at': previous['ts']}
+                return analysis
+
+        if self.section_cache is not None:
+            analysis = self._analyze_sections(competitor_company, your_company, product_domain,
+                                              website_data, market_data)
+        else:
+            analysis = self._run_analysis(competitor_company, your_company, product_domain)
+        if snapshot is not None and isinstance(analysis, dict):
+            analysis['snapshot'] = {'id': snapshot['id'], 'changed': snapshot['changed'], 'reused': False,
+                                    'diff': snapshot['diff']}
+            if analysis.get('is_fallback') is False:
+                try:
+                    self.snapshot_store.remember_result(result_key, [snapshot['id']], analysis)
+                except OSError as e:
+                    logging.warning(f"Could not remember analysis for reuse: {str(e)}")
+        return analysis
+
+    def _record_snapshot(self, website_data):
+        if self.snapshot_store is None or not isinstance(website_data, dict) or not website_data.get('url'):
+            return None
+        try:
+            with span('analyzer.snapshot'):
+                return self.snapshot_store.record(website_data['url'], website_data)
+        except Exception as e:
+            logging.warning(f"Snapshot failed for {website_data.get('url')}: {str(e)}")
+            return None
+
+    def _analyze_sections(self, competitor_company, your_company, product_domain, website_data=None,
+                          market_data=None):
+        """Assemble the analysis section by section, re-prompting only sections whose inputs changed"""
+        basic_analysis = self._get_basic_analysis(competitor_company, your_company, product_domain)
+        inputs = {
+            'competitor': competitor_company,
+            'your_company': your_company,
+            'domain': product_domain,
+            'website': website_data or {},
+            'market_data': market_data or {},
+        }
+        pair = f"{competitor_company}|{your_company}|{product_domain}"
+
+        analysis, status, pending = {}, {}, {}
+        for name, spec in SECTIONS.items():
+            values = section_inputs(spec['inputs'], inputs)
+            cache_key = (pair, name, content_hash(values))
+            cached = self.section_cache.get(cache_key)
+            if cached is not None:
+                analysis[name] = json.loads(cached)
+                status[name] = 'cached'
+            else:
+                pending[name] = (cache_key, values)
+
+        if pending:
+            with ThreadPoolExecutor(max_workers=len(pending), thread_name_prefix='section') as pool:
+                futures = {
+                    name: pool.submit(
+                        propagate(self.openai_service.analyze_section), name,
+                        competitor_company, your_company, product_domain,
+                        SECTIONS[name]['instructions'], values, SECTIONS[name]['max_tokens']
+                    )
+                    for name, (_, values) in pending.items()
+                }
+                for name, future in futures.items():
+                    try:
+                        analysis[name] = future.result()
+                        self.section_cache.set(pending[name][0], dumps(analysis[name]))
+                        status[name] = 'generated'
+                    except Exception as e:
+                        logging.warning(f"Section {name} failed: {str(e)}, using fallback data")
+                        analysis[name] = basic_analysis[name]
+                        status[name] = 'fallback'
+
+        analysis = {name: analysis[name] for name in SECTIONS}
+        analysis['sections'] = status
+        analysis['is_fallback'] = all(value == 'fallback' for value in status.values())
+        return analysis
+
+    def _run_analysis(self, competitor_company, your_company, product_domain):
         try:
             # Get basic analysis first as fallback
             basic_analysis = self._get_basic_analysis(competitor_company, your_company, product_domain)
@@ -65,80 +220,92 @@ class CompetitorAnalyzer:
         comp_series = [base_c + int((i * ((seed >> (i % 7)) % 12))) for i in range(5)]
         your_series = [base_y + int((i * ((seed >> ((i+2) % 11)) % 11))) for i in range(5)]
 
-        return {
-            "company_overview": {
-                "name": competitor_company,
-                "industry": product_domain,
-                "target_audience": "General audience"
-            },
-            "market_analysis": {
-                "market_share": {
-                    competitor_company: f"{comp_share}%",
-                    your_company: f"{your_share}%",
-                    "others": f"{others}%"
-                },
-                "revenue_trends": {
-                    "labels": ["2020", "2021", "2022", "2023", "2024"],
-                    "datasets": [
-                        {
-                            "label": competitor_company,
-                            "data": comp_series
-                        },
-                        {
-                            "label": your_company,
-                            "data": your_series
-                        }
-                    ]
-                }
-            },
-            "visualization_data": {
-                "market_share_data": {
-                    "labels": [competitor_company, your_company, "Others"],
-                    "values": [comp_share, your_share, others]
-                },
-                "product_comparison": {
-                    "categories": ["Innovation", "Price", "Quality", "Market Share", "Brand Value"],
-                    "datasets": [
-                        {
-                            "label": competitor_company,
-                            "data": [
-                                7 + ((seed >> 2) % 4),
-                                6 + ((seed >> 4) % 4),
-                                7 + ((seed >> 6) % 4),
-                                6 + ((seed >> 8) % 4),
-                                7 + ((seed >> 10) % 4)
-                            ]
-                        },
-                        {
-                            "label": your_company,
-                            "data": [
-                                6 + ((seed >> 3) % 4),
-                                7 + ((seed >> 5) % 4),
-                                6 + ((seed >> 7) % 4),
-                                7 + ((seed >> 9) % 4),
-                                6 + ((seed >> 11) % 4)
-                            ]
-                        }
-                    ]
-                }
+        comp_scores = [
+            7 + ((seed >> 2) % 4),
+            6 + ((seed >> 4) % 4),
+            7 + ((seed >> 6) % 4),
+            6 + ((seed >> 8) % 4),
+            7 + ((seed >> 10) % 4)
+        ]
+        your_scores = [
+            6 + ((seed >> 3) % 4),
+            7 + ((seed >> 5) % 4),
+            6 + ((seed >> 7) % 4),
+            7 + ((seed >> 9) % 4),
+            6 + ((seed >> 11) % 4)
+        ]
+
+        return build_basic_analysis(
+            competitor_company, your_company, product_domain,
+            comp_share, your_share, others, comp_series, your_series, comp_scores, your_scores
+        )
+
+
+def build_basic_analysis(competitor_company, your_company, product_domain,
+                         comp_share, your_share, others, comp_series, your_series, comp_scores, your_scores):
+    """Assemble the fallback analysis dict from its deterministic numbers"""
+    return {
+        "company_overview": {
+            "name": competitor_company,
+            "industry": product_domain,
+            "target_audience": "General audience"
+        },
+        "market_analysis": {
+            "market_share": {
+                competitor_company: f"{comp_share}%",
+                your_company: f"{your_share}%",
+                "others": f"{others}%"
             },
-            "swot_analysis": {
-                "strengths": [
-                    f"Strong market presence in {product_domain}",
-                    "Clear brand messaging"
-                ],
-                "weaknesses": [
-                    "Limited data available",
-                    "Need deeper market research"
-                ],
-                "opportunities": [
-                    "Market expansion",
-                    "Product innovation"
-                ],
-                "threats": [
-                    "Market competition",
-                    "Technology changes"
+            "revenue_trends": {
+                "labels": ["2020", "2021", "2022", "2023", "2024"],
+                "datasets": [
+                    {
+                        "label": competitor_company,
+                        "data": comp_series
+                    },
+                    {
+                        "label": your_company,
+                        "data": your_series
+                    }
                 ]
+            }
+        },
+        "visualization_data": {
+            "market_share_data": {
+                "labels": [competitor_company, your_company, "Others"],
+                "values": [comp_share, your_share, others]
             },
-            "is_fallback": True
-        }
+            "product_comparison": {
+                "categories": ["Innovation", "Price", "Quality", "Market Share", "Brand Value"],
+                "datasets": [
+                    {
+                        "label": competitor_company,
+                        "data": comp_scores
+                    },
+                    {
+                        "label": your_company,
+                        "data": your_scores
+                    }
+                ]
+            }
+        },
+        "swot_analysis": {
+            "strengths": [
+                f"Strong market presence in {product_domain}",
+                "Clear brand messaging"
+            ],
+            "weaknesses": [
+                "Limited data available",
+                "Need deeper market research"
+            ],
+            "opportunities": [
+                "Market expansion",
+                "Product innovation"
+            ],
+            "threats": [
+                "Market competition",
+                "Technology changes"
+            ]
+        },
+        "is_fallback": True
+    }
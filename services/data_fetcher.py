@@ -1,78 +1,60 @@
-import requests
-from bs4 import BeautifulSoup
 import logging
 from urllib.parse import urljoin, urlparse
 import time
+from utils.metrics import SCRAPE_ERRORS, STAGE_LATENCY
+from utils.tracing import span
 
 
 class DataFetcher:
-    def __init__(self):
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        })
-        
+    def __init__(self, search_index=None, similarity=None, market_data_providers=None, sentiment=None):
+        # requests/bs4 are imported on first scrape to keep cold starts cheap
+        self._session = None
+        # Optional SearchIndex / SimilarityEngine / SentimentProvider updated with every scraped page
+        self.search_index = search_index
+        self.similarity = similarity
+        self.sentiment = sentiment
+        # Market-data providers asked in order; the first to supply a field wins
+        self.market_data_providers = market_data_providers
+
+    @property
+    def session(self):
+        if self._session is None:
+            import requests
+            self._session = requests.Session()
+            self._session.headers.update({
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+            })
+        return self._session
+
     def fetch_market_data(self, competitor: str, company: str, domain: str) -> dict:
         """
         Fetch real-time market data and competitive intelligence
         """
-        try:
-            # Simulated market data (replace with actual API calls in production)
-            market_data = {
-                "market_size": {
-                    "value": 500000000000,
-                    "currency": "USD",
-                    "year": 2025
-                },
-                "growth_rate": {
-                    "value": 12.5,
-                    "period": "annual"
-                },
-                "market_shares": {
-                    competitor: 35,
-                    company: 28,
-                    "others": 37
-                },
-                "customer_segments": [
-                    {"name": "Enterprise", "share": 45},
-                    {"name": "Consumer", "share": 35},
-                    {"name": "SMB", "share": 20}
-                ],
-                "regional_distribution": {
-                    "North America": 35,
-                    "Europe": 25,
-                    "Asia Pacific": 30,
-                    "Rest of World": 10
-                },
-                "sentiment_analysis": {
-                    competitor: {
-                        "positive": 75,
-                        "neutral": 15,
-                        "negative": 10,
-                        "mentions": 23000
-                    },
-                    company: {
-                        "positive": 70,
-                        "neutral": 20,
-                        "negative": 10,
-                        "mentions": 19000
-                    }
-                },
-                "trend_indicators": {
-                    "market_growth": "positive",
-                    "consumer_sentiment": "stable",
-                    "innovation_pace": "accelerating",
-                    "competitive_intensity": "high"
-                }
-            }
-            
-            return market_data
-        except Exception as e:
-            logging.error(f"Error fetching market data: {str(e)}")
-            return {}
+        with span('data_fetcher.fetch_market_data', competitor=competitor), STAGE_LATENCY.time(stage='market_data'):
+            return self._fetch_market_data(competitor, company, domain)
+
+    def _fetch_market_data(self, competitor: str, company: str, domain: str) -> dict:
+        from services.market_data import StaticMarketDataProvider, merge_market_data
+
+        if self.market_data_providers is None:
+            self.market_data_providers = [StaticMarketDataProvider()]
+        market_data = {}
+        for provider in self.market_data_providers:
+            try:
+                merge_market_data(market_data, provider.fetch(competitor, company, domain), provider.name)
+            except Exception as e:
+                logging.error(f"Error fetching market data from {provider.name}: {str(e)}")
+        return market_data
+
+    def fetch_website_data(self, url, domain=None, company=None):
+        """Fetch and parse website data; ``domain`` tags the site for clustering and
+        ``company`` attributes its sentiment"""
+        with span('data_fetcher.fetch_website_data', url=url), STAGE_LATENCY.time(stage='scrape'):
+            return self._fetch_website_data(url, domain, company)
+
+    def _fetch_website_data(self, url, domain=None, company=None):
+        import requests
 
-    def fetch_website_data(self, url):
-        """Fetch and parse website data"""
         try:
             # Ensure URL has protocol
             if not url.startswith(('http://', 'https://')):
@@ -82,30 +64,56 @@ class DataFetcher:
             response = self.session.get(url, timeout=10, allow_redirects=True)
             response.raise_for_status()
 
-            soup = BeautifulSoup(response.content, 'html.parser')
-
-            # Extract relevant data
-            data = {
-                'url': url,
-                'title': self._get_title(soup),
-                'description': self._get_description(soup),
-                'content': self._get_main_content(soup),
-                'navigation': self._get_navigation(soup),
-                'contact_info': self._get_contact_info(soup),
-                'social_links': self._get_social_links(soup),
-                'technologies': self._detect_technologies(soup, response.headers),
-                'meta_data': self._get_meta_data(soup)
-            }
-
-            return data
+            page = self.parse_website(response.content, url, response.headers)
+            self._index_page(page, domain, company)
+            return page
 
         except requests.RequestException as e:
+            SCRAPE_ERRORS.inc(error=type(e).__name__)
             logging.error(f"Error fetching website data: {str(e)}")
             return None
         except Exception as e:
+            SCRAPE_ERRORS.inc(error='parse')
             logging.error(f"Error parsing website data: {str(e)}")
             return None
 
+    def _index_page(self, page, domain=None, company=None):
+        try:
+            if self.search_index is not None:
+                with span('search_index.add_page'):
+                    self.search_index.add_page(page)
+            if self.similarity is not None:
+                with span('similarity.add_page'):
+                    self.similarity.add_page(page, domain=domain)
+            if self.sentiment is not None:
+                with span('sentiment.add_page'), STAGE_LATENCY.time(stage='sentiment'):
+                    self.sentiment.add_page(page, company=company)
+        except Exception as e:
+            logging.warning(f"Could not index {page.get('url')}: {str(e)}")
+
+    def parse_website(self, html, url, headers=None):
+        """Extract the analysis fields from a fetched page"""
+        from bs4 import BeautifulSoup
+
+        soup = BeautifulSoup(html, 'html.parser')
+
+        # Extract relevant data
+        page = {
+            'url': url,
+            'title': self._get_title(soup),
+            'description': self._get_description(soup),
+            'navigation': self._get_navigation(soup),
+            'contact_info': self._get_contact_info(soup),
+            'social_links': self._get_social_links(soup),
+            'technologies': self._detect_technologies(soup, headers or {}),
+            'meta_data': self._get_meta_data(soup),
+            # Reviews may sit in footers, which content extraction strips
+            'reviews': self._get_reviews(soup)
+        }
+        # Content extraction removes scripts, navigation, headers and footers, so it runs last
+        page['content'] = self._get_main_content(soup)
+        return page
+
     def _get_title(self, soup):
         """Extract page title"""
         title_tag = soup.find('title')
@@ -121,6 +129,19 @@ class DataFetcher:
         first_p = soup.find('p')
         return first_p.get_text().strip()[:200] + '...' if first_p else 'No description found'
 
+    def _get_reviews(self, soup):
+        """Extract review and testimonial snippets"""
+        import re
+        reviews = []
+        pattern = re.compile(r'review|testimonial|quote', re.I)
+        candidates = soup.find_all(attrs={'itemprop': 'reviewBody'}) or \
+            soup.find_all(['blockquote', 'div', 'p', 'li'], class_=pattern)
+        for tag in candidates[:50]:
+            text = ' '.join(tag.get_text(' ').split())
+            if 20 <= len(text) <= 1000 and text not in reviews:
+                reviews.append(text)
+        return reviews
+
     def _get_main_content(self, soup):
         """Extract main content from the page"""
         # Remove script and style elements
@@ -0,0 +1,363 @@
+"""
+Append-only columnar history of numeric analysis fields.
+
+Every recorded analysis contributes rows of ``(ts, company, domain, metric,
+value)``. Rows are buffered in memory and flushed as immutable segments, one
+``.npy`` file per column, which are memory-mapped for queries. ``compact``
+merges segments into one sorted by (company, metric, ts) so per-company
+queries become a binary search plus a contiguous slice.
+
+Several worker processes can share one directory: each segment carries the
+dictionary of the names its id columns refer to, every process picks up
+segments written by the others before answering a query, and compaction
+runs under a directory lock. A compacted segment lists the segments it
+replaces, so readers never count rows twice while the old ones are removed.
+"""
+import atexit
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from utils.storage import file_lock
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = {
+    'ts': np.float64,
+    'company': np.int32,
+    'domain': np.int32,
+    'metric': np.int32,
+    'value': np.float64,
+}
+# Dictionary-encoded columns
+KINDS = ('company', 'domain', 'metric')
+
+
+def _to_number(value) -> Optional[float]:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value.strip().rstrip('%').replace(',', ''))
+        except ValueError:
+            return None
+    return None
+
+
+def extract_metrics(analysis: Dict) -> List[Tuple[str, str, float]]:
+    """(company, metric, value) rows for the numeric fields of an analysis"""
+    rows = []
+    visualization = analysis.get('visualization_data') or {}
+    market_analysis = analysis.get('market_analysis') or {}
+
+    share_data = visualization.get('market_share_data') or {}
+    labels, values = share_data.get('labels') or [], share_data.get('values') or []
+    if labels and values:
+        for label, value in zip(labels, values):
+            rows.append((label, 'market_share', _to_number(value)))
+    else:
+        for label, value in (market_analysis.get('market_share') or {}).items():
+            rows.append((label, 'market_share', _to_number(value)))
+
+    for dataset in (market_analysis.get('revenue_trends') or {}).get('datasets') or []:
+        data = dataset.get('data') or []
+        if data:
+            rows.append((dataset.get('label'), 'revenue', _to_number(data[-1])))
+
+    comparison = visualization.get('product_comparison') or {}
+    categories = comparison.get('categories') or []
+    for dataset in comparison.get('datasets') or []:
+        for category, value in zip(categories, dataset.get('data') or []):
+            rows.append((dataset.get('label'), f'product.{category}', _to_number(value)))
+
+    market_data = analysis.get('market_data') or {}
+    sources = market_data.get('sources') or {}
+    for company, scores in (market_data.get('sentiment_analysis') or {}).items():
+        # Illustrative figures are not measurements worth a history
+        if isinstance(scores, dict) and sources.get(f'sentiment_analysis.{company}') != 'static':
+            for key in ('positive', 'neutral', 'negative', 'mentions'):
+                if key in scores:
+                    rows.append((company, f'sentiment.{key}', _to_number(scores[key])))
+
+    subject = (analysis.get('company_overview') or {}).get('name')
+    if subject:
+        for key, items in (analysis.get('swot_analysis') or {}).items():
+            if isinstance(items, list):
+                rows.append((subject, f'swot.{key}_count', float(len(items))))
+
+    return [(str(c), m, v) for c, m, v in rows if c and v is not None]
+
+
+def parse_time(value) -> Optional[float]:
+    """Epoch seconds from an epoch number or an ISO date/datetime string"""
+    if value in (None, ''):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return datetime.fromisoformat(str(value)).timestamp()
+
+
+class HistoryStore:
+    def __init__(self, directory: str, flush_rows: int = 2048, flush_interval: float = 60.0,
+                 max_segments: int = 32):
+        self.directory = directory
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.max_segments = max_segments
+        self._lock = threading.RLock()
+        self._buffer = {name: [] for name in COLUMNS}
+        self._last_flush = time.time()
+        self._segments = []
+        self._ids = {kind: {} for kind in KINDS}
+        self._names = {kind: [] for kind in KINDS}
+        self._load()
+        atexit.register(self.flush)
+
+    # -- dictionary encoding -------------------------------------------------
+
+    def _id(self, kind: str, name: str) -> int:
+        """Process-local id of a name; segments store their own dictionaries"""
+        ids = self._ids[kind]
+        value = ids.get(name)
+        if value is None:
+            value = ids[name] = len(self._names[kind])
+            self._names[kind].append(name)
+        return value
+
+    def _lookup(self, kind: str, names: Optional[Iterable[str]]) -> Optional[np.ndarray]:
+        if names is None:
+            return None
+        return np.array([self._ids[kind][n] for n in names if n in self._ids[kind]], dtype=np.int32)
+
+    # -- persistence -----------------------------------------------------------
+
+    def _load(self) -> None:
+        try:
+            self._refresh()
+        except OSError as e:
+            logger.warning('Could not read analysis history: %s', e)
+
+    def _refresh(self) -> None:
+        """Pick up segments written or compacted by other processes"""
+        try:
+            entries = sorted(e for e in os.listdir(self.directory) if e.startswith('segment-'))
+        except FileNotFoundError:
+            return
+        known = {os.path.basename(s['path']): s for s in self._segments}
+        opened = dict(known)
+        for entry in entries:
+            if entry not in opened:
+                try:
+                    opened[entry] = self._open_segment(os.path.join(self.directory, entry))
+                except (OSError, ValueError) as e:
+                    # Removed by a concurrent compaction, or still incomplete
+                    logger.debug('Skipping history segment %s: %s', entry, e)
+        present = set(entries)
+        replaced = {name for segment in opened.values() for name in segment['replaces']}
+        self._segments = [opened[name] for name in sorted(opened)
+                          if name in present and name not in replaced]
+
+    def _open_segment(self, path: str) -> Dict:
+        segment = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in COLUMNS}
+        with open(os.path.join(path, 'dictionary.json'), encoding='utf-8') as fh:
+            dictionary = json.load(fh)
+        segment['path'] = path
+        segment['sorted'] = os.path.exists(os.path.join(path, 'SORTED'))
+        segment['replaces'] = dictionary.get('replaces', [])
+        # Segment-local id -> name, and name -> segment-local id
+        segment['names'] = {kind: dictionary[kind] for kind in KINDS}
+        segment['ids'] = {kind: {name: i for i, name in enumerate(dictionary[kind])} for kind in KINDS}
+        # Segment-local id -> process-local id
+        segment['remap'] = {kind: np.array([self._id(kind, name) for name in dictionary[kind]], dtype=np.int32)
+                            for kind in KINDS}
+        return segment
+
+    def _write_segment(self, columns: Dict[str, np.ndarray], sorted_rows: bool, replaces: List[str] = ()) -> Dict:
+        """Write rows given in process-local ids, re-encoded against a dictionary of their own"""
+        columns = dict(columns)
+        dictionary = {'replaces': list(replaces)}
+        for kind in KINDS:
+            used, local = np.unique(columns[kind], return_inverse=True)
+            columns[kind] = local.astype(np.int32)
+            dictionary[kind] = [self._names[kind][i] for i in used.tolist()]
+        if sorted_rows:
+            order = np.lexsort((columns['ts'], columns['metric'], columns['company']))
+            columns = {name: values[order] for name, values in columns.items()}
+
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"segment-{int(time.time() * 1e6):020d}-{os.getpid()}"
+        tmp = os.path.join(self.directory, f'.{name}.tmp')
+        os.makedirs(tmp, exist_ok=True)
+        for column, values in columns.items():
+            np.save(os.path.join(tmp, f'{column}.npy'), values)
+        with open(os.path.join(tmp, 'dictionary.json'), 'w', encoding='utf-8') as fh:
+            json.dump(dictionary, fh)
+        if sorted_rows:
+            open(os.path.join(tmp, 'SORTED'), 'w').close()
+        # Map the files before publishing them: another process may compact the segment away at once
+        segment = self._open_segment(tmp)
+        segment['path'] = os.path.join(self.directory, name)
+        os.replace(tmp, segment['path'])
+        return segment
+
+    def _global_columns(self, segment: Dict) -> Dict[str, np.ndarray]:
+        columns = {name: np.asarray(segment[name]) for name in COLUMNS}
+        for kind in KINDS:
+            columns[kind] = segment['remap'][kind][columns[kind]]
+        return columns
+
+    def flush(self) -> None:
+        """Write buffered rows as a new segment"""
+        with self._lock:
+            if not self._buffer['ts']:
+                return
+            columns = {name: np.asarray(values, dtype=dtype) for (name, dtype), values
+                       in zip(COLUMNS.items(), (self._buffer[n] for n in COLUMNS))}
+            try:
+                self._segments.append(self._write_segment(columns, sorted_rows=False))
+            except OSError as e:
+                # Keep the rows in memory (e.g. read-only filesystem) and retry later
+                logger.warning('Could not flush analysis history: %s', e)
+                self._last_flush = time.time()
+                return
+            self._buffer = {name: [] for name in COLUMNS}
+            self._last_flush = time.time()
+            self._refresh()
+            if len(self._segments) > self.max_segments:
+                self.compact()
+
+    def compact(self) -> None:
+        """Merge all segments (of every process) into one sorted by (company, metric, ts)"""
+        with self._lock, file_lock(os.path.join(self.directory, '.lock')):
+            # Another process may have compacted in the meantime
+            self._refresh()
+            if len(self._segments) < 2 and all(s['sorted'] for s in self._segments):
+                return
+            parts = [self._global_columns(s) for s in self._segments]
+            merged = {name: np.concatenate([p[name] for p in parts]) for name in COLUMNS}
+            old = self._segments
+            self._segments = [self._write_segment(
+                merged, sorted_rows=True, replaces=[os.path.basename(s['path']) for s in old])]
+            # Readers that still map the old files keep them until they refresh
+            for segment in old:
+                shutil.rmtree(segment['path'], ignore_errors=True)
+
+    # -- writes --------------------------------------------------------------
+
+    def append(self, rows: Iterable[Tuple[str, str, float]], domain: str = '', ts: float = None) -> int:
+        ts = time.time() if ts is None else ts
+        count = 0
+        with self._lock:
+            domain_id = self._id('domain', domain or '')
+            for company, metric, value in rows:
+                self._buffer['ts'].append(ts)
+                self._buffer['company'].append(self._id('company', company))
+                self._buffer['domain'].append(domain_id)
+                self._buffer['metric'].append(self._id('metric', metric))
+                self._buffer['value'].append(value)
+                count += 1
+            if (len(self._buffer['ts']) >= self.flush_rows
+                    or time.time() - self._last_flush >= self.flush_interval):
+                self.flush()
+        return count
+
+    def record_analysis(self, analysis: Dict, product_domain: str = '', ts: float = None) -> int:
+        """Append the numeric fields of an analysis result"""
+        return self.append(extract_metrics(analysis), domain=product_domain, ts=ts)
+
+    # -- reads ---------------------------------------------------------------
+
+    def _segment_rows(self, segment, company_ids, metric_ids, domain_ids, start, end) -> Dict[str, np.ndarray]:
+        """Matching rows of a segment, with ids translated to process-local ones"""
+        if 'remap' in segment:
+            local = {kind: None if ids is None else np.array(
+                [segment['ids'][kind][self._names[kind][i]] for i in ids.tolist()
+                 if self._names[kind][i] in segment['ids'][kind]], dtype=np.int32)
+                for kind, ids in (('company', company_ids), ('metric', metric_ids), ('domain', domain_ids))}
+            company_ids, metric_ids, domain_ids = local['company'], local['metric'], local['domain']
+
+        if segment['sorted'] and company_ids is not None:
+            # Company-sorted segment: gather contiguous slices per company
+            column = segment['company']
+            slices = [(np.searchsorted(column, cid, 'left'), np.searchsorted(column, cid, 'right'))
+                      for cid in company_ids]
+            picked = {name: np.concatenate([np.asarray(segment[name][a:b]) for a, b in slices])
+                      if slices else np.empty(0, dtype=COLUMNS[name]) for name in COLUMNS}
+        else:
+            picked = {name: np.asarray(segment[name]) for name in COLUMNS}
+            if company_ids is not None:
+                mask = np.isin(picked['company'], company_ids)
+                picked = {name: values[mask] for name, values in picked.items()}
+
+        mask = np.ones(len(picked['ts']), dtype=bool)
+        if metric_ids is not None:
+            mask &= np.isin(picked['metric'], metric_ids)
+        if domain_ids is not None:
+            mask &= np.isin(picked['domain'], domain_ids)
+        if start is not None:
+            mask &= picked['ts'] >= start
+        if end is not None:
+            mask &= picked['ts'] <= end
+        if not mask.all():
+            picked = {name: values[mask] for name, values in picked.items()}
+        if 'remap' in segment:
+            for kind in KINDS:
+                picked[kind] = segment['remap'][kind][picked[kind]]
+        return picked
+
+    def query(self, companies: Optional[Iterable[str]] = None, metrics: Optional[Iterable[str]] = None,
+              domains: Optional[Iterable[str]] = None, start: float = None, end: float = None) -> Dict:
+        """Time series grouped as ``{company: {metric: {'ts': [...], 'values': [...]}}}``"""
+        with self._lock:
+            try:
+                self._refresh()
+            except OSError as e:
+                logger.warning('Could not read analysis history: %s', e)
+            company_ids = self._lookup('company', companies)
+            metric_ids = self._lookup('metric', metrics)
+            domain_ids = self._lookup('domain', domains)
+            sources = list(self._segments)
+            if self._buffer['ts']:
+                sources.append({name: np.asarray(self._buffer[name], dtype=dtype)
+                                for name, dtype in COLUMNS.items()} | {'sorted': False})
+            company_names = list(self._names['company'])
+            metric_names = list(self._names['metric'])
+
+        parts = [self._segment_rows(s, company_ids, metric_ids, domain_ids, start, end) for s in sources]
+        if not parts:
+            return {}
+        rows = {name: np.concatenate([p[name] for p in parts]) for name in COLUMNS}
+        order = np.lexsort((rows['ts'], rows['metric'], rows['company']))
+        rows = {name: values[order] for name, values in rows.items()}
+
+        result = {}
+        if not len(rows['ts']):
+            return result
+        # Split the sorted rows at (company, metric) boundaries
+        keys = rows['company'].astype(np.int64) << 32 | rows['metric'].astype(np.int64)
+        boundaries = np.flatnonzero(np.diff(keys)) + 1
+        for chunk in np.split(np.arange(len(keys)), boundaries):
+            first = chunk[0]
+            company = company_names[rows['company'][first]]
+            metric = metric_names[rows['metric'][first]]
+            result.setdefault(company, {})[metric] = {
+                'ts': rows['ts'][chunk].tolist(),
+                'values': rows['value'][chunk].tolist(),
+            }
+        return result
+
+    def companies(self) -> List[str]:
+        return list(self._names['company'])
+
+    def metrics(self) -> List[str]:
+        return list(self._names['metric'])
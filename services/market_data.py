@@ -0,0 +1,373 @@
+"""
+Market-data providers for ``DataFetcher.fetch_market_data``.
+
+A provider returns a (possibly partial) market-data dict for a competitor /
+company / domain triple; ``DataFetcher`` asks each provider in turn and the
+first one to supply a field wins. ``sources`` in the merged dict records the
+provider of each field (``sentiment_analysis.<company>`` per company), so
+measured figures can be told apart from the illustrative ``static`` ones.
+
+``LocalDatasetProvider`` serves per-company figures from a local CSV (or
+Parquet, when pyarrow is installed) file. The file is converted once into a
+columnar directory, one ``.npy`` file per numeric column plus sorted 64-bit
+key hashes for (company, domain) and company lookups, which is memory-mapped
+so a lookup is a binary search and a handful of array reads. Recently used
+rows are kept in a small LRU.
+
+Recognised dataset columns (all optional apart from ``company``)::
+
+    company, domain, year, market_size, growth_rate, market_share,
+    sentiment_positive, sentiment_neutral, sentiment_negative, mentions,
+    region_<name>, segment_<name>
+
+A row with an empty ``domain`` applies to the company in every domain.
+"""
+import csv
+import hashlib
+import json
+import logging
+import math
+import os
+import shutil
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from utils.metrics import CACHE_EVENTS
+
+logger = logging.getLogger(__name__)
+
+REGION_NAMES = {
+    'north_america': 'North America',
+    'europe': 'Europe',
+    'asia_pacific': 'Asia Pacific',
+    'rest_of_world': 'Rest of World',
+}
+SEGMENT_NAMES = {'smb': 'SMB'}
+
+
+def normalize(name: str) -> str:
+    return ' '.join(str(name or '').lower().split())
+
+
+def key_hash(company: str, domain: str = '') -> int:
+    digest = hashlib.blake2b(f'{normalize(company)}\x1f{normalize(domain)}'.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+def _label(column: str, prefix: str, names: Dict[str, str]) -> str:
+    name = column[len(prefix):]
+    return names.get(name) or name.replace('_', ' ').title()
+
+
+def _number(value: float):
+    return int(value) if float(value).is_integer() else round(float(value), 2)
+
+
+class MarketDataProvider:
+    """Base class: ``fetch`` returns the market-data fields this provider knows"""
+
+    name = 'base'
+
+    def fetch(self, competitor: str, company: str, domain: str) -> Dict:
+        raise NotImplementedError
+
+
+class StaticMarketDataProvider(MarketDataProvider):
+    """Fixed illustrative figures, used when no dataset covers a company"""
+
+    # Fields it supplies are marked with this source, never as measured data
+    name = 'static'
+
+    def fetch(self, competitor: str, company: str, domain: str) -> Dict:
+        # Simulated market data (replace with actual API calls in production)
+        return {
+            "market_size": {
+                "value": 500000000000,
+                "currency": "USD",
+                "year": 2025
+            },
+            "growth_rate": {
+                "value": 12.5,
+                "period": "annual"
+            },
+            "market_shares": {
+                competitor: 35,
+                company: 28,
+                "others": 37
+            },
+            "customer_segments": [
+                {"name": "Enterprise", "share": 45},
+                {"name": "Consumer", "share": 35},
+                {"name": "SMB", "share": 20}
+            ],
+            "regional_distribution": {
+                "North America": 35,
+                "Europe": 25,
+                "Asia Pacific": 30,
+                "Rest of World": 10
+            },
+            "sentiment_analysis": {
+                competitor: {
+                    "positive": 75,
+                    "neutral": 15,
+                    "negative": 10,
+                    "mentions": 23000
+                },
+                company: {
+                    "positive": 70,
+                    "neutral": 20,
+                    "negative": 10,
+                    "mentions": 19000
+                }
+            },
+            "trend_indicators": {
+                "market_growth": "positive",
+                "consumer_sentiment": "stable",
+                "innovation_pace": "accelerating",
+                "competitive_intensity": "high"
+            }
+        }
+
+
+# -- dataset conversion ---------------------------------------------------------
+
+def _read_rows(source: str) -> Iterator[Dict]:
+    if source.lower().endswith('.parquet'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError('Reading Parquet market data requires pyarrow')
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=65536):
+            yield from batch.to_pylist()
+        return
+    with open(source, newline='', encoding='utf-8') as fh:
+        yield from csv.DictReader(fh)
+
+
+def _to_float(value) -> float:
+    if value is None or value == '':
+        return math.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).strip().rstrip('%').replace(',', ''))
+    except ValueError:
+        return math.nan
+
+
+def _sorted_index(keys: array) -> Tuple[np.ndarray, np.ndarray]:
+    """Sorted unique key hashes and the row each maps to (the last one in the file wins)"""
+    hashes = np.frombuffer(keys, dtype=np.uint64)
+    rows = np.arange(len(hashes), dtype=np.int64)
+    # Reverse so np.unique's first occurrence is the last row for each key
+    unique, first = np.unique(hashes[::-1], return_index=True)
+    return unique, rows[::-1][first]
+
+
+def build_dataset(source: str, directory: str) -> Dict:
+    """Convert a CSV/Parquet market dataset into a memory-mappable columnar directory"""
+    columns: Dict[str, array] = {}
+    pair_keys, company_keys = array('Q'), array('Q')
+    rows = 0
+    for row in _read_rows(source):
+        company = row.get('company')
+        if not company:
+            continue
+        pair_keys.append(key_hash(company, row.get('domain') or ''))
+        company_keys.append(key_hash(company))
+        for name, value in row.items():
+            if name in ('company', 'domain') or not name:
+                continue
+            column = columns.get(name)
+            if column is None:
+                column = columns[name] = array('d', [math.nan]) * rows
+            column.append(_to_float(value))
+        rows += 1
+        for column in columns.values():
+            if len(column) < rows:
+                column.append(math.nan)
+    # Drop columns with no numeric values (free-text notes and the like)
+    columns = {name: values for name, values in columns.items()
+               if not np.isnan(np.frombuffer(values, dtype=np.float64)).all()}
+
+    tmp = f'{directory}.tmp-{os.getpid()}'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for name, values in columns.items():
+        np.save(os.path.join(tmp, f'col_{name}.npy'), np.frombuffer(values, dtype=np.float64))
+    for name, keys in (('pair', pair_keys), ('company', company_keys)):
+        unique, index_rows = _sorted_index(keys)
+        np.save(os.path.join(tmp, f'{name}_keys.npy'), unique)
+        np.save(os.path.join(tmp, f'{name}_rows.npy'), index_rows)
+    stat = os.stat(source)
+    meta = {
+        'source': os.path.abspath(source),
+        'source_size': stat.st_size,
+        'source_mtime': stat.st_mtime,
+        'rows': rows,
+        'columns': list(columns),
+    }
+    with open(os.path.join(tmp, 'meta.json'), 'w', encoding='utf-8') as fh:
+        json.dump(meta, fh)
+    shutil.rmtree(directory, ignore_errors=True)
+    try:
+        os.replace(tmp, directory)
+    except OSError:
+        # Another worker converted the same file concurrently; use its copy
+        shutil.rmtree(tmp, ignore_errors=True)
+    logger.info('Converted market dataset %s: %d rows, %d columns', source, rows, len(columns))
+    return meta
+
+
+def _is_current(source: str, directory: str) -> bool:
+    try:
+        with open(os.path.join(directory, 'meta.json'), encoding='utf-8') as fh:
+            meta = json.load(fh)
+        stat = os.stat(source)
+    except (OSError, ValueError):
+        return False
+    return meta.get('source_size') == stat.st_size and meta.get('source_mtime') == stat.st_mtime
+
+
+class LocalDatasetProvider(MarketDataProvider):
+    name = 'local'
+
+    def __init__(self, path: str, directory: Optional[str] = None, cache_entries: int = 4096):
+        """``path`` is a CSV/Parquet file (converted into ``directory`` when it
+        changes) or an already converted dataset directory"""
+        if os.path.isdir(path):
+            directory = path
+        else:
+            directory = directory or path + '.columns'
+            if not _is_current(path, directory):
+                build_dataset(path, directory)
+        self.directory = directory
+        with open(os.path.join(directory, 'meta.json'), encoding='utf-8') as fh:
+            self.meta = json.load(fh)
+        self._columns = {name: self._open(f'col_{name}') for name in self.meta['columns']}
+        self._pair_keys, self._pair_rows = self._open('pair_keys'), self._open('pair_rows')
+        self._company_keys, self._company_rows = self._open('company_keys'), self._open('company_rows')
+        self.cache_entries = cache_entries
+        self._cache: 'OrderedDict[tuple, Optional[Dict[str, float]]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _open(self, name: str) -> np.ndarray:
+        return np.load(os.path.join(self.directory, f'{name}.npy'), mmap_mode='r')
+
+    @staticmethod
+    def _find(keys: np.ndarray, rows: np.ndarray, key: int) -> int:
+        position = int(np.searchsorted(keys, np.uint64(key)))
+        if position < len(keys) and int(keys[position]) == key:
+            return int(rows[position])
+        return -1
+
+    def _lookup(self, company: str, domain: str) -> Optional[Dict[str, float]]:
+        row = self._find(self._pair_keys, self._pair_rows, key_hash(company, domain))
+        if row < 0:
+            row = self._find(self._pair_keys, self._pair_rows, key_hash(company))
+        if row < 0:
+            row = self._find(self._company_keys, self._company_rows, key_hash(company))
+        if row < 0:
+            return None
+        values = {}
+        for name, column in self._columns.items():
+            value = float(column[row])
+            if not math.isnan(value):
+                values[name] = value
+        return values
+
+    def row(self, company: str, domain: str = '') -> Optional[Dict[str, float]]:
+        """Numeric columns for a company, preferring its row for ``domain``"""
+        key = (normalize(company), normalize(domain))
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                CACHE_EVENTS.inc(cache='market_data', event='hit')
+                return self._cache[key]
+        CACHE_EVENTS.inc(cache='market_data', event='miss')
+        values = self._lookup(company, domain)
+        with self._lock:
+            self._cache[key] = values
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+        return values
+
+    def fetch(self, competitor: str, company: str, domain: str) -> Dict:
+        rows = {name: self.row(name, domain) for name in (competitor, company)}
+        known = {name: row for name, row in rows.items() if row}
+        if not known:
+            return {}
+        # Market-level figures come from the competitor's row when available
+        market = rows[competitor] or rows[company]
+        data = {}
+        if 'market_size' in market:
+            data['market_size'] = {
+                'value': _number(market['market_size']),
+                'currency': 'USD',
+                'year': _number(market['year']) if 'year' in market else None,
+            }
+        if 'growth_rate' in market:
+            data['growth_rate'] = {'value': _number(market['growth_rate']), 'period': 'annual'}
+        if all(row and 'market_share' in row for row in rows.values()):
+            shares = {name: _number(row['market_share']) for name, row in rows.items()}
+            shares['others'] = _number(max(0.0, 100 - sum(shares.values())))
+            data['market_shares'] = shares
+        segments = [{'name': _label(name, 'segment_', SEGMENT_NAMES), 'share': _number(value)}
+                    for name, value in market.items() if name.startswith('segment_')]
+        if segments:
+            data['customer_segments'] = segments
+        regions = {_label(name, 'region_', REGION_NAMES): _number(value)
+                   for name, value in market.items() if name.startswith('region_')}
+        if regions:
+            data['regional_distribution'] = regions
+        sentiment = {}
+        for name, row in known.items():
+            fields = {field: _number(row[f'sentiment_{field}'])
+                      for field in ('positive', 'neutral', 'negative') if f'sentiment_{field}' in row}
+            if 'mentions' in row:
+                fields['mentions'] = _number(row['mentions'])
+            if fields:
+                sentiment[name] = fields
+        if sentiment:
+            data['sentiment_analysis'] = sentiment
+        return data
+
+
+def merge_market_data(merged: Dict, part: Dict, source: str = 'unknown') -> Dict:
+    """Fill ``merged`` with the fields of ``part`` it does not have yet, recording ``source`` for each"""
+    sources = merged.setdefault('sources', {})
+    for key, value in part.items():
+        if key == 'sources':
+            continue
+        if key == 'sentiment_analysis' and isinstance(value, dict):
+            sentiment = merged.setdefault(key, {})
+            if not isinstance(sentiment, dict):
+                continue
+            for name, fields in value.items():
+                if name not in sentiment:
+                    sentiment[name] = fields
+                    sources[f'{key}.{name}'] = source
+        elif key not in merged:
+            merged[key] = value
+            sources[key] = source
+    return merged
+
+
+
+def build_providers(dataset: Optional[str] = None, dataset_dir: Optional[str] = None,
+                    cache_entries: int = 4096, sentiment: Optional[MarketDataProvider] = None
+                    ) -> List[MarketDataProvider]:
+    """Provider chain: sentiment measured from scraped pages and the local dataset
+    (when configured), backed by the static figures"""
+    providers: List[MarketDataProvider] = [sentiment] if sentiment is not None else []
+    if dataset:
+        try:
+            providers.append(LocalDatasetProvider(dataset, directory=dataset_dir, cache_entries=cache_entries))
+        except Exception as e:
+            logger.warning('Could not open market dataset %s: %s', dataset, e)
+    providers.append(StaticMarketDataProvider())
+    return providers
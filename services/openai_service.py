@@ -1,37 +1,89 @@
-﻿import openai
-import json
+﻿import json
 import logging
+import threading
 from config import Config
+from utils.metrics import OPENAI_ERRORS, STAGE_LATENCY, record_tokens
+from utils.tracing import span
 
 class OpenAIService:
     def __init__(self):
-        try:
-            import os
-            os.environ["OPENAI_API_KEY"] = Config.OPENAI_API_KEY
-            if not Config.OPENAI_API_KEY:
-                raise ValueError("OpenAI API key is not set")
-            self.client = openai.OpenAI()
-            logging.info("OpenAI service initialized successfully")
-        except Exception as e:
-            logging.error(f"Failed to initialize OpenAI service: {str(e)}")
-            raise
+        # The openai client is built on first use so importing and constructing
+        # the service stays cheap on cold start
+        self._client = None
+        self._client_lock = threading.Lock()
 
-    def analyze_competitor_data(self, competitor_company, your_company, product_domain):
+    @property
+    def client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    try:
+                        if not Config.OPENAI_API_KEY:
+                            raise ValueError("OpenAI API key is not set")
+                        import openai
+                        self._client = openai.OpenAI(api_key=Config.OPENAI_API_KEY, base_url=Config.OPENAI_BASE_URL)
+                        logging.info("OpenAI service initialized successfully")
+                    except Exception as e:
+                        logging.error(f"Failed to initialize OpenAI service: {str(e)}")
+                        raise
+        return self._client
+
+    def analyze_competitor_data(self, competitor_company, your_company, product_domain, market_data=None):
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You are a business analyst. Return analysis in JSON format only."},
-                    {"role": "user", "content": f"Compare {competitor_company} vs {your_company} in {product_domain} market"}
-                ],
-                max_tokens=2000,
-                temperature=0.7
-            )
+            with span('openai.chat_completion', model="gpt-3.5-turbo"), STAGE_LATENCY.time(stage='openai'):
+                response = self.client.chat.completions.create(
+                    model="gpt-3.5-turbo",
+                    messages=[
+                        {"role": "system", "content": "You are a business analyst. Return analysis in JSON format only."},
+                        {"role": "user", "content": f"Compare {competitor_company} vs {your_company} in {product_domain} market"}
+                    ],
+                    max_tokens=2000,
+                    temperature=0.7
+                )
+            self._record_usage(response)
             return response.choices[0].message.content
         except Exception as e:
+            OPENAI_ERRORS.inc(error=type(e).__name__)
             logging.error(f"OpenAI API error: {str(e)}")
             return json.dumps(self._get_fallback_analysis(competitor_company, your_company, product_domain))
 
+    def analyze_section(self, section, competitor_company, your_company, product_domain,
+                        instructions, inputs, max_tokens=500):
+        """Generate one section of the analysis; raises on API or parse errors"""
+        try:
+            with span('openai.section', section=section, model="gpt-3.5-turbo"), \
+                    STAGE_LATENCY.time(stage='openai_section'):
+                response = self.client.chat.completions.create(
+                    model="gpt-3.5-turbo",
+                    messages=[
+                        {"role": "system", "content": "You are a business analyst. Return only the requested JSON object."},
+                        {"role": "user", "content": (
+                            f"Compare {competitor_company} vs {your_company} in {product_domain} market. "
+                            f"Return the \"{section}\" section of the analysis as {instructions}.\n"
+                            f"Inputs: {json.dumps(inputs, default=str)[:4000]}"
+                        )}
+                    ],
+                    max_tokens=max_tokens,
+                    temperature=0.7
+                )
+            self._record_usage(response)
+            data = json.loads(response.choices[0].message.content)
+            # Accept the section either bare or wrapped in its key
+            if isinstance(data, dict) and isinstance(data.get(section), dict):
+                data = data[section]
+            if not isinstance(data, dict):
+                raise ValueError(f"Section {section} is not a JSON object")
+            return data
+        except Exception as e:
+            OPENAI_ERRORS.inc(error=type(e).__name__)
+            logging.error(f"OpenAI section {section} error: {str(e)}")
+            raise
+
+    def _record_usage(self, response):
+        usage = getattr(response, 'usage', None)
+        if usage is not None:
+            record_tokens(getattr(usage, 'prompt_tokens', 0) or 0, getattr(usage, 'completion_tokens', 0) or 0)
+
     def _get_fallback_analysis(self, competitor_company, your_company, product_domain):
         return {
             "company_overview": {
@@ -0,0 +1,106 @@
+import threading
+
+from config import Config
+
+from .openai_service import OpenAIService
+
+
+class ServiceRegistry:
+    """Lazily builds the application services on first use and shares them.
+
+    A single OpenAIService instance is injected into the analyzer and the agent,
+    and heavy client libraries (openai, requests, bs4) are only imported once a
+    service actually needs them.
+    """
+
+    def __init__(self):
+        self._instances = {}
+        self._lock = threading.RLock()
+
+    def _get(self, name, factory):
+        instance = self._instances.get(name)
+        if instance is None:
+            with self._lock:
+                instance = self._instances.get(name)
+                if instance is None:
+                    instance = self._instances[name] = factory()
+        return instance
+
+    @property
+    def openai(self) -> OpenAIService:
+        return self._get('openai', OpenAIService)
+
+    @property
+    def analyzer(self):
+        from .competitor_analysis import CompetitorAnalyzer
+        return self._get('analyzer', lambda: CompetitorAnalyzer(
+            openai_service=self.openai, snapshot_store=self.snapshots, section_cache=self.section_cache))
+
+    @property
+    def data_fetcher(self):
+        from .data_fetcher import DataFetcher
+        return self._get('data_fetcher', lambda: DataFetcher(
+            search_index=self.search_index, similarity=self.similarity,
+            market_data_providers=self.market_data_providers, sentiment=self.sentiment))
+
+    @property
+    def agent(self):
+        from .smithery_agent import SmitheryAgent
+        return self._get('agent', lambda: SmitheryAgent(ai=self.openai, snapshot_store=self.snapshots))
+
+    @property
+    def snapshots(self):
+        if not Config.SNAPSHOTS_ENABLED:
+            return None
+        from .snapshot_store import SnapshotStore
+        return self._get('snapshots', lambda: SnapshotStore(
+            Config.SNAPSHOT_DIR,
+            max_history=Config.SNAPSHOT_HISTORY,
+            retention=Config.SNAPSHOT_RETENTION_DAYS * 86400
+        ))
+
+    @property
+    def history(self):
+        from .history_store import HistoryStore
+        return self._get('history', lambda: HistoryStore(
+            Config.HISTORY_DIR,
+            flush_rows=Config.HISTORY_FLUSH_ROWS,
+            flush_interval=Config.HISTORY_FLUSH_INTERVAL
+        ))
+
+    @property
+    def section_cache(self):
+        if not Config.SECTION_ANALYSIS:
+            return None
+        from utils.cache import BoundedCache
+        return self._get('section_cache', lambda: BoundedCache(
+            max_bytes=Config.SECTION_CACHE_MAX_BYTES, max_entries=4096, name='section'))
+
+    @property
+    def search_index(self):
+        if not Config.SEARCH_ENABLED:
+            return None
+        from .search_index import SearchIndex
+        return self._get('search_index', lambda: SearchIndex(Config.SEARCH_INDEX_FILE))
+
+    @property
+    def similarity(self):
+        if not Config.SIMILARITY_ENABLED:
+            return None
+        from .similarity import SimilarityEngine
+        return self._get('similarity', lambda: SimilarityEngine(Config.SIMILARITY_DIR))
+
+    @property
+    def market_data_providers(self):
+        from .market_data import build_providers
+        return self._get('market_data_providers', lambda: build_providers(
+            Config.MARKET_DATASET, Config.MARKET_DATASET_DIR, Config.MARKET_DATA_CACHE_ENTRIES,
+            sentiment=self.sentiment))
+
+    @property
+    def sentiment(self):
+        if not Config.SENTIMENT_ENABLED:
+            return None
+        from .sentiment import SentimentProvider, SentimentScorer
+        return self._get('sentiment', lambda: SentimentProvider(
+            SentimentScorer(model_path=Config.SENTIMENT_MODEL), Config.SENTIMENT_DIR))
@@ -0,0 +1,446 @@
+"""
+Background refresh of watched competitor analyses.
+
+The scheduler keeps a watchlist of (competitor, company, domain) triples and
+re-runs their analyses ahead of user requests so the analysis cache stays
+warm. Each tick it ranks eligible items by
+
+    priority = staleness x (1 + log(1 + recent accesses)) x (0.5 + change rate)
+
+and dispatches the highest ones while the budgets allow: at most
+``max_concurrent`` refreshes at once, ``requests_per_minute`` refresh starts
+(token bucket) and ``tokens_per_day`` LLM tokens, counting only the tokens
+used by scheduled refreshes.
+
+Every worker process of a deployment shares the watchlist file: changes are
+merged into it under a file lock, and each process re-reads it every tick.
+Accesses counted by ``touch`` are added to the file on the next tick, so the
+priorities reflect the traffic of all workers. Only the process holding the
+leader lock (``<state_file>.leader``) dispatches refreshes, so the budgets
+apply once per deployment; when the leader exits another process takes over
+on its next tick. The other processes see a refresh as a newer
+``last_refreshed`` and call ``reload_fn`` to pick up its result.
+"""
+import json
+import logging
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from typing import Callable, Dict, List, Optional, Tuple
+
+from utils.metrics import IN_FLIGHT, OPENAI_TOKENS, STAGE_LATENCY, track_tokens
+from utils.storage import file_lock, private_dir, try_lock
+from utils.tracing import span
+
+logger = logging.getLogger(__name__)
+
+ACCESS_HALF_LIFE = 24 * 3600
+# Refresh outcomes, written by the leader
+REFRESH_FIELDS = ('last_refreshed', 'refreshes', 'changes', 'fingerprint', 'failures')
+# Persisted fields taken from the shared watchlist file
+SHARED_FIELDS = ('interval', 'added', 'accesses', 'accessed_at') + REFRESH_FIELDS
+
+
+class WatchItem:
+    __slots__ = ('competitor', 'company', 'domain', 'interval', 'added', 'last_refreshed', 'refreshes',
+                 'changes', 'accesses', 'accessed_at', 'fingerprint', 'failures', 'retry_at', 'running')
+
+    def __init__(self, competitor: str, company: str, domain: str, interval: float):
+        self.competitor = competitor
+        self.company = company
+        self.domain = domain
+        self.interval = interval
+        self.added = time.time()
+        self.last_refreshed = None
+        self.refreshes = 0
+        self.changes = 0
+        self.accesses = 0.0
+        self.accessed_at = self.added
+        self.fingerprint = None
+        self.failures = 0
+        self.retry_at = 0.0
+        self.running = False
+
+    @property
+    def key(self) -> Tuple[str, str, str]:
+        return self.competitor, self.company, self.domain
+
+    def decayed_accesses(self, now: float) -> float:
+        return self.accesses * 0.5 ** ((now - self.accessed_at) / ACCESS_HALF_LIFE)
+
+    def priority(self, now: float) -> float:
+        if self.last_refreshed is None:
+            staleness = 1e6
+        else:
+            staleness = (now - self.last_refreshed) / self.interval
+        # Laplace-smoothed share of refreshes that produced a different analysis
+        change_rate = (self.changes + 1) / (self.refreshes + 2)
+        return staleness * (1 + math.log1p(self.decayed_accesses(now))) * (0.5 + change_rate)
+
+    def to_dict(self, now: float = None) -> Dict:
+        now = now or time.time()
+        return {
+            'competitor_company': self.competitor,
+            'your_company': self.company,
+            'product_domain': self.domain,
+            'interval': self.interval,
+            'added': self.added,
+            'last_refreshed': self.last_refreshed,
+            'refreshes': self.refreshes,
+            'changes': self.changes,
+            'accesses': round(self.decayed_accesses(now), 3),
+            'accessed_at': now,
+            'failures': self.failures,
+            'fingerprint': self.fingerprint,
+            'priority': round(self.priority(now), 3),
+            'running': self.running,
+        }
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute: float):
+        self.capacity = max(1.0, rate_per_minute)
+        self.rate = rate_per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class RefreshScheduler:
+    def __init__(self, refresh_fn: Callable[[str, str, str], Optional[str]], state_file: Optional[str] = None,
+                 default_interval: float = 6 * 3600, min_interval: float = 300, max_concurrent: int = 2,
+                 requests_per_minute: float = 10, tokens_per_day: int = 200000, tick: float = 5.0,
+                 load_fn: Optional[Callable[[], int]] = None, max_load: int = 4,
+                 reload_fn: Optional[Callable[[str, str, str], None]] = None):
+        """``refresh_fn(competitor, company, domain)`` re-runs an analysis, stores it
+        in the cache and returns its content fingerprint; ``reload_fn`` caches an
+        analysis that another process refreshed"""
+        if state_file:
+            try:
+                private_dir(os.path.dirname(os.path.abspath(state_file)))
+            except OSError as e:
+                logger.error('Watchlist kept in memory only: %s', e)
+                state_file = None
+        self.refresh_fn = refresh_fn
+        self.state_file = state_file
+        self.default_interval = default_interval
+        self.min_interval = min_interval
+        self.max_concurrent = max_concurrent
+        self.tokens_per_day = tokens_per_day
+        self.tick = tick
+        self.load_fn = load_fn
+        self.max_load = max_load
+        self.reload_fn = reload_fn
+        self._bucket = TokenBucket(requests_per_minute)
+        self._items: Dict[Tuple[str, str, str], WatchItem] = {}
+        # Accesses not yet added to the watchlist file, and items refreshed by another process
+        self._accesses: Dict[Tuple[str, str, str], int] = {}
+        self._reloads = set()
+        self._lock = threading.RLock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pool = None
+        # Leader lock handle; without a state file this process is the only scheduler
+        self._leader = None if state_file else True
+        self._running = 0
+        self._day = date.today()
+        self._day_start_tokens = self._tokens_used()
+        # Estimated LLM tokens per refresh, updated from observed usage
+        self._tokens_per_refresh = 2000.0
+        self._load()
+        IN_FLIGHT.set_function(lambda: self._running, kind='scheduled_refreshes')
+
+    # -- watchlist -----------------------------------------------------------
+
+    def watch(self, competitor: str, company: str, domain: str, interval: float = None) -> WatchItem:
+        key = (competitor, company, domain)
+
+        def change(entries):
+            entry = entries.get(key)
+            if entry is None:
+                entries[key] = item.to_dict()
+            elif interval:
+                entry['interval'] = interval
+
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                item = self._items[key] = WatchItem(competitor, company, domain, interval or self.default_interval)
+            elif interval:
+                item.interval = interval
+            self._update(change)
+            item = self._items.get(key, item)
+        self._wake.set()
+        return item
+
+    def unwatch(self, competitor: str, company: str, domain: str) -> bool:
+        key = (competitor, company, domain)
+        removed = []
+
+        def change(entries):
+            removed.append(entries.pop(key, None) is not None)
+
+        with self._lock:
+            removed.append(self._items.pop(key, None) is not None)
+            self._update(change)
+        return any(removed)
+
+    def touch(self, competitor: str, company: str, domain: str) -> None:
+        """Count a user access to a watched triple (raises its priority)"""
+        key = (competitor, company, domain)
+        item = self._items.get(key)
+        if item is None:
+            return
+        now = time.time()
+        with self._lock:
+            item.accesses = item.decayed_accesses(now) + 1
+            item.accessed_at = now
+            if self.state_file:
+                self._accesses[key] = self._accesses.get(key, 0) + 1
+
+    def items(self) -> List[Dict]:
+        self._load()
+        now = time.time()
+        with self._lock:
+            items = [item.to_dict(now) for item in self._items.values()]
+        return sorted(items, key=lambda i: i['priority'], reverse=True)
+
+    def budgets(self) -> Dict:
+        return {
+            'leader': bool(self._leader),
+            'max_concurrent': self.max_concurrent,
+            'running': self._running,
+            'requests_per_minute': self._bucket.capacity,
+            'tokens_per_day': self.tokens_per_day,
+            'tokens_used_today': self._tokens_today(),
+            'tokens_per_refresh_estimate': round(self._tokens_per_refresh),
+        }
+
+    # -- persistence ---------------------------------------------------------
+
+    @staticmethod
+    def _entry_key(entry: Dict) -> Tuple[str, str, str]:
+        return entry['competitor_company'], entry['your_company'], entry['product_domain']
+
+    def _read(self) -> Optional[Dict[Tuple[str, str, str], Dict]]:
+        """The watchlist file as ``{key: entry}``, or None if it could not be read"""
+        try:
+            with open(self.state_file, encoding='utf-8') as fh:
+                saved = json.load(fh)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning('Could not read watchlist %s: %s', self.state_file, e)
+            return None
+        return {self._entry_key(entry): entry for entry in saved}
+
+    def _load(self) -> None:
+        """Pick up watches added, changed or removed by other processes"""
+        if not self.state_file:
+            return
+        entries = self._read()
+        if entries is not None:
+            self._merge(entries)
+
+    def _merge(self, entries: Dict[Tuple[str, str, str], Dict]) -> None:
+        now = time.time()
+        with self._lock:
+            for key in list(self._items):
+                if key not in entries and not self._items[key].running:
+                    del self._items[key]
+            for key, entry in entries.items():
+                item = self._items.get(key)
+                if item is None:
+                    item = self._items[key] = WatchItem(*key, entry.get('interval') or self.default_interval)
+                elif item.running:
+                    continue
+                refreshed = entry.get('last_refreshed')
+                if self.reload_fn is not None and refreshed is not None and refreshed != item.last_refreshed:
+                    self._reloads.add(key)
+                for field in SHARED_FIELDS:
+                    if entry.get(field) is not None:
+                        setattr(item, field, entry[field])
+                # Keep this process's accesses that are not in the file yet
+                pending = self._accesses.get(key)
+                if pending:
+                    item.accesses = item.decayed_accesses(now) + pending
+                    item.accessed_at = now
+
+    def _update(self, change: Callable[[Dict[Tuple[str, str, str], Dict]], None]) -> bool:
+        """Apply ``change`` to the watchlist file under its lock, then merge the result.
+
+        The file is re-read inside the lock, so concurrent updates from other
+        processes are kept instead of being overwritten by this process's list.
+        Returns False if the file could not be written.
+        """
+        if not self.state_file:
+            return False
+        try:
+            with file_lock(self.state_file + '.lock'):
+                # An unreadable file is replaced, as it was before the first save
+                entries = self._read() or {}
+                change(entries)
+                with open(self.state_file + '.tmp', 'w', encoding='utf-8') as fh:
+                    json.dump(list(entries.values()), fh)
+                os.replace(self.state_file + '.tmp', self.state_file)
+        except OSError as e:
+            logger.warning('Could not save watchlist %s: %s', self.state_file, e)
+            return False
+        self._merge(entries)
+        return True
+
+    def _flush_accesses(self) -> None:
+        """Add the accesses counted since the last tick to the watchlist file"""
+        with self._lock:
+            pending, self._accesses = self._accesses, {}
+        if not pending:
+            return
+        now = time.time()
+
+        def change(entries):
+            for key, count in pending.items():
+                entry = entries.get(key)
+                if entry is not None:
+                    accessed_at = entry.get('accessed_at') or now
+                    accesses = (entry.get('accesses') or 0.0) * 0.5 ** ((now - accessed_at) / ACCESS_HALF_LIFE)
+                    entry['accesses'] = accesses + count
+                    entry['accessed_at'] = now
+
+        if not self._update(change):
+            # Retried on the next tick
+            with self._lock:
+                for key, count in pending.items():
+                    self._accesses[key] = self._accesses.get(key, 0) + count
+
+    def _reload(self) -> None:
+        """Cache the analyses that another process refreshed"""
+        with self._lock:
+            keys, self._reloads = self._reloads, set()
+        for key in keys:
+            try:
+                self.reload_fn(*key)
+            except Exception as e:
+                logger.warning('Could not load the refreshed analysis of %s: %s', key, e)
+
+    # -- budgets ---------------------------------------------------------------
+
+    @staticmethod
+    def _tokens_used() -> float:
+        # Only scheduled refreshes count against the budget, not user requests
+        return OPENAI_TOKENS.value(kind='prompt', source='scheduled') + \
+            OPENAI_TOKENS.value(kind='completion', source='scheduled')
+
+    def _tokens_today(self) -> float:
+        today = date.today()
+        if today != self._day:
+            self._day = today
+            self._day_start_tokens = self._tokens_used()
+        return self._tokens_used() - self._day_start_tokens
+
+    def _within_token_budget(self) -> bool:
+        return self._tokens_today() + self._tokens_per_refresh <= self.tokens_per_day
+
+    # -- scheduling ------------------------------------------------------------
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._pool = ThreadPoolExecutor(max_workers=self.max_concurrent, thread_name_prefix='refresh')
+                self._thread = threading.Thread(target=self._run, name='refresh-scheduler', daemon=True)
+                self._thread.start()
+
+    def _elect(self) -> bool:
+        """Try to become the one process that dispatches refreshes"""
+        if not self._leader:
+            try:
+                self._leader = try_lock(self.state_file + '.leader')
+            except OSError as e:
+                logger.warning('Could not take the scheduler leader lock: %s', e)
+            if self._leader:
+                logger.info('This process now runs the scheduled refreshes (pid %s)', os.getpid())
+        return bool(self._leader)
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self._flush_accesses()
+                self._load()
+                if self._elect():
+                    self.dispatch()
+                if self._reloads:
+                    self._reload()
+            except Exception as e:
+                logger.warning('Refresh scheduling failed: %s', e)
+            self._wake.wait(self.tick)
+            self._wake.clear()
+
+    def due(self, now: float = None) -> List[WatchItem]:
+        """Eligible items, highest priority first"""
+        now = now or time.time()
+        with self._lock:
+            candidates = [
+                item for item in self._items.values()
+                if not item.running and now >= item.retry_at
+                and (item.last_refreshed is None or now - item.last_refreshed >= self.min_interval)
+            ]
+        return sorted(candidates, key=lambda item: item.priority(now), reverse=True)
+
+    def dispatch(self) -> int:
+        """Start as many due refreshes as the budgets allow; returns the number started"""
+        started = 0
+        for item in self.due():
+            if self._running >= self.max_concurrent:
+                break
+            if self.load_fn is not None and self.load_fn() > self.max_load:
+                logger.info('Server busy; deferring scheduled refreshes')
+                break
+            if not self._within_token_budget():
+                logger.info('Daily LLM token budget reached; deferring scheduled refreshes')
+                break
+            if not self._bucket.take():
+                break
+            with self._lock:
+                item.running = True
+                self._running += 1
+            self._pool.submit(self._refresh, item)
+            started += 1
+        return started
+
+    def _refresh(self, item: WatchItem) -> None:
+        try:
+            with span('scheduler.refresh', competitor=item.competitor, domain=item.domain), \
+                    STAGE_LATENCY.time(stage='scheduled_refresh'), track_tokens('scheduled') as usage:
+                fingerprint = self.refresh_fn(item.competitor, item.company, item.domain)
+            with self._lock:
+                item.refreshes += 1
+                if item.fingerprint is not None and fingerprint != item.fingerprint:
+                    item.changes += 1
+                item.fingerprint = fingerprint
+                item.last_refreshed = time.time()
+                item.failures = 0
+                stats = {field: getattr(item, field) for field in REFRESH_FIELDS}
+            # Only record the refresh if the item was not unwatched meanwhile
+            self._update(lambda entries: entries[item.key].update(stats) if item.key in entries else None)
+            # Counted per refresh, so concurrent refreshes do not inflate each other's estimate
+            self._tokens_per_refresh = 0.8 * self._tokens_per_refresh + 0.2 * usage.tokens
+        except Exception as e:
+            logger.warning('Scheduled refresh of %s failed: %s', item.key, e)
+            with self._lock:
+                item.failures += 1
+                # Exponential backoff, capped at the item's refresh interval
+                item.retry_at = time.time() + min(item.interval, self.min_interval * 2 ** item.failures)
+        finally:
+            with self._lock:
+                item.running = False
+                self._running -= 1
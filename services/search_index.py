@@ -0,0 +1,536 @@
+"""
+Incremental full-text index over scraped competitor pages.
+
+Pages are tokenized into lowercase word terms plus adjacent-word bigrams (so
+quoted phrases such as "usage based pricing" can be matched). Each term keeps
+a posting list of ``(doc id delta, term frequency)`` pairs encoded as varints
+in a ``bytearray``; new documents always get higher ids, so indexing a page
+is an append to each of its terms' lists. Re-indexing a URL tombstones its
+previous document, and the index is rebuilt once too many tombstones pile up.
+Document frequencies are counted over live postings at query time, so
+tombstones never skew scores.
+
+Posting lists are decoded with NumPy and scored with BM25.
+
+With a ``path`` the index is backed by a JSON-lines journal of indexed and
+removed pages shared by all worker processes: every change is appended under
+a file lock, and each process replays entries written by the others before
+it answers a query. Compaction rewrites the journal with the live pages only.
+Every ``checkpoint_bytes`` of journal, and after each compaction, the index
+is saved as a journal checkpoint (an ``.npz`` of the document table and the
+varint postings sorted by term hash), so a starting worker loads that and
+replays only the entries appended since. Restored postings stay in those
+flat arrays (``FrozenPostings``, looked up by binary search) and postings
+appended later extend them from the regular per-term dict.
+"""
+import io
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+import zlib
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from utils.serialization import dumps
+from utils.storage import Journal, private_dir
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"[^\W_]+", re.UNICODE)
+_PHRASE_RE = re.compile(r'"([^"]+)"')
+
+STOPWORDS = frozenset(
+    'a an and are as at be but by for from has have in is it its of on or our that the their this to '
+    'was we were will with you your'.split()
+)
+
+# Fields indexed per page, with a weight (term frequency multiplier)
+FIELD_WEIGHTS = (('title', 3), ('description', 2), ('navigation', 1), ('meta_data', 1), ('content', 1))
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+def bigrams(tokens: List[str]) -> List[str]:
+    return [f'{a}_{b}' for a, b in zip(tokens, tokens[1:])]
+
+
+def page_text(page: Dict, field: str) -> str:
+    value = page.get(field)
+    if not value:
+        return ''
+    if field == 'navigation':
+        return ' '.join(str(item.get('text', '')) if isinstance(item, dict) else str(item) for item in value)
+    if field == 'meta_data':
+        return ' '.join(str(v) for v in value.values()) if isinstance(value, dict) else str(value)
+    return str(value)
+
+
+def encode_varints(values: Iterable[int], out: bytearray) -> None:
+    for value in values:
+        while value >= 0x80:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+
+
+def _decode_varints_py(buf: bytes) -> List[int]:
+    values = []
+    value = shift = 0
+    for byte in buf:
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            values.append(value)
+            value = shift = 0
+        else:
+            shift += 7
+    return values
+
+
+def decode_varints(buf: bytes) -> np.ndarray:
+    """Decode a run of LEB128 varints in one vectorized pass"""
+    if len(buf) <= 32:
+        # NumPy's per-call overhead dominates for short (rare-term) posting lists
+        return np.array(_decode_varints_py(buf), dtype=np.int64)
+    data = np.frombuffer(buf, dtype=np.uint8)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    group = np.repeat(np.arange(len(ends)), ends - starts + 1)
+    shift = (np.arange(len(data)) - starts[group]) * 7
+    parts = (data & 0x7F).astype(np.int64) << shift
+    return np.bincount(group, weights=parts, minlength=len(ends)).astype(np.int64)
+
+
+def _gather(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """Concatenated ``arange(start, start + length)`` ranges, vectorized"""
+    total = int(lengths.sum())
+    if not total:
+        return np.empty(0, dtype=np.int64)
+    offsets = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+    return offsets + np.arange(total)
+
+
+def _term_hash(term: bytes) -> int:
+    # Stable across processes (unlike hash()); collisions are resolved by comparing the term
+    return zlib.crc32(term) << 32 | zlib.adler32(term)
+
+
+def _starts(ends: np.ndarray) -> np.ndarray:
+    """Start offsets of consecutive ranges ending at ``ends``"""
+    return np.concatenate(([0], ends[:-1])).astype(np.int64) if len(ends) else np.empty(0, dtype=np.int64)
+
+
+class FrozenPostings:
+    """Posting lists restored from a checkpoint, in flat arrays sorted by term hash.
+
+    Restoring creates no per-term objects; a term is found by binary search
+    over ``hashes`` and its bytes are sliced out of ``postings``.
+    """
+
+    def __init__(self, hashes: np.ndarray, term_ends: np.ndarray, terms: bytes, ends: np.ndarray,
+                 postings: bytes, last_doc: np.ndarray):
+        if not len(hashes) == len(term_ends) == len(ends) == len(last_doc):
+            raise ValueError('inconsistent posting arrays')
+        self.hashes = hashes
+        self.term_ends = term_ends
+        self.terms = terms
+        self.ends = ends
+        self.postings = postings
+        self.last_doc = last_doc
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def term(self, position: int) -> bytes:
+        return self.terms[int(self.term_ends[position - 1]) if position else 0:int(self.term_ends[position])]
+
+    def posting_list(self, position: int) -> bytes:
+        return self.postings[int(self.ends[position - 1]) if position else 0:int(self.ends[position])]
+
+    def find(self, terms: List[str]) -> List[int]:
+        """Position of each term, or -1 when it has no postings here"""
+        encoded = [term.encode('utf-8') for term in terms]
+        hashes = [_term_hash(term) for term in encoded]
+        positions = np.searchsorted(self.hashes, np.array(hashes, dtype=np.uint64)).tolist()
+        found = []
+        for term, term_hash, position in zip(encoded, hashes, positions):
+            while position < len(self.hashes) and int(self.hashes[position]) == term_hash:
+                if self.term(position) == term:
+                    break
+                position += 1
+            else:
+                position = -1
+            found.append(position)
+        return found
+
+    def items(self) -> Iterable[Tuple[str, bytes]]:
+        for position in range(len(self)):
+            yield self.term(position).decode('utf-8'), self.posting_list(position)
+
+
+class SearchIndex:
+    def __init__(self, path: Optional[str] = None, k1: float = 1.2, b: float = 0.75,
+                 max_deleted_ratio: float = 0.3, checkpoint_bytes: int = 8 * 1024 * 1024):
+        """``path`` is the journal file; its directory must be private to this user"""
+        if path:
+            try:
+                private_dir(os.path.dirname(os.path.abspath(path)))
+            except OSError as e:
+                logger.error('Search index kept in memory only: %s', e)
+                path = None
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.max_deleted_ratio = max_deleted_ratio
+        self.checkpoint_bytes = checkpoint_bytes
+        self._lock = threading.RLock()
+        self._journal = Journal(path, 'search index journal') if path else None
+        self._reset()
+        self._sync()
+
+    def _reset(self) -> None:
+        # Postings restored from a checkpoint, and the position there of terms
+        # whose lists continue in _postings
+        self._base: Optional[FrozenPostings] = None
+        self._base_terms: Dict[str, int] = {}
+        self._postings: Dict[str, bytearray] = {}
+        self._last_doc: Dict[str, int] = {}
+        self._doc_lengths = array('I')
+        self._docs: List[Optional[Dict]] = []
+        self._url_docs: Dict[str, int] = {}
+        self._total_length = 0
+        self._live = 0
+
+    # -- journal -------------------------------------------------------------
+
+    def _sync(self) -> None:
+        """Apply journal entries appended since the last sync, by any process"""
+        if self._journal is None:
+            return
+        with self._lock:
+            restart, entries = self._journal.read()
+            if restart:
+                self._reset()
+                checkpoint = self._journal.take_checkpoint()
+                if checkpoint is not None and not self._restore(checkpoint):
+                    self._journal.rewind()
+                    self._reset()
+                    restart, entries = self._journal.read()
+            for entry in entries:
+                try:
+                    self._apply(entry)
+                except (KeyError, TypeError) as e:
+                    logger.warning('Skipping bad search index journal entry: %s', e)
+            if self._journal.checkpoint_due(self.checkpoint_bytes):
+                self._save_checkpoint()
+
+    def _save_checkpoint(self) -> None:
+        """Save the index as the journal's checkpoint (call under the lock, right after ``_sync``)"""
+        base = self._base
+        # Lists of restored terms that grew since, and terms new since the restore
+        extended = list(self._base_terms.items())
+        new_terms = [term for term in self._postings if term not in self._base_terms]
+        encoded = [term.encode('utf-8') for term in new_terms]
+        extended_bufs = [self._postings[term] for term, _ in extended]
+        new_bufs = [self._postings[term] for term in new_terms]
+
+        base_postings = base.postings if base is not None else b''
+        base_terms = base.terms if base is not None else b''
+        base_ends = base.ends if base is not None else np.empty(0, dtype=np.int64)
+        base_term_ends = base.term_ends if base is not None else np.empty(0, dtype=np.int64)
+        extended_lengths = np.array([len(buf) for buf in extended_bufs], dtype=np.int64)
+        new_lengths = np.array([len(buf) for buf in new_bufs], dtype=np.int64)
+        new_term_lengths = np.array([len(term) for term in encoded], dtype=np.int64)
+
+        # Each entry's posting list is a head (restored or new list) plus a tail (appended to a restored list)
+        head_starts = np.concatenate((_starts(base_ends),
+                                      len(base_postings) + int(extended_lengths.sum()) + _starts(np.cumsum(new_lengths))))
+        head_lengths = np.concatenate((np.diff(base_ends, prepend=0), new_lengths))
+        tail_starts = np.zeros(len(head_starts), dtype=np.int64)
+        tail_lengths = np.zeros(len(head_starts), dtype=np.int64)
+        extended_positions = np.array([position for _, position in extended], dtype=np.int64)
+        tail_starts[extended_positions] = len(base_postings) + _starts(np.cumsum(extended_lengths))
+        tail_lengths[extended_positions] = extended_lengths
+        last_doc = np.concatenate((base.last_doc if base is not None else np.empty(0, dtype=np.int64),
+                                   np.array([self._last_doc[term] for term in new_terms], dtype=np.int64)))
+        last_doc[extended_positions] = [self._last_doc[term] for term, _ in extended]
+        hashes = np.concatenate((base.hashes if base is not None else np.empty(0, dtype=np.uint64),
+                                 np.array([_term_hash(term) for term in encoded], dtype=np.uint64)))
+        term_starts = np.concatenate((_starts(base_term_ends),
+                                      len(base_terms) + _starts(np.cumsum(new_term_lengths))))
+        term_lengths = np.concatenate((np.diff(base_term_ends, prepend=0), new_term_lengths))
+
+        order = np.argsort(hashes, kind='stable')
+        source = np.frombuffer(base_postings + b''.join(extended_bufs) + b''.join(new_bufs), dtype=np.uint8)
+        segment_starts = np.stack((head_starts[order], tail_starts[order]), axis=1).ravel()
+        segment_lengths = np.stack((head_lengths[order], tail_lengths[order]), axis=1).ravel()
+        term_source = np.frombuffer(base_terms + b''.join(encoded), dtype=np.uint8)
+        out = io.BytesIO()
+        np.savez(
+            out,
+            docs=np.frombuffer(dumps(self._docs), dtype=np.uint8),
+            doc_lengths=np.frombuffer(self._doc_lengths, dtype=np.uint32),
+            hashes=hashes[order],
+            term_ends=np.cumsum(term_lengths[order]),
+            terms=term_source[_gather(term_starts[order], term_lengths[order])],
+            ends=np.cumsum(head_lengths[order] + tail_lengths[order]),
+            postings=source[_gather(segment_starts, segment_lengths)],
+            last_doc=last_doc[order],
+        )
+        self._journal.save_checkpoint(out.getvalue())
+
+    def _restore(self, checkpoint: bytes) -> bool:
+        """Load the index from a journal checkpoint; False if it cannot be used"""
+        try:
+            with np.load(io.BytesIO(checkpoint), allow_pickle=False) as arrays:
+                docs = json.loads(arrays['docs'].tobytes())
+                doc_lengths = array('I', arrays['doc_lengths'].tobytes())
+                base = FrozenPostings(arrays['hashes'], arrays['term_ends'], arrays['terms'].tobytes(),
+                                      arrays['ends'], arrays['postings'].tobytes(), arrays['last_doc'])
+            if len(docs) != len(doc_lengths):
+                raise ValueError('inconsistent document arrays')
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning('Replaying the whole search index journal: bad checkpoint: %s', e)
+            return False
+        self._base = base if len(base) else None
+        self._docs, self._doc_lengths = docs, doc_lengths
+        self._url_docs = {doc['url']: i for i, doc in enumerate(docs) if doc is not None}
+        self._live = len(self._url_docs)
+        self._total_length = sum(doc_lengths[i] for i in self._url_docs.values())
+        return True
+
+    def _write(self, entry: Dict) -> None:
+        """Record a change in the journal (when there is one) and apply it"""
+        if self._journal is not None and self._journal.append(entry):
+            self._sync()
+        else:
+            self._apply(entry)
+
+    def _compact(self) -> None:
+        """Rewrite the journal with the latest entry of each live page"""
+        with self._journal.lock():
+            # Another process may have compacted already
+            self._sync()
+            if not self._needs_rebuild():
+                return
+            self._journal.compact()
+            self._rebuild()
+            self._save_checkpoint()
+        logger.info('Compacted search index journal: %d live documents', self._live)
+
+    def _needs_rebuild(self) -> bool:
+        return len(self._docs) - self._live > self.max_deleted_ratio * max(len(self._docs), 100)
+
+    # -- updates ---------------------------------------------------------------
+
+    def _terms(self, page: Dict) -> Tuple[Counter, int]:
+        counts = Counter()
+        length = 0
+        for field, weight in FIELD_WEIGHTS:
+            tokens = tokenize(page_text(page, field))
+            length += len(tokens)
+            for term in tokens:
+                counts[term] += weight
+            for term in bigrams(tokens):
+                counts[term] += weight
+        return counts, length
+
+    def add_page(self, page: Dict) -> Optional[int]:
+        """Index a parsed page (as returned by ``DataFetcher.parse_website``), replacing its previous version"""
+        url = page.get('url')
+        if not url:
+            return None
+        counts, length = self._terms(page)
+        entry = {
+            'url': url,
+            'title': page.get('title') or url,
+            'description': (page.get('description') or '')[:300],
+            'indexed_at': time.time(),
+            'length': length,
+            'terms': counts,
+        }
+        with self._lock:
+            self._write(entry)
+            if self._needs_rebuild():
+                if self.path:
+                    self._compact()
+                else:
+                    self._rebuild()
+            return self._url_docs.get(url)
+
+    def remove_page(self, url: str) -> bool:
+        with self._lock:
+            self._sync()
+            if url not in self._url_docs:
+                return False
+            self._write({'url': url, 'removed': True})
+        return True
+
+    def _apply(self, entry: Dict) -> None:
+        url = entry['url']
+        self._remove(url)
+        if entry.get('removed'):
+            return
+        doc_id = len(self._docs)
+        self._docs.append({
+            'url': url,
+            'title': entry['title'],
+            'description': entry['description'],
+            'indexed_at': entry['indexed_at'],
+        })
+        self._doc_lengths.append(entry['length'])
+        self._url_docs[url] = doc_id
+        self._total_length += entry['length']
+        self._live += 1
+        terms = entry['terms']
+        if self._base is not None:
+            # Lists of restored terms continue from their last restored document
+            unseen = [term for term in terms if term not in self._last_doc]
+            for term, position in zip(unseen, self._base.find(unseen) if unseen else ()):
+                if position >= 0:
+                    self._base_terms[term] = position
+                    self._last_doc[term] = int(self._base.last_doc[position])
+        for term, tf in terms.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = bytearray()
+            encode_varints((doc_id - self._last_doc.get(term, 0), tf), postings)
+            self._last_doc[term] = doc_id
+
+    def _remove(self, url: str) -> bool:
+        doc_id = self._url_docs.pop(url, None)
+        if doc_id is None:
+            return False
+        self._docs[doc_id] = None
+        self._total_length -= self._doc_lengths[doc_id]
+        self._live -= 1
+        return True
+
+    def _rebuild(self) -> None:
+        """Drop tombstoned documents and renumber the live ones"""
+        live = [doc_id for doc_id, doc in enumerate(self._docs) if doc is not None]
+        remap = np.full(len(self._docs), -1, dtype=np.int64)
+        remap[live] = np.arange(len(live))
+        postings, last_doc = {}, {}
+        remap_list = remap.tolist()
+        for term, buf in self._posting_lists():
+            pairs = _decode_varints_py(buf)
+            out = bytearray()
+            doc = previous = count = 0
+            for delta, tf in zip(pairs[0::2], pairs[1::2]):
+                doc += delta
+                new_id = remap_list[doc]
+                if new_id >= 0:
+                    encode_varints((new_id - previous, tf), out)
+                    previous = new_id
+                    count += 1
+            if count:
+                postings[term], last_doc[term] = out, previous
+        self._postings, self._last_doc = postings, last_doc
+        self._base, self._base_terms = None, {}
+        self._docs = [self._docs[i] for i in live]
+        self._doc_lengths = array('I', (self._doc_lengths[i] for i in live))
+        self._url_docs = {doc['url']: i for i, doc in enumerate(self._docs)}
+        logger.info('Rebuilt search index: %d live documents', len(live))
+
+    def _posting_list(self, term: str) -> Optional[bytes]:
+        """Encoded postings of a term: restored ones followed by those appended since"""
+        appended = self._postings.get(term)
+        if self._base is not None:
+            position = self._base_terms.get(term)
+            if position is None and term not in self._last_doc:
+                position = self._base.find([term])[0]
+            if position is not None and position >= 0:
+                return self._base.posting_list(position) + bytes(appended or b'')
+        return bytes(appended) if appended is not None else None
+
+    def _posting_lists(self) -> Iterable[Tuple[str, bytes]]:
+        if self._base is not None:
+            for term, buf in self._base.items():
+                appended = self._postings.get(term) if term in self._base_terms else None
+                yield term, buf + bytes(appended or b'')
+        for term, buf in self._postings.items():
+            if term not in self._base_terms:
+                yield term, buf
+
+    # -- queries ---------------------------------------------------------------
+
+    def parse_query(self, query: str) -> Tuple[List[str], List[List[str]]]:
+        """Split a query into free terms and quoted phrases (as bigram lists)"""
+        phrases = [bigrams(tokenize(p)) or tokenize(p) for p in _PHRASE_RE.findall(query)]
+        terms = tokenize(_PHRASE_RE.sub(' ', query))
+        return terms, [p for p in phrases if p]
+
+    def search(self, query: str, limit: int = 10) -> Dict:
+        terms, phrases = self.parse_query(query)
+        required = [term for phrase in phrases for term in phrase]
+        scoring = list(dict.fromkeys(terms + required))
+        if not scoring:
+            return {'total': 0, 'results': []}
+
+        with self._lock:
+            self._sync()
+            buffers = {term: self._posting_list(term) for term in scoring}
+            buffers = {term: buf for term, buf in buffers.items() if buf is not None}
+            doc_lengths = np.frombuffer(self._doc_lengths, dtype=np.uint32).astype(np.float64)
+            docs = list(self._docs)
+            live = self._live
+            avg_length = self._total_length / live if live else 0.0
+        if not live or any(term not in buffers for term in required):
+            return {'total': 0, 'results': []}
+
+        # Tombstoned documents keep their postings until the next rebuild
+        alive = np.fromiter((doc is not None for doc in docs), dtype=bool, count=len(docs))
+        scores = np.zeros(len(docs), dtype=np.float64)
+        matched = np.zeros(len(docs), dtype=bool)
+        matched_required = np.zeros(len(docs), dtype=np.int32)
+        norm = self.k1 * (1 - self.b + self.b * doc_lengths / (avg_length or 1))
+        for term, buf in buffers.items():
+            pairs = decode_varints(buf)
+            doc_ids = np.cumsum(pairs[0::2])
+            keep = alive[doc_ids]
+            doc_ids, tfs = doc_ids[keep], pairs[1::2][keep].astype(np.float64)
+            if not len(doc_ids):
+                continue
+            idf = math.log(1 + (live - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+            scores[doc_ids] += idf * tfs * (self.k1 + 1) / (tfs + norm[doc_ids])
+            matched[doc_ids] = True
+            if term in required:
+                matched_required[doc_ids] += 1
+
+        mask = matched
+        if required:
+            mask &= matched_required == len(set(required))
+        candidates = np.flatnonzero(mask)
+        total = len(candidates)
+        if total > limit:
+            candidates = candidates[np.argpartition(-scores[candidates], limit)[:limit]]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return {
+            'total': total,
+            'results': [{**docs[i], 'score': round(float(scores[i]), 4)} for i in candidates],
+        }
+
+    def __len__(self) -> int:
+        return self._live
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'documents': self._live,
+                'tombstones': len(self._docs) - self._live,
+                'terms': (len(self._base) if self._base is not None else 0)
+                + sum(1 for term in self._postings if term not in self._base_terms),
+                'posting_bytes': (len(self._base.postings) if self._base is not None else 0)
+                + sum(len(p) for p in self._postings.values()),
+            }
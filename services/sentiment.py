@@ -0,0 +1,382 @@
+"""
+Local sentiment scoring of scraped reviews and page text.
+
+Text is split into units (reviews, sentences), tokenized and hashed into
+``n_features`` buckets; words following a negation ("not", "never", ...)
+become ``not_<word>`` features. A whole batch of units is scored at once: a
+lexicon polarity table (or, when one has been trained, a small multinomial
+linear model) is gathered over the hashed ids and summed per unit with
+``np.bincount``. Each unit is labelled negative, neutral or positive.
+
+``SentimentProvider`` scores every scraped page and reports per-company
+distributions (whole percentages of positive / neutral / negative units,
+summing to 100) and mention counts (number of scored units) to
+``fetch_market_data``; the counts per page are shared by all workers through
+a journal. A page counts for a company when it was scraped for that company
+or, untagged, when its registered domain name is the company's name: acme.com
+and shop.acme.co.uk count for "Acme Corp", metabase.com does not count for
+"Meta".
+"""
+import logging
+import os
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import numpy as np
+
+from utils.storage import Journal, private_dir
+
+from .market_data import MarketDataProvider, normalize
+
+logger = logging.getLogger(__name__)
+
+LABELS = ('negative', 'neutral', 'positive')
+
+_WORD_RE = re.compile(r"[^\W_]+(?:'[a-z]+)?", re.UNICODE)
+_UNIT_RE = re.compile(r"[^.!?\n]+[.!?]*")
+
+NEGATORS = frozenset("not no never without hardly cannot can't don't doesn't didn't isn't wasn't aren't won't".split())
+# Number of following words a negation applies to
+NEGATION_SCOPE = 3
+
+# Second-level labels under which country TLDs register names (acme.co.uk, acme.com.au)
+SECOND_LEVEL_LABELS = frozenset('co com net org gov edu ac ltd plc ne or go'.split())
+# Dropped from company names before comparing them with domain names
+LEGAL_SUFFIXES = frozenset('inc incorporated corp corporation co company llc ltd limited plc gmbh ag sa sas '
+                           'bv nv oy ab'.split())
+
+LEXICON = {
+    **dict.fromkeys('excellent outstanding amazing fantastic superb exceptional love loved loves '
+                    'delightful brilliant awesome'.split(), 3.0),
+    **dict.fromkeys('great best perfect impressive intuitive reliable seamless powerful recommend '
+                    'recommended favorite happy pleased enjoy enjoyed'.split(), 2.0),
+    **dict.fromkeys('good nice easy fast helpful useful responsive smooth simple solid secure '
+                    'affordable efficient friendly quick clean stable flexible innovative trusted '
+                    'satisfied improve improved improvement like liked leading'.split(), 1.0),
+    **dict.fromkeys('terrible awful horrible worst hate hated scam useless disaster unacceptable'.split(), -3.0),
+    **dict.fromkeys('bad poor broken disappointing disappointed frustrating frustrated unreliable '
+                    'buggy outage outages overpriced expensive rude annoying'.split(), -2.0),
+    **dict.fromkeys('slow confusing difficult hard complicated bug bugs issue issues problem problems '
+                    'error errors crash crashes lag limited lacking missing delay delays fail failed '
+                    'fails failure complaint complaints cancel cancelled refund'.split(), -1.0),
+}
+
+
+def _bucket(feature: str, n_features: int) -> int:
+    return zlib.crc32(feature.encode('utf-8')) & (n_features - 1)
+
+
+def features(text: str) -> List[str]:
+    """Lowercase word features with negation marking"""
+    tokens = []
+    negated = 0
+    for word in _WORD_RE.findall(text.lower()):
+        if word in NEGATORS:
+            negated = NEGATION_SCOPE
+            continue
+        if negated:
+            tokens.append('not_' + word)
+            negated -= 1
+        else:
+            tokens.append(word)
+    return tokens
+
+
+def registered_name(hostname: str) -> str:
+    """The name a host is registered under, without hyphens: ``acme`` for www.acme.com or shop.acme.co.uk"""
+    labels = [label for label in (hostname or '').lower().strip('.').split('.') if label]
+    if len(labels) >= 3 and len(labels[-1]) == 2 and labels[-2] in SECOND_LEVEL_LABELS:
+        name = labels[-3]
+    else:
+        name = labels[-2] if len(labels) >= 2 else ''.join(labels)
+    return name.replace('-', '')
+
+
+def company_names(company: str) -> frozenset:
+    """Domain-style spellings of a company name: {'acmecorp', 'acme'} for "Acme Corp." """
+    words = re.findall(r'[a-z0-9]+', normalize(company))
+    names = {''.join(words)}
+    while words and words[-1] in LEGAL_SUFFIXES:
+        words = words[:-1]
+        names.add(''.join(words))
+    names.discard('')
+    return frozenset(names)
+
+
+def split_units(text: str, min_words: int = 3) -> List[str]:
+    return [unit.strip() for unit in _UNIT_RE.findall(text or '') if len(unit.split()) >= min_words]
+
+
+def page_units(page: Dict, max_units: int = 200) -> List[str]:
+    """Scorable text of a parsed page: reviews first, then description and content sentences"""
+    units = [str(review) for review in page.get('reviews') or [] if review]
+    for field in ('description', 'content'):
+        value = page.get(field)
+        if value and not str(value).startswith('No '):
+            units.extend(split_units(str(value)))
+    return units[:max_units]
+
+
+class SentimentScorer:
+    def __init__(self, n_features: int = 2 ** 18, model_path: Optional[str] = None, threshold: float = 0.25):
+        if n_features & (n_features - 1):
+            raise ValueError('n_features must be a power of two')
+        self.n_features = n_features
+        self.threshold = threshold
+        self._lexicon = np.zeros(n_features, dtype=np.float32)
+        for word, polarity in LEXICON.items():
+            self._lexicon[_bucket(word, n_features)] += polarity
+            self._lexicon[_bucket('not_' + word, n_features)] -= polarity
+        self.weights: Optional[np.ndarray] = None
+        self.bias: Optional[np.ndarray] = None
+        # Memoized feature -> bucket; cleared when it grows too large
+        self._buckets: Dict[str, int] = {}
+        if model_path:
+            self.load(model_path)
+
+    # -- features --------------------------------------------------------------
+
+    def vectorize(self, units: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """(bucket ids, unit index per id, value per id, token count per unit) for a batch"""
+        buckets = self._buckets
+        if len(buckets) > 500000:
+            buckets.clear()
+        ids, owners, lengths = [], [], []
+        for i, unit in enumerate(units):
+            tokens = features(unit)
+            lengths.append(len(tokens))
+            for token in tokens:
+                bucket = buckets.get(token)
+                if bucket is None:
+                    bucket = buckets[token] = _bucket(token, self.n_features)
+                ids.append(bucket)
+            owners.extend([i] * len(tokens))
+        lengths = np.array(lengths, dtype=np.float64)
+        owners = np.array(owners, dtype=np.int64)
+        # Length-normalized so long units don't dominate
+        values = 1.0 / np.sqrt(np.maximum(lengths, 1))[owners] if len(owners) else np.empty(0)
+        return np.array(ids, dtype=np.int64), owners, values, lengths
+
+    # -- scoring ---------------------------------------------------------------
+
+    def _logits(self, ids, owners, values, n: int) -> np.ndarray:
+        logits = np.empty((n, len(LABELS)))
+        for c in range(len(LABELS)):
+            logits[:, c] = np.bincount(owners, weights=self.weights[ids, c] * values, minlength=n)
+        return logits + self.bias
+
+    def score_batch(self, units: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Label index (0 negative, 1 neutral, 2 positive) and polarity score per unit"""
+        n = len(units)
+        if not n:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        ids, owners, values, _ = self.vectorize(units)
+        if self.weights is not None:
+            logits = self._logits(ids, owners, values, n)
+            probabilities = np.exp(logits - logits.max(axis=1, keepdims=True))
+            probabilities /= probabilities.sum(axis=1, keepdims=True)
+            return probabilities.argmax(axis=1), probabilities[:, 2] - probabilities[:, 0]
+        scores = np.bincount(owners, weights=self._lexicon[ids] * values, minlength=n)
+        labels = np.ones(n, dtype=np.int64)
+        labels[scores >= self.threshold] = 2
+        labels[scores <= -self.threshold] = 0
+        return labels, scores
+
+    def counts(self, units: List[str]) -> np.ndarray:
+        """Units per label (negative, neutral, positive)"""
+        labels, _ = self.score_batch(units)
+        return np.bincount(labels, minlength=len(LABELS))
+
+    # -- linear model ------------------------------------------------------------
+
+    def fit(self, units: List[str], labels: Iterable[str], epochs: int = 30, lr: float = 0.5,
+            l2: float = 1e-6) -> 'SentimentScorer':
+        """Train the multinomial linear model on labelled units (full-batch gradient descent)"""
+        y = np.array([LABELS.index(label) for label in labels], dtype=np.int64)
+        n = len(units)
+        ids, owners, values, _ = self.vectorize(units)
+        self.weights = np.zeros((self.n_features, len(LABELS)), dtype=np.float64)
+        self.bias = np.zeros(len(LABELS))
+        targets = np.eye(len(LABELS))[y]
+        for _ in range(epochs):
+            logits = self._logits(ids, owners, values, n)
+            probabilities = np.exp(logits - logits.max(axis=1, keepdims=True))
+            probabilities /= probabilities.sum(axis=1, keepdims=True)
+            error = (probabilities - targets) / n
+            for c in range(len(LABELS)):
+                gradient = np.bincount(ids, weights=error[owners, c] * values, minlength=self.n_features)
+                self.weights[:, c] -= lr * (gradient + l2 * self.weights[:, c])
+            self.bias -= lr * error.sum(axis=0)
+        self.weights = self.weights.astype(np.float32)
+        return self
+
+    def save(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        np.savez_compressed(path, weights=self.weights, bias=self.bias)
+
+    def load(self, path: str) -> None:
+        with np.load(path) as model:
+            weights, bias = model['weights'], model['bias']
+        if weights.shape != (self.n_features, len(LABELS)):
+            raise ValueError(f'Sentiment model {path} has shape {weights.shape}')
+        self.weights, self.bias = weights, bias
+
+
+def percentages(counts: Iterable[int]) -> List[int]:
+    """Whole percentages of ``counts`` summing to 100 (largest remainder method)"""
+    counts = [int(count) for count in counts]
+    total = sum(counts)
+    shares = [100.0 * count / total for count in counts]
+    result = [int(share) for share in shares]
+    by_remainder = sorted(range(len(shares)), key=lambda i: shares[i] - result[i], reverse=True)
+    for i in by_remainder[:100 - sum(result)]:
+        result[i] += 1
+    return result
+
+
+class SentimentProvider(MarketDataProvider):
+    """Per-company sentiment from the pages scraped so far.
+
+    With a ``directory`` the label counts per page are kept in a ``Journal``
+    (``pages.jsonl``) shared by all worker processes and replayed at start, so
+    every worker reports the same figures and they survive restarts.
+    """
+
+    name = 'sentiment'
+
+    def __init__(self, scorer: SentimentScorer, directory: Optional[str] = None, max_pages: int = 10000,
+                 max_deleted_ratio: float = 0.3):
+        """``directory`` holds the shared journal and must be private to this user"""
+        if directory:
+            try:
+                private_dir(directory)
+            except OSError as e:
+                logger.error('Sentiment counts kept in memory only: %s', e)
+                directory = None
+        self.scorer = scorer
+        self.directory = directory
+        self.max_pages = max_pages
+        self.max_deleted_ratio = max_deleted_ratio
+        self._lock = threading.RLock()
+        self._journal = Journal(os.path.join(directory, 'pages.jsonl'), 'sentiment journal') if directory else None
+        self._reset()
+        self._sync()
+
+    def _reset(self) -> None:
+        # url -> (registered name, company names when tagged, counts per label)
+        self._pages: 'OrderedDict[str, Tuple[str, Optional[frozenset], np.ndarray]]' = OrderedDict()
+        # Journal entries applied since the last restart, live or not
+        self._entries = 0
+
+    # -- journal ---------------------------------------------------------------
+
+    def _sync(self) -> None:
+        """Apply journal entries appended since the last sync, by any process"""
+        if self._journal is None:
+            return
+        with self._lock:
+            restart, entries = self._journal.read()
+            if restart:
+                self._reset()
+            for entry in entries:
+                try:
+                    self._apply(entry)
+                except (KeyError, TypeError, ValueError) as e:
+                    logger.warning('Skipping bad sentiment journal entry: %s', e)
+
+    def _write(self, entry: Dict) -> None:
+        """Record a change in the journal (when there is one) and apply it"""
+        if self._journal is not None and self._journal.append(entry):
+            self._sync()
+        else:
+            self._apply(entry)
+
+    def _apply(self, entry: Dict) -> None:
+        self._entries += 1
+        url = entry['url']
+        self._pages.pop(url, None)
+        if entry.get('removed'):
+            return
+        companies = entry.get('companies')
+        self._pages[url] = (entry['site'], frozenset(companies) if companies is not None else None,
+                            np.array(entry['counts'], dtype=np.int64))
+
+    def _needs_compaction(self) -> bool:
+        return self._entries - len(self._pages) > self.max_deleted_ratio * max(self._entries, 100)
+
+    def _compact(self) -> None:
+        """Rewrite the journal without replaced and removed pages"""
+        with self._journal.lock():
+            # Another process may have compacted already
+            self._sync()
+            if not self._needs_compaction():
+                return
+            self._journal.compact()
+            # _pages already holds just the latest entry of each live page
+            self._entries = len(self._pages)
+        logger.info('Compacted sentiment journal: %d pages', len(self._pages))
+
+    # -- updates ---------------------------------------------------------------
+
+    def add_page(self, page: Dict, company: Optional[str] = None) -> Optional[np.ndarray]:
+        """Score a parsed page, replacing the counts of its previous version.
+
+        ``company`` tags the page with the company it was scraped for; untagged
+        pages are attributed by their registered domain name.
+        """
+        url = page.get('url')
+        units = page_units(page)
+        if not url or not units:
+            return None
+        counts = self.scorer.counts(units)
+        names = company_names(company) if company else None
+        with self._lock:
+            self._sync()
+            self._write({
+                'url': url,
+                'site': registered_name(urlparse(url).hostname or ''),
+                'companies': sorted(names) if names is not None else None,
+                'counts': [int(count) for count in counts]
+            })
+            # Journal order is the same for every process, so they drop the same pages
+            while len(self._pages) > self.max_pages:
+                self._write({'url': next(iter(self._pages)), 'removed': True})
+            if self._journal is not None and self._needs_compaction():
+                self._compact()
+        return counts
+
+    def company_counts(self, company: str) -> Optional[np.ndarray]:
+        """Summed label counts of the pages tagged with ``company`` or registered under its name"""
+        names = company_names(company)
+        if not names:
+            return None
+        total = None
+        with self._lock:
+            self._sync()
+            pages = list(self._pages.values())
+        for site, tagged, counts in pages:
+            if (tagged & names) if tagged is not None else site in names:
+                total = counts.copy() if total is None else total + counts
+        return total
+
+    def distribution(self, company: str) -> Optional[Dict]:
+        counts = self.company_counts(company)
+        if counts is None or not counts.sum():
+            return None
+        result = dict(zip(LABELS[::-1], percentages(counts[::-1])))
+        result['mentions'] = int(counts.sum())
+        return result
+
+    def fetch(self, competitor: str, company: str, domain: str) -> Dict:
+        sentiment = {}
+        for name in (competitor, company):
+            distribution = self.distribution(name)
+            if distribution:
+                sentiment[name] = distribution
+        return {'sentiment_analysis': sentiment} if sentiment else {}
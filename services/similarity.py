@@ -0,0 +1,522 @@
+"""
+Offline similarity search and clustering over scraped competitor pages.
+
+Pages become hashed TF-IDF vectors: words from the page text plus detected
+technologies (``tech:<name>``) are hashed into ``n_features`` buckets, weighted
+by sublinear TF x IDF and L2-normalized. Vectors live in CSR arrays (with a
+CSC copy for queries), so
+
+- "most similar to X" gathers only the columns X uses and accumulates the
+  cosine scores with ``np.bincount`` (a whole batch of queries at once), and
+- clustering is spherical k-means with chunked sparse x dense products.
+
+No external embedding service is involved.
+
+With a ``directory`` the pages are kept in a JSON-lines ``Journal``
+(``pages.jsonl``) shared by all worker processes: every page is appended as
+its feature counts under a file lock, and each process replays what the
+others appended before it answers a query. The journal is compacted once
+re-scraped and removed pages make up too much of it. Every
+``checkpoint_bytes`` of journal, and after each compaction, the hashed
+feature rows are saved as a journal checkpoint (an ``.npz`` of CSR arrays and
+the site table), so a starting worker loads that and replays only the entries
+appended since.
+
+After an update the previous arrays keep answering queries while new ones are
+built in a background thread, at most ``rebuild_delay`` seconds later; a
+lookup that misses in stale arrays rebuilds them at once, so a site can be
+queried right after it was scraped.
+"""
+import bisect
+import io
+import json
+import logging
+import os
+import threading
+import zlib
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urlparse
+
+import numpy as np
+
+from utils.serialization import dumps
+from utils.storage import Journal, private_dir
+
+from .search_index import FIELD_WEIGHTS, _gather, page_text, tokenize
+
+logger = logging.getLogger(__name__)
+
+TECH_WEIGHT = 3
+
+
+def _bucket(feature: str, n_features: int) -> int:
+    return zlib.crc32(feature.encode('utf-8')) & (n_features - 1)
+
+
+class SimilarityEngine:
+    def __init__(self, directory: Optional[str] = None, n_features: int = 2 ** 18,
+                 max_deleted_ratio: float = 0.3, rebuild_delay: float = 2.0,
+                 checkpoint_bytes: int = 8 * 1024 * 1024):
+        """``directory`` holds the shared journal and must be private to this user"""
+        if n_features & (n_features - 1):
+            raise ValueError('n_features must be a power of two')
+        if directory:
+            try:
+                private_dir(directory)
+            except OSError as e:
+                logger.error('Similarity index kept in memory only: %s', e)
+                directory = None
+        self.directory = directory
+        self.n_features = n_features
+        self.max_deleted_ratio = max_deleted_ratio
+        self.rebuild_delay = rebuild_delay
+        self.checkpoint_bytes = checkpoint_bytes
+        self._lock = threading.RLock()
+        self._journal = Journal(os.path.join(directory, 'pages.jsonl'), 'similarity journal') if directory else None
+        # Bumped by every change; the matrix is stale while _built lags behind
+        self._generation = 0
+        self._matrix = None
+        self._built = -1
+        self._rebuild_timer = None
+        self._reset()
+        self._sync()
+
+    def _reset(self) -> None:
+        self._rows: List[Optional[Dict]] = []
+        self._features: List[Optional[tuple]] = []
+        self._url_rows: Dict[str, int] = {}
+        # One readable token per hash bucket, for describing clusters
+        self._names: Dict[int, str] = {}
+        self._generation += 1
+
+    # -- journal ---------------------------------------------------------------
+
+    def _sync(self) -> None:
+        """Apply journal entries appended since the last sync, by any process"""
+        if self._journal is None:
+            return
+        with self._lock:
+            restart, entries = self._journal.read()
+            if restart:
+                self._reset()
+                checkpoint = self._journal.take_checkpoint()
+                if checkpoint is not None and not self._restore(checkpoint):
+                    self._journal.rewind()
+                    self._reset()
+                    restart, entries = self._journal.read()
+            for entry in entries:
+                try:
+                    self._apply(entry)
+                except (KeyError, TypeError, ValueError) as e:
+                    logger.warning('Skipping bad similarity journal entry: %s', e)
+            if self._journal.checkpoint_due(self.checkpoint_bytes):
+                self._save_checkpoint()
+
+    def _save_checkpoint(self) -> None:
+        """Save the feature rows as the journal's checkpoint (call under the lock, right after ``_sync``)"""
+        live = [f for f in self._features if f is not None]
+        names = list(self._names.items())
+        out = io.BytesIO()
+        np.savez(
+            out,
+            rows=np.frombuffer(dumps(self._rows), dtype=np.uint8),
+            # -1 marks a replaced or removed row
+            lengths=np.array([len(f[0]) if f is not None else -1 for f in self._features], dtype=np.int64),
+            indices=np.concatenate([f[0] for f in live] or [np.empty(0, np.int32)]),
+            values=np.concatenate([f[1] for f in live] or [np.empty(0, np.float32)]),
+            buckets=np.array([bucket for bucket, _ in names], dtype=np.int64),
+            names=np.frombuffer(dumps([name for _, name in names]), dtype=np.uint8),
+        )
+        self._journal.save_checkpoint(out.getvalue())
+
+    def _restore(self, checkpoint: bytes) -> bool:
+        """Load the feature rows from a journal checkpoint; False if it cannot be used"""
+        try:
+            with np.load(io.BytesIO(checkpoint), allow_pickle=False) as arrays:
+                rows = json.loads(arrays['rows'].tobytes())
+                lengths = arrays['lengths']
+                indices = arrays['indices'].astype(np.int32, copy=False)
+                values = arrays['values'].astype(np.float32, copy=False)
+                buckets = arrays['buckets'].tolist()
+                names = json.loads(arrays['names'].tobytes())
+            if len(rows) != len(lengths) or len(buckets) != len(names) \
+                    or int(np.maximum(lengths, 0).sum()) != len(indices) or len(indices) != len(values):
+                raise ValueError('inconsistent arrays')
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning('Replaying the whole similarity journal: bad checkpoint: %s', e)
+            return False
+        ends = np.cumsum(np.maximum(lengths, 0)).tolist()
+        features, start = [], 0
+        for length, end in zip(lengths.tolist(), ends):
+            features.append((indices[start:end], values[start:end]) if length >= 0 else None)
+            start = end
+        self._rows, self._features = rows, features
+        self._url_rows = {row['url']: i for i, row in enumerate(rows) if row is not None}
+        self._names = dict(zip(buckets, names))
+        self._generation += 1
+        return True
+
+    def _write(self, entry: Dict) -> None:
+        """Record a change in the journal (when there is one) and apply it"""
+        if self._journal is not None and self._journal.append(entry):
+            self._sync()
+        else:
+            self._apply(entry)
+
+    def _needs_compaction(self) -> bool:
+        return len(self._rows) - len(self._url_rows) > self.max_deleted_ratio * max(len(self._rows), 100)
+
+    def _drop_replaced(self) -> None:
+        self._rows, self._features = ([r for r in self._rows if r is not None],
+                                      [f for f in self._features if f is not None])
+        self._url_rows = {row['url']: i for i, row in enumerate(self._rows)}
+        self._generation += 1
+
+    def _compact(self) -> None:
+        """Drop replaced and removed pages: from the journal, or from memory without one"""
+        if self._journal is None:
+            self._drop_replaced()
+            return
+        with self._journal.lock():
+            # Another process may have compacted already
+            self._sync()
+            if not self._needs_compaction():
+                return
+            self._journal.compact()
+            self._drop_replaced()
+            self._save_checkpoint()
+        logger.info('Compacted similarity journal: %d live sites', len(self._url_rows))
+
+    # -- updates ---------------------------------------------------------------
+
+    def features(self, page: Dict) -> Counter:
+        """Weighted feature counts of a parsed page: words and ``tech:<name>``"""
+        counts = Counter()
+        for field, weight in FIELD_WEIGHTS:
+            for token in tokenize(page_text(page, field)):
+                counts[token] += weight
+        for tech in page.get('technologies') or []:
+            counts[f'tech:{str(tech).lower()}'] += TECH_WEIGHT
+        return counts
+
+    def vectorize(self, counts: Dict[str, float]) -> tuple:
+        """Hashed (feature indices, term counts) of feature counts"""
+        buckets = Counter()
+        for feature, count in counts.items():
+            bucket = _bucket(feature, self.n_features)
+            buckets[bucket] += count
+            self._names.setdefault(bucket, feature)
+        indices = np.fromiter(buckets.keys(), dtype=np.int32, count=len(buckets))
+        values = np.fromiter(buckets.values(), dtype=np.float32, count=len(buckets))
+        order = np.argsort(indices)
+        return indices[order], values[order]
+
+    def add_page(self, page: Dict, domain: Optional[str] = None) -> Optional[int]:
+        url = page.get('url')
+        if not url:
+            return None
+        counts = self.features(page)
+        if not counts:
+            return None
+        with self._lock:
+            self._sync()
+            previous = self._url_rows.get(url)
+            if previous is not None:
+                # Keep the domain a re-scraped site was tagged with
+                domain = domain or self._rows[previous]['domain']
+            self._write({'url': url, 'title': page.get('title') or url, 'domain': domain, 'features': counts})
+            if self._needs_compaction():
+                self._compact()
+            return self._url_rows.get(url)
+
+    def remove_page(self, url: str) -> bool:
+        with self._lock:
+            self._sync()
+            if url not in self._url_rows:
+                return False
+            self._write({'url': url, 'removed': True})
+            return True
+
+    def _apply(self, entry: Dict) -> None:
+        url = entry['url']
+        previous = self._url_rows.pop(url, None)
+        if previous is not None:
+            self._rows[previous] = self._features[previous] = None
+        self._generation += 1
+        if entry.get('removed'):
+            return
+        features = self.vectorize(entry['features'])
+        row_id = len(self._rows)
+        self._rows.append({'url': url, 'title': entry['title'], 'domain': entry['domain']})
+        self._features.append(features)
+        self._url_rows[url] = row_id
+
+    # -- matrix ----------------------------------------------------------------
+
+    @property
+    def _stale(self) -> bool:
+        return self._built != self._generation
+
+    def _build(self, fresh: bool = False) -> Dict:
+        """TF-IDF CSR/CSC arrays over the live rows.
+
+        Stale arrays are returned (and rebuilt in the background) unless
+        ``fresh`` is set or there are none yet.
+        """
+        with self._lock:
+            self._sync()
+            if self._matrix is not None and not (fresh and self._stale):
+                if self._stale:
+                    self._schedule_rebuild()
+                return self._matrix
+        return self._rebuild()
+
+    def _schedule_rebuild(self) -> None:
+        """Rebuild the arrays ``rebuild_delay`` seconds from now (call under the lock)"""
+        if self._rebuild_timer is None:
+            self._rebuild_timer = threading.Timer(self.rebuild_delay, self._background_rebuild)
+            self._rebuild_timer.daemon = True
+            self._rebuild_timer.start()
+
+    def _background_rebuild(self) -> None:
+        with self._lock:
+            self._rebuild_timer = None
+        try:
+            self._rebuild()
+        except Exception:
+            logger.exception('Could not rebuild the similarity matrix')
+
+    def _rebuild(self) -> Dict:
+        with self._lock:
+            self._sync()
+            generation = self._generation
+            row_ids = np.array([i for i, f in enumerate(self._features) if f is not None], dtype=np.int64)
+            lengths = np.array([len(self._features[i][0]) for i in row_ids], dtype=np.int64)
+            indices = np.concatenate([self._features[i][0] for i in row_ids] or [np.empty(0, np.int32)])
+            counts = np.concatenate([self._features[i][1] for i in row_ids] or [np.empty(0, np.float32)])
+            # Queries describe rows from this snapshot; a journal replay may renumber self._rows meanwhile
+            rows = [self._rows[i] for i in row_ids]
+
+        n_rows = len(row_ids)
+        indptr = np.concatenate(([0], np.cumsum(lengths)))
+        df = np.bincount(indices, minlength=self.n_features)
+        idf = (np.log((1 + n_rows) / (1 + df)) + 1).astype(np.float32)
+        data = (1 + np.log(counts)) * idf[indices]
+        if n_rows:
+            norms = np.sqrt(np.add.reduceat(data * data, indptr[:-1]))
+            data /= np.repeat(norms, lengths)
+
+        row_of_nnz = np.repeat(np.arange(n_rows), lengths)
+        order = np.argsort(indices, kind='stable')
+        hosts = [urlparse(row['url']).hostname or '' for row in rows]
+        matrix = {
+            'rows': rows,
+            'urls': {row['url']: p for p, row in enumerate(rows)},
+            # Newline-joined lookup text with the start offset of each row, for substring search
+            'hosts': self._joined(hosts),
+            'urls_text': self._joined([row['url'].lower() for row in rows]),
+            'titles': self._joined([row['title'].lower().replace(' ', '').replace('\n', '') for row in rows]),
+            'indptr': indptr,
+            'indices': indices,
+            'data': data,
+            'row_of_nnz': row_of_nnz,
+            'colptr': np.concatenate(([0], np.cumsum(df))),
+            'csc_rows': row_of_nnz[order],
+            'csc_data': data[order],
+        }
+        with self._lock:
+            if generation > self._built:
+                self._matrix, self._built = matrix, generation
+        return matrix
+
+    # -- queries ---------------------------------------------------------------
+
+    @staticmethod
+    def _joined(values: List[str]) -> tuple:
+        starts, offset = [], 0
+        for value in values:
+            starts.append(offset)
+            offset += len(value) + 1
+        return '\n'.join(values), starts
+
+    @staticmethod
+    def _search(joined: tuple, needle: str) -> Optional[int]:
+        """Position of the first row whose text contains ``needle``"""
+        text, starts = joined
+        offset = text.find(needle)
+        return None if offset < 0 else bisect.bisect_right(starts, offset) - 1
+
+    @classmethod
+    def _find(cls, matrix: Dict, name_or_url: str) -> Optional[int]:
+        """Matrix position of a URL, or of a company name found in a site's
+        hostname (preferred), title or URL"""
+        position = matrix['urls'].get(name_or_url)
+        if position is not None:
+            return position
+        needle = name_or_url.lower().replace(' ', '')
+        if not needle or '\n' in needle:
+            return None
+        position = cls._search(matrix['hosts'], needle)
+        if position is not None:
+            return position
+        matches = [p for p in (cls._search(matrix['urls_text'], needle), cls._search(matrix['titles'], needle))
+                   if p is not None]
+        return min(matches) if matches else None
+
+    def _locate(self, queries: List[str]) -> tuple:
+        """(matrix, [(query, position)]) for the queries found, rebuilding stale arrays on a miss"""
+        matrix = self._build()
+        found = [(q, self._find(matrix, q)) for q in queries]
+        if self._stale and any(p is None for _, p in found):
+            # The site may have been scraped since the arrays were built
+            matrix = self._build(fresh=True)
+            found = [(q, self._find(matrix, q)) for q in queries]
+        return matrix, [(q, p) for q, p in found if p is not None]
+
+    def find(self, name_or_url: str) -> Optional[Dict]:
+        """The site for a URL or company name, if it has been scraped"""
+        matrix, found = self._locate([name_or_url])
+        return dict(matrix['rows'][found[0][1]]) if found else None
+
+    def most_similar_batch(self, queries: Iterable[str], k: int = 10, domain: Optional[str] = None) -> Dict[str, List]:
+        """Top-k cosine neighbours for several sites at once"""
+        queries = list(queries)
+        matrix, found = self._locate(queries)
+        results = {q: [] for q in queries}
+        results.update(self._neighbours(matrix, found, k, domain))
+        return results
+
+    @staticmethod
+    def _neighbours(matrix: Dict, found: List[tuple], k: int, domain: Optional[str]) -> Dict[str, List]:
+        """Top-k neighbours of each (query, matrix position)"""
+        results = {}
+        if not found:
+            return results
+
+        n_rows = len(matrix['rows'])
+        positions = np.array([p for _, p in found], dtype=np.int64)
+        indptr = matrix['indptr']
+        q_lengths = indptr[positions + 1] - indptr[positions]
+        q_nnz = _gather(indptr[positions], q_lengths)
+        q_of_nnz = np.repeat(np.arange(len(found)), q_lengths)
+        q_features = matrix['indices'][q_nnz]
+        q_weights = matrix['data'][q_nnz]
+
+        # Gather every (query, row) product through the CSC columns each query touches
+        colptr = matrix['colptr']
+        col_lengths = colptr[q_features + 1] - colptr[q_features]
+        pos = _gather(colptr[q_features], col_lengths)
+        rows = matrix['csc_rows'][pos]
+        weights = matrix['csc_data'][pos] * np.repeat(q_weights, col_lengths)
+        owners = np.repeat(q_of_nnz, col_lengths)
+        scores = np.bincount(owners * n_rows + rows, weights=weights,
+                             minlength=len(found) * n_rows).reshape(len(found), n_rows)
+
+        scores[np.arange(len(found)), positions] = -1
+        if domain is not None:
+            in_domain = np.array([row['domain'] == domain for row in matrix['rows']], dtype=bool)
+            scores[:, ~in_domain] = -1
+        top = min(k, n_rows)
+        for (query, _), row_scores in zip(found, scores):
+            candidates = np.argpartition(-row_scores, top - 1)[:top] if top < n_rows else np.arange(n_rows)
+            candidates = candidates[np.argsort(-row_scores[candidates], kind='stable')]
+            results[query] = [
+                {**matrix['rows'][c], 'score': round(float(row_scores[c]), 4)}
+                for c in candidates if row_scores[c] > 0
+            ]
+        return results
+
+    def most_similar(self, name_or_url: str, k: int = 10, domain: Optional[str] = None) -> Optional[List[Dict]]:
+        matrix, found = self._locate([name_or_url])
+        if not found:
+            return None
+        return self._neighbours(matrix, found, k, domain)[name_or_url]
+
+    def _products(self, data, indices, indptr, centroids, chunk_nnz=1 << 18) -> np.ndarray:
+        """Dense (rows x k) products of CSR rows with dense centroids, chunked by nnz"""
+        n_rows = len(indptr) - 1
+        sims = np.zeros((n_rows, len(centroids)), dtype=np.float32)
+        start = 0
+        while start < n_rows:
+            end = int(np.searchsorted(indptr, indptr[start] + chunk_nnz, side='right')) - 1
+            end = min(max(end, start + 1), n_rows)
+            lo, hi = indptr[start], indptr[end]
+            if hi > lo:
+                products = centroids[:, indices[lo:hi]] * data[lo:hi]
+                nonempty = indptr[start:end] < indptr[start + 1:end + 1]
+                sums = np.add.reduceat(products, indptr[start:end][nonempty] - lo, axis=1)
+                sims[np.arange(start, end)[nonempty]] = sums.T
+            start = end
+        return sims
+
+    def clusters(self, domain: Optional[str] = None, k: int = 8, iterations: int = 25, seed: int = 0) -> List[Dict]:
+        """Spherical k-means over the sites of a domain (or all sites)"""
+        matrix = self._build()
+        selected = np.array([p for p, row in enumerate(matrix['rows'])
+                             if domain is None or row['domain'] == domain], dtype=np.int64)
+        if not len(selected):
+            return []
+        k = max(1, min(k, len(selected)))
+
+        indptr = matrix['indptr']
+        lengths = indptr[selected + 1] - indptr[selected]
+        nnz = _gather(indptr[selected], lengths)
+        sub_indptr = np.concatenate(([0], np.cumsum(lengths)))
+        indices, data = matrix['indices'][nnz], matrix['data'][nnz]
+        sub_row_of_nnz = np.repeat(np.arange(len(selected)), lengths)
+
+        def centroid_of(row):
+            vector = np.zeros(self.n_features, dtype=np.float32)
+            lo, hi = sub_indptr[row], sub_indptr[row + 1]
+            vector[indices[lo:hi]] = data[lo:hi]
+            return vector
+
+        # k-means++ seeding on cosine distance
+        rng = np.random.default_rng(seed)
+        centroids = np.zeros((k, self.n_features), dtype=np.float32)
+        centroids[0] = centroid_of(int(rng.integers(len(selected))))
+        best = self._products(data, indices, sub_indptr, centroids[:1])[:, 0]
+        for c in range(1, k):
+            distance = np.clip(1 - best, 0, None) ** 2
+            total = distance.sum()
+            row = int(rng.choice(len(selected), p=distance / total)) if total > 0 else int(rng.integers(len(selected)))
+            centroids[c] = centroid_of(row)
+            best = np.maximum(best, self._products(data, indices, sub_indptr, centroids[c:c + 1])[:, 0])
+
+        assignment = None
+        for _ in range(iterations):
+            sims = self._products(data, indices, sub_indptr, centroids)
+            new_assignment = sims.argmax(axis=1)
+            if assignment is not None and np.array_equal(new_assignment, assignment):
+                break
+            assignment = new_assignment
+            sums = np.bincount(assignment[sub_row_of_nnz] * self.n_features + indices, weights=data,
+                               minlength=k * self.n_features).reshape(k, self.n_features)
+            norms = np.linalg.norm(sums, axis=1)
+            for c in np.flatnonzero(norms == 0):
+                # Re-seed an empty cluster with the worst-fitting site
+                worst = int(np.argmin(sims[np.arange(len(selected)), assignment]))
+                sums[c] = centroid_of(worst)
+                norms[c] = 1.0
+            centroids = (sums / norms[:, None]).astype(np.float32)
+
+        sims = sims[np.arange(len(selected)), assignment]
+        clusters = []
+        for c in range(k):
+            members = np.flatnonzero(assignment == c)
+            if not len(members):
+                continue
+            members = members[np.argsort(-sims[members], kind='stable')]
+            top_features = np.argsort(-centroids[c])[:8]
+            clusters.append({
+                'size': int(len(members)),
+                'top_terms': [self._names.get(int(f), f'#{f}') for f in top_features if centroids[c, f] > 0],
+                'members': [{**matrix['rows'][selected[m]], 'score': round(float(sims[m]), 4)}
+                            for m in members],
+            })
+        return sorted(clusters, key=lambda c: c['size'], reverse=True)
+
+    def __len__(self) -> int:
+        self._sync()
+        return len(self._url_rows)
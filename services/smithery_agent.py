@@ -7,6 +7,8 @@ from services.tools.screenshot_tool import ScreenshotTool
 from services.tools.notion_tool import NotionClient
 from services.tools.slack_tool import SlackClient
 from services.openai_service import OpenAIService
+from utils.metrics import IN_FLIGHT, STAGE_LATENCY
+from utils.tracing import span
 
 logger = logging.getLogger(__name__)
 
@@ -19,12 +21,13 @@ class SmitheryAgent:
     - If an integration key is missing, the agent logs and continues using fallback behavior.
     """
 
-    def __init__(self):
-        self.scraper = WebScraper()
+    def __init__(self, ai: OpenAIService = None, snapshot_store=None):
+        self.scraper = WebScraper(snapshot_store=snapshot_store)
+        self.snapshot_store = snapshot_store
         self.screenshot = ScreenshotTool()
         self.notion = NotionClient()
         self.slack = SlackClient()
-        self.ai = OpenAIService()
+        self.ai = ai or OpenAIService()
 
     def run_command(self, command: str) -> dict:
         """Parse a high-level command and execute the demo workflow.
@@ -32,6 +35,11 @@ class SmitheryAgent:
         Expected demo command pattern (example):
         "Analyze our competitors Acme Corp and Globex for their latest pricing and features, then update the Notion report and notify the team on Slack."
         """
+        with span('agent.run_command'), IN_FLIGHT.track_inprogress(kind='agent_runs'), \
+                STAGE_LATENCY.time(stage='agent_run'):
+            return self._run_command(command)
+
+    def _run_command(self, command: str) -> dict:
         logger.info("Agent received command: %s", command)
         steps = []
 
@@ -55,17 +63,31 @@ class SmitheryAgent:
         gathered = {}
         for c in target_companies:
             logger.info("Scraping data for %s", c)
-            page_data = self.scraper.autonomous_gather(c)
+            with STAGE_LATENCY.time(stage='agent_scrape'):
+                page_data = self.scraper.autonomous_gather(c)
             logger.info("Screenshotting %s", c)
-            shot = self.screenshot.capture(c, page_data.get('url'))
+            with STAGE_LATENCY.time(stage='agent_screenshot'):
+                shot = self.screenshot.capture(c, page_data.get('url'))
             gathered[c] = {**page_data, 'screenshot': shot}
             steps.append(f"Gathered data and screenshot for {c}")
 
-        # Step 2: run AI analysis for the pair
+        # Step 2: run AI analysis for the pair, unless no page changed since the last run
+        snapshot_ids = [gathered[c].get('snapshot', {}).get('id') for c in target_companies]
+        result_key = 'agent:' + '|'.join(target_companies)
+        previous = None
+        if self.snapshot_store is not None and all(snapshot_ids):
+            previous = self.snapshot_store.reusable_result(result_key, snapshot_ids)
         try:
-            logger.info("Running AI analysis")
-            analysis = self.ai.analyze_competitor_data(competitor_company=target_companies[0], your_company=target_companies[1], product_domain='general', market_data=gathered)
-            steps.append("AI analysis completed")
+            if previous is not None:
+                analysis = previous['result']
+                steps.append("AI analysis reused (no material change)")
+            else:
+                logger.info("Running AI analysis")
+                with span('agent.ai_analysis'):
+                    analysis = self.ai.analyze_competitor_data(competitor_company=target_companies[0], your_company=target_companies[1], product_domain='general', market_data=gathered)
+                if self.snapshot_store is not None and all(snapshot_ids):
+                    self.snapshot_store.remember_result(result_key, snapshot_ids, analysis)
+                steps.append("AI analysis completed")
         except Exception as e:
             logger.exception("AI analysis failed")
             analysis = {
@@ -0,0 +1,322 @@
+"""
+Snapshots of scraped competitor pages with change detection.
+
+Parsed pages are serialized canonically and split with content-defined
+chunking (a gear rolling hash), so successive scrapes of the same site share
+every chunk outside the edited region. Chunks are zlib-compressed and stored
+once by content hash; a snapshot is just the list of its chunk hashes.
+
+``structural_diff`` compares the fields that matter for analysis (title,
+description, content, meta_data, navigation, technologies). Analyses can be
+remembered against the snapshots they were based on and reused while those
+pages show no material change.
+
+``gc`` bounds the store: it keeps the last ``max_history`` entries per URL,
+drops remembered analyses older than ``retention`` and deletes snapshots and
+chunks nothing references any more. It runs from ``record`` every
+``gc_interval`` seconds, under an exclusive lock that writers take shared.
+"""
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from utils.storage import file_lock
+
+logger = logging.getLogger(__name__)
+
+STRUCTURAL_FIELDS = ('title', 'description', 'content', 'meta_data', 'navigation', 'technologies')
+
+# Unreferenced snapshots and chunks younger than this may belong to a record in progress
+GC_GRACE = 3600
+
+# Meta tags that change on every request without the page changing
+VOLATILE_META = frozenset({
+    'csrf-token', 'csrf-param', 'request-id', 'og:updated_time',
+    'article:modified_time', 'last-modified', 'date',
+})
+
+_MASK64 = (1 << 64) - 1
+_rng = random.Random(0x7A11)
+_GEAR = [_rng.getrandbits(64) for _ in range(256)]
+
+
+def chunk_boundaries(data: bytes, min_size: int = 512, avg_size: int = 2048, max_size: int = 8192) -> List[int]:
+    """End offsets of content-defined chunks of ``data``"""
+    # Test the high bits: they depend on the last 64 bytes, the low bits only on the last few
+    bits = max(1, avg_size.bit_length() - 1)
+    mask = ((1 << bits) - 1) << (64 - bits)
+    gear = _GEAR
+    boundaries = []
+    start = 0
+    h = 0
+    for i, byte in enumerate(data):
+        h = ((h << 1) + gear[byte]) & _MASK64
+        length = i + 1 - start
+        if (length >= min_size and not (h & mask)) or length >= max_size:
+            boundaries.append(i + 1)
+            start = i + 1
+            h = 0
+    if start < len(data):
+        boundaries.append(len(data))
+    return boundaries
+
+
+def canonical_bytes(data: Dict) -> bytes:
+    # One value per line keeps an edit from shifting every later chunk
+    return json.dumps(data, sort_keys=True, indent=1, ensure_ascii=False, default=str).encode('utf-8')
+
+
+def _text(value) -> str:
+    return ' '.join(str(value or '').split())
+
+
+def _nav_key(item) -> str:
+    if isinstance(item, dict):
+        return f"{item.get('text', '')} -> {item.get('href', '')}"
+    return str(item)
+
+
+def structural_diff(old: Optional[Dict], new: Dict) -> Dict:
+    """Changes between two parsed pages, limited to ``STRUCTURAL_FIELDS``.
+
+    Returns an empty dict when nothing material changed.
+    """
+    old = old or {}
+    diff = {}
+
+    for field in ('title', 'description'):
+        if _text(old.get(field)) != _text(new.get(field)):
+            diff[field] = {'from': old.get(field), 'to': new.get(field)}
+
+    # Page bodies are long; report their sizes rather than both texts
+    old_content, new_content = _text(old.get('content')), _text(new.get('content'))
+    if old_content != new_content:
+        diff['content'] = {'from_chars': len(old_content), 'to_chars': len(new_content)}
+
+    old_meta = {k: v for k, v in (old.get('meta_data') or {}).items() if k.lower() not in VOLATILE_META}
+    new_meta = {k: v for k, v in (new.get('meta_data') or {}).items() if k.lower() not in VOLATILE_META}
+    meta = {
+        'added': {k: new_meta[k] for k in new_meta.keys() - old_meta.keys()},
+        'removed': sorted(old_meta.keys() - new_meta.keys()),
+        'changed': {k: {'from': old_meta[k], 'to': new_meta[k]}
+                    for k in old_meta.keys() & new_meta.keys() if old_meta[k] != new_meta[k]},
+    }
+    if any(meta.values()):
+        diff['meta_data'] = meta
+
+    for field, key in (('navigation', _nav_key), ('technologies', str)):
+        before = {key(item) for item in old.get(field) or []}
+        after = {key(item) for item in new.get(field) or []}
+        if before != after:
+            diff[field] = {'added': sorted(after - before), 'removed': sorted(before - after)}
+
+    return diff
+
+
+class SnapshotStore:
+    def __init__(self, directory: str, min_chunk: int = 512, avg_chunk: int = 2048, max_chunk: int = 8192,
+                 max_history: int = 100, retention: float = 30 * 86400, gc_interval: float = 3600):
+        self.directory = directory
+        self.chunk_sizes = (min_chunk, avg_chunk, max_chunk)
+        self.max_history = max_history
+        self.retention = retention
+        self.gc_interval = gc_interval
+        self._lock = threading.Lock()
+        self._latest = {}
+        self._next_gc = time.time() + gc_interval
+
+    def _path(self, *parts: str) -> str:
+        return os.path.join(self.directory, *parts)
+
+    @staticmethod
+    def _url_key(url: str) -> str:
+        return hashlib.sha1(url.strip().rstrip('/').lower().encode('utf-8')).hexdigest()
+
+    # -- chunk storage ---------------------------------------------------------
+
+    def _put_chunk(self, chunk: bytes) -> Tuple[str, int]:
+        digest = hashlib.sha256(chunk).hexdigest()
+        path = self._path('chunks', digest[:2], digest)
+        if os.path.exists(path):
+            # Refresh the mtime so gc's grace period covers chunks reused by a new snapshot
+            os.utime(path)
+            return digest, 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        compressed = zlib.compress(chunk, 6)
+        with open(path + '.tmp', 'wb') as fh:
+            fh.write(compressed)
+        os.replace(path + '.tmp', path)
+        return digest, len(compressed)
+
+    def _get_chunk(self, digest: str) -> bytes:
+        with open(self._path('chunks', digest[:2], digest), 'rb') as fh:
+            return zlib.decompress(fh.read())
+
+    # -- snapshots -------------------------------------------------------------
+
+    def record(self, url: str, data: Dict) -> Dict:
+        """Store a parsed page and report how it differs from the previous one"""
+        body = canonical_bytes(data)
+        snapshot_id = hashlib.sha256(body).hexdigest()[:32]
+        url_key = self._url_key(url)
+        previous = self.latest(url)
+
+        with self._lock, file_lock(self._path('.gc.lock'), shared=True):
+            stored = 0
+            manifest_path = self._path('snapshots', snapshot_id + '.json')
+            if not os.path.exists(manifest_path):
+                chunks = []
+                start = 0
+                for end in chunk_boundaries(body, *self.chunk_sizes):
+                    digest, written = self._put_chunk(body[start:end])
+                    chunks.append(digest)
+                    stored += written
+                    start = end
+                os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+                with open(manifest_path, 'w', encoding='utf-8') as fh:
+                    json.dump({'url': url, 'size': len(body), 'chunks': chunks}, fh)
+
+            diff = {}
+            if previous is not None and previous['id'] != snapshot_id:
+                diff = structural_diff(self.load(previous['id']), data)
+            entry = {
+                'id': snapshot_id,
+                'url': url,
+                'ts': time.time(),
+                'size': len(body),
+                'stored_bytes': stored,
+                'changed': previous is None or bool(diff),
+                'diff': diff,
+                'previous': previous['id'] if previous else None,
+            }
+            os.makedirs(self._path('urls'), exist_ok=True)
+            with open(self._path('urls', url_key + '.jsonl'), 'a', encoding='utf-8') as fh:
+                fh.write(json.dumps(entry, default=str) + '\n')
+            self._latest[url_key] = entry
+        logger.info('Snapshot %s for %s: %d bytes, %d new bytes stored, changed=%s',
+                    snapshot_id[:12], url, len(body), stored, entry['changed'])
+        if time.time() >= self._next_gc:
+            self._next_gc = time.time() + self.gc_interval
+            try:
+                self.gc()
+            except OSError as e:
+                logger.warning('Snapshot garbage collection failed: %s', e)
+        return entry
+
+    def load(self, snapshot_id: str) -> Dict:
+        with open(self._path('snapshots', snapshot_id + '.json'), encoding='utf-8') as fh:
+            manifest = json.load(fh)
+        return json.loads(b''.join(self._get_chunk(d) for d in manifest['chunks']))
+
+    def history(self, url: str) -> List[Dict]:
+        try:
+            with open(self._path('urls', self._url_key(url) + '.jsonl'), encoding='utf-8') as fh:
+                return [json.loads(line) for line in fh if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def latest(self, url: str) -> Optional[Dict]:
+        url_key = self._url_key(url)
+        entry = self._latest.get(url_key)
+        if entry is None:
+            entries = self.history(url)
+            if entries:
+                entry = self._latest[url_key] = entries[-1]
+        return entry
+
+    # -- analysis reuse --------------------------------------------------------
+
+    def _result_path(self, key: str) -> str:
+        return self._path('results', hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+    def remember_result(self, key: str, snapshot_ids: Iterable[str], result: Dict) -> None:
+        """Remember an analysis together with the snapshots it was based on"""
+        path = self._result_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'w', encoding='utf-8') as fh:
+            json.dump({'key': key, 'ts': time.time(), 'snapshots': list(snapshot_ids), 'result': result},
+                      fh, default=str)
+        os.replace(path + '.tmp', path)
+
+    def reusable_result(self, key: str, snapshot_ids: Iterable[str]) -> Optional[Dict]:
+        """The remembered analysis for ``key`` if none of its pages changed materially"""
+        try:
+            with open(self._result_path(key), encoding='utf-8') as fh:
+                saved = json.load(fh)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        snapshot_ids = list(snapshot_ids)
+        if len(snapshot_ids) != len(saved['snapshots']):
+            return None
+        for base_id, current_id in zip(saved['snapshots'], snapshot_ids):
+            if base_id == current_id:
+                continue
+            try:
+                if structural_diff(self.load(base_id), self.load(current_id)):
+                    return None
+            except (OSError, ValueError) as e:
+                logger.warning('Could not compare snapshots %s and %s: %s', base_id, current_id, e)
+                return None
+        return {'result': saved['result'], 'ts': saved['ts'], 'snapshots': saved['snapshots']}
+
+    # -- retention -------------------------------------------------------------
+
+    @staticmethod
+    def _files(directory: str) -> List[str]:
+        paths = []
+        for root, _, names in os.walk(directory):
+            paths.extend(os.path.join(root, name) for name in names if not name.endswith('.tmp'))
+        return paths
+
+    def gc(self) -> Dict:
+        """Trim URL histories, expire old analyses and delete unreferenced snapshots and chunks"""
+        now = time.time()
+        removed = {'history_entries': 0, 'results': 0, 'snapshots': 0, 'chunks': 0}
+        with file_lock(self._path('.gc.lock')):
+            live = set()
+            for path in self._files(self._path('urls')):
+                with open(path, encoding='utf-8') as fh:
+                    lines = [line for line in fh if line.strip()]
+                if len(lines) > self.max_history:
+                    removed['history_entries'] += len(lines) - self.max_history
+                    lines = lines[-self.max_history:]
+                    with open(path + '.tmp', 'w', encoding='utf-8') as fh:
+                        fh.writelines(lines)
+                    os.replace(path + '.tmp', path)
+                live.update(json.loads(line)['id'] for line in lines)
+
+            for path in self._files(self._path('results')):
+                try:
+                    with open(path, encoding='utf-8') as fh:
+                        saved = json.load(fh)
+                except ValueError:
+                    saved = {'ts': 0}
+                if now - saved.get('ts', 0) > self.retention:
+                    os.remove(path)
+                    removed['results'] += 1
+                else:
+                    live.update(saved['snapshots'])
+
+            chunks = set()
+            for path in self._files(self._path('snapshots')):
+                snapshot_id = os.path.basename(path)[:-len('.json')]
+                if snapshot_id not in live and now - os.path.getmtime(path) > GC_GRACE:
+                    os.remove(path)
+                    removed['snapshots'] += 1
+                    continue
+                with open(path, encoding='utf-8') as fh:
+                    chunks.update(json.load(fh)['chunks'])
+
+            for path in self._files(self._path('chunks')):
+                if os.path.basename(path) not in chunks and now - os.path.getmtime(path) > GC_GRACE:
+                    os.remove(path)
+                    removed['chunks'] += 1
+        logger.info('Snapshot gc removed %s', removed)
+        return removed
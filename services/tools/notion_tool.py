@@ -2,6 +2,8 @@ import os
 import logging
 from typing import List, Dict
 
+from utils.tracing import traced
+
 logger = logging.getLogger(__name__)
 
 
@@ -13,6 +15,7 @@ class NotionClient:
     def is_configured(self) -> bool:
         return bool(self.api_key and self.database_id)
 
+    @traced('notion.upsert_analysis')
     def upsert_analysis(self, companies: List[str], analysis: Dict, gathered: Dict) -> Dict:
         """Upsert a page/report into Notion. This is a minimal implementation that logs an action.
 
@@ -1,6 +1,7 @@
 import os
 import logging
-import requests
+
+from utils.tracing import traced
 
 logger = logging.getLogger(__name__)
 
@@ -11,6 +12,7 @@ class ScreenshotTool:
         self.api_key = os.environ.get('AI_SCREENSHOT_API_KEY')
         self.endpoint = os.environ.get('AI_SCREENSHOT_ENDPOINT')
 
+    @traced('screenshot.capture')
     def capture(self, company_name: str, url: str = None) -> dict:
         """Capture a screenshot via the AI Screenshot API if configured, else return a placeholder.
         Returns a dict with `image_url` or `path`.
@@ -20,6 +22,7 @@ class ScreenshotTool:
 
         if self.api_key and self.endpoint:
             try:
+                import requests
                 resp = requests.post(self.endpoint, json={'url': url}, headers={'Authorization': f'Bearer {self.api_key}'}, timeout=10)
                 resp.raise_for_status()
                 data = resp.json()
@@ -1,6 +1,7 @@
 import os
 import logging
-import requests
+
+from utils.tracing import traced
 
 logger = logging.getLogger(__name__)
 
@@ -12,11 +13,13 @@ class SlackClient:
     def is_configured(self) -> bool:
         return bool(self.webhook)
 
+    @traced('slack.post_message')
     def post_message(self, text: str) -> bool:
         if not self.webhook:
             logger.warning('Slack webhook not configured')
             return False
         try:
+            import requests
             resp = requests.post(self.webhook, json={'text': text}, timeout=5)
             resp.raise_for_status()
             return True
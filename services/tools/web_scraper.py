@@ -1,22 +1,29 @@
 import logging
+import os
 from typing import Dict
-import requests
-from bs4 import BeautifulSoup
+
+from utils.tracing import traced
 
 logger = logging.getLogger(__name__)
 
 
 class WebScraper:
-    def __init__(self):
-        pass
+    def __init__(self, snapshot_store=None):
+        # Where to look for a company's homepage; overridable for local fixtures
+        self.url_template = os.environ.get('SCRAPER_URL_TEMPLATE', 'https://{name}.com')
+        self.snapshot_store = snapshot_store
 
+    @traced('web_scraper.autonomous_gather')
     def autonomous_gather(self, company_name: str) -> Dict:
         """Attempt to find a company homepage via a web search and scrape simple metadata.
 
         This is intentionally simple and best-effort (no external search API used).
         """
+        import requests
+        from bs4 import BeautifulSoup
+
         # naive URL guess
-        url = f"https://{company_name.lower()}.com"
+        url = self.url_template.format(name=company_name.lower())
         try:
             r = requests.get(url, timeout=5)
             r.raise_for_status()
@@ -26,7 +33,15 @@ class WebScraper:
             md = soup.find('meta', attrs={'name': 'description'})
             if md and md.get('content'):
                 meta_desc = md['content']
-            return {'url': url, 'title': title, 'description': meta_desc}
+            page = {'url': url, 'title': title, 'description': meta_desc}
         except Exception as e:
             logger.warning('Scrape failed for %s: %s', company_name, e)
             return {'url': url, 'title': company_name, 'description': ''}
+
+        if self.snapshot_store is not None:
+            try:
+                snapshot = self.snapshot_store.record(url, page)
+                page['snapshot'] = {'id': snapshot['id'], 'changed': snapshot['changed'], 'diff': snapshot['diff']}
+            except Exception as e:
+                logger.warning('Snapshot failed for %s: %s', url, e)
+        return page
@@ -0,0 +1,173 @@
+// Charts and animations for the analysis results page
+document.addEventListener('DOMContentLoaded', function() {
+    loadChartData()
+        .then(renderCharts)
+        .catch(error => console.error('Could not load chart data:', error));
+
+    animateProgressBars();
+});
+
+var CHART_RETRY_KEY = 'competitorai.chartRetry';
+
+function loadChartData() {
+    const holder = document.getElementById('analysisCharts');
+    if (!holder) {
+        // Fallback pages carry their chart data inline
+        const inline = document.getElementById('chartData');
+        return Promise.resolve(inline ? JSON.parse(inline.textContent) : {});
+    }
+    const url = holder.dataset.chartsUrl;
+    return window.CompetitorAI.makeAPIRequest(url).then(data => {
+        sessionStorage.removeItem(CHART_RETRY_KEY);
+        return data;
+    }, error => {
+        // Another worker or instance may not hold this analysis and answer 404:
+        // request the page again, once per chart URL so a repeated miss cannot loop
+        if (error.status === 404 && sessionStorage.getItem(CHART_RETRY_KEY) !== url) {
+            sessionStorage.setItem(CHART_RETRY_KEY, url);
+            window.CompetitorAI.reloadAnalysisPage();
+        }
+        throw error;
+    });
+}
+
+// var: the page may be re-rendered in the same window from the client-side cache
+var chartDefaults = {
+    responsive: true,
+    maintainAspectRatio: false,
+    plugins: {
+        legend: {
+            labels: { color: "white" },
+            position: 'bottom'
+        },
+        tooltip: {
+            backgroundColor: 'rgba(0, 0, 0, 0.8)',
+            titleColor: 'white',
+            bodyColor: 'white',
+            borderColor: 'rgba(255, 255, 255, 0.1)',
+            borderWidth: 1
+        }
+    }
+};
+
+function renderCharts(data) {
+    if (typeof Chart === 'undefined') {
+        console.error('Chart.js is not available');
+        return;
+    }
+
+    // Market Share Chart
+    const marketShareCanvas = document.getElementById("marketShareChart");
+    if (marketShareCanvas && data.market_share_data) {
+        const marketShareData = data.market_share_data;
+        new Chart(marketShareCanvas, {
+            type: "doughnut",
+            data: {
+                labels: marketShareData.labels,
+                datasets: [{
+                    data: marketShareData.values,
+                    backgroundColor: ["#4CAF50", "#2196F3", "#FFC107"],
+                    borderColor: "rgba(255, 255, 255, 0.1)",
+                    borderWidth: 2
+                }]
+            },
+            options: {
+                ...chartDefaults,
+                cutout: '60%',
+                plugins: {
+                    ...chartDefaults.plugins,
+                    title: {
+                        display: true,
+                        text: 'Market Distribution',
+                        color: 'white',
+                        font: { size: 14 }
+                    }
+                }
+            }
+        });
+    }
+
+    // Revenue Trends Chart (use black and green palette)
+    const revenueCanvas = document.getElementById("revenueTrendsChart");
+    if (revenueCanvas && data.revenue_trends) {
+        const revenueData = data.revenue_trends;
+        new Chart(revenueCanvas, {
+            type: "line",
+            data: {
+                labels: revenueData.labels,
+                datasets: revenueData.datasets.map((dataset, idx) => {
+                    // map colors: original black -> green, original green -> red
+                    const palette = ['#4CAF50', '#FF0000'];
+                    const border = dataset.borderColor || palette[idx % palette.length];
+                    return {
+                        ...dataset,
+                        borderColor: border,
+                        borderWidth: 3,
+                        tension: 0.4,
+                        fill: true,
+                        backgroundColor: border + '20'
+                    };
+                })
+            },
+            options: {
+                ...chartDefaults,
+                scales: {
+                    y: {
+                        beginAtZero: true,
+                        grid: { color: "rgba(255, 255, 255, 0.1)" },
+                        ticks: { color: "white" }
+                    },
+                    x: {
+                        grid: { color: "rgba(255, 255, 255, 0.1)" },
+                        ticks: { color: "white" }
+                    }
+                }
+            }
+        });
+    }
+
+    // Product Comparison Chart
+    const comparisonCanvas = document.getElementById("productComparisonChart");
+    if (comparisonCanvas && data.product_comparison) {
+        const comparisonData = data.product_comparison;
+        new Chart(comparisonCanvas, {
+            type: "radar",
+            data: {
+                labels: comparisonData.categories,
+                datasets: comparisonData.datasets.map(dataset => ({
+                    ...dataset,
+                    borderWidth: 2,
+                    pointBackgroundColor: dataset.borderColor,
+                    pointBorderColor: 'white',
+                    pointHoverRadius: 6,
+                    pointRadius: 4
+                }))
+            },
+            options: {
+                ...chartDefaults,
+                scales: {
+                    r: {
+                        min: 0,
+                        max: 10,
+                        ticks: { color: "white", stepSize: 2 },
+                        grid: { color: "rgba(255, 255, 255, 0.1)" },
+                        pointLabels: { color: "white", font: { size: 12 } },
+                        angleLines: { color: "rgba(255, 255, 255, 0.1)" }
+                    }
+                }
+            }
+        });
+    }
+}
+
+function animateProgressBars() {
+    const progressBars = document.querySelectorAll('.progress-bar');
+    progressBars.forEach(bar => {
+        const width = bar.style.width;
+        bar.style.width = '0';
+        setTimeout(() => {
+            bar.style.width = width;
+            bar.style.transition = 'width 1s ease-in-out';
+        }, 100);
+    });
+}
@@ -1,4 +1,10 @@
 // Main JavaScript file for CompetitorAI
+
+// Snapshot of a cacheable analysis page before any script changes it (see initializeAnalysisCache)
+var analysisPageHTML = document.getElementById('analysisMeta')
+    ? '<!DOCTYPE html>\n' + document.documentElement.outerHTML
+    : null;
+
 document.addEventListener('DOMContentLoaded', function() {
     // Initialize the application
     initializeApp();
@@ -6,6 +12,9 @@ document.addEventListener('DOMContentLoaded', function() {
     // Form handling
     initializeFormHandling();
 
+    // Instant revisits of previous analyses
+    initializeAnalysisCache();
+
     // UI enhancements
     initializeUIEnhancements();
 
@@ -374,33 +383,232 @@ function throttle(func, limit) {
 }
 
 // API helper functions
+
+// With an `etag` option (null for a first fetch) the request is conditional and
+// resolves to { notModified, etag, data } instead of the parsed body.
 async function makeAPIRequest(url, options = {}) {
+    const { etag, headers, ...fetchOptions } = options;
+    const conditional = 'etag' in options;
     try {
         const response = await fetch(url, {
+            ...fetchOptions,
             headers: {
                 'Content-Type': 'application/json',
-                ...options.headers
+                ...(conditional && etag ? { 'If-None-Match': etag } : {}),
+                ...headers
             },
-            ...options
+            // Validators are managed by the caller, not the HTTP cache
+            ...(conditional ? { cache: 'no-store' } : {})
         });
 
+        if (conditional && response.status === 304) {
+            return { notModified: true, etag, data: null };
+        }
         if (!response.ok) {
-            throw new Error(`HTTP error! status: ${response.status}`);
+            const error = new Error(`HTTP error! status: ${response.status}`);
+            error.status = response.status;
+            throw error;
         }
 
-        return await response.json();
+        const data = await response.json();
+        return conditional ? { notModified: false, etag: response.headers.get('ETag'), data } : data;
     } catch (error) {
         console.error('API request failed:', error);
         throw error;
     }
 }
 
+// Client-side analysis cache
+//
+// Rendered analysis pages are kept in IndexedDB under the server's cache key
+// together with the ETag of the analysis JSON. Submitting the form for a known
+// key shows the stored page at once and revalidates it in the background.
+var ANALYSIS_DB = 'competitorai';
+var ANALYSIS_STORE = 'analyses';
+var ANALYSIS_MAX_ENTRIES = 50;
+var ANALYSIS_MAX_AGE_MS = 7 * 24 * 60 * 60 * 1000;
+
+function analysisCacheKey(competitor, yourCompany, domain) {
+    // Same normalization as analysis_cache_key on the server
+    return [competitor, yourCompany, domain].map(value => (value || '').trim()).join('_');
+}
+
+function openAnalysisDB() {
+    if (!window.indexedDB) {
+        return Promise.reject(new Error('IndexedDB is not available'));
+    }
+    if (!openAnalysisDB.promise) {
+        openAnalysisDB.promise = new Promise((resolve, reject) => {
+            const request = indexedDB.open(ANALYSIS_DB, 1);
+            request.onupgradeneeded = () => {
+                request.result.createObjectStore(ANALYSIS_STORE, { keyPath: 'key' })
+                    .createIndex('storedAt', 'storedAt');
+            };
+            request.onsuccess = () => resolve(request.result);
+            request.onerror = () => reject(request.error);
+        });
+    }
+    return openAnalysisDB.promise;
+}
+
+function analysisStore(mode, operation) {
+    return openAnalysisDB().then(db => new Promise((resolve, reject) => {
+        const transaction = db.transaction(ANALYSIS_STORE, mode);
+        const request = operation(transaction.objectStore(ANALYSIS_STORE));
+        transaction.oncomplete = () => resolve(request && request.result);
+        transaction.onerror = () => reject(transaction.error);
+    }));
+}
+
+function getCachedAnalysis(key) {
+    return analysisStore('readonly', store => store.get(key)).then(entry => {
+        if (entry && Date.now() - entry.storedAt > ANALYSIS_MAX_AGE_MS) {
+            return null;
+        }
+        return entry || null;
+    });
+}
+
+function putCachedAnalysis(entry) {
+    return analysisStore('readwrite', store => {
+        store.put({ ...entry, storedAt: Date.now() });
+        // Drop the oldest entries beyond the limit
+        const countRequest = store.count();
+        countRequest.onsuccess = () => {
+            let excess = countRequest.result - ANALYSIS_MAX_ENTRIES;
+            if (excess <= 0) {
+                return;
+            }
+            store.index('storedAt').openCursor().onsuccess = event => {
+                const cursor = event.target.result;
+                if (cursor && excess-- > 0) {
+                    cursor.delete();
+                    cursor.continue();
+                }
+            };
+        };
+        return null;
+    });
+}
+
+function showCachedAnalysis(entry) {
+    // Scripts of the written page see this and revalidate instead of re-storing
+    window.CompetitorAIRestored = entry;
+    document.open();
+    document.write(entry.html);
+    document.close();
+}
+
+function initializeAnalysisCache() {
+    const form = document.getElementById('analysis-form') || document.getElementById('analysisForm');
+    if (form) {
+        interceptAnalysisForm(form);
+    }
+
+    const meta = document.getElementById('analysisMeta');
+    if (meta) {
+        const restored = window.CompetitorAIRestored;
+        window.CompetitorAIRestored = null;
+        revalidateAnalysis(meta, restored).catch(error => console.warn('Analysis cache unavailable:', error));
+    }
+}
+
+function interceptAnalysisForm(form) {
+    form.addEventListener('submit', function(e) {
+        if (e.defaultPrevented || !window.indexedDB) {
+            return;
+        }
+        const data = new FormData(form);
+        const key = analysisCacheKey(data.get('competitor_company'), data.get('your_company'), data.get('product_domain'));
+        e.preventDefault();
+        getCachedAnalysis(key)
+            .then(entry => entry ? showCachedAnalysis(entry) : form.submit())
+            .catch(() => form.submit());
+    });
+}
+
+function analysisFormValues(meta) {
+    return {
+        competitor_company: meta.dataset.competitorCompany,
+        your_company: meta.dataset.yourCompany,
+        product_domain: meta.dataset.productDomain
+    };
+}
+
+var analysisReloading = false;
+
+function reloadAnalysisPage() {
+    // Submit the form of the current analysis page again (at most once per page)
+    const meta = document.getElementById('analysisMeta');
+    if (!meta || analysisReloading) {
+        return;
+    }
+    analysisReloading = true;
+    submitAnalysisForm(meta.dataset.analyzeUrl, analysisFormValues(meta));
+}
+
+async function revalidateAnalysis(meta, restored) {
+    const key = meta.dataset.analysisKey;
+    const form = analysisFormValues(meta);
+    if (!restored) {
+        // A freshly rendered page: remember it for the next visit under the ETag it carries
+        await putCachedAnalysis({ key, etag: meta.dataset.etag, html: analysisPageHTML, form });
+        return;
+    }
+
+    let result;
+    try {
+        result = await makeAPIRequest(meta.dataset.analysisUrl, { etag: restored.etag });
+    } catch (error) {
+        // The server no longer has this analysis (restart, another worker, eviction), so the
+        // stored page's export links would fail: submit the form as if it had never been cached
+        if (error.status === 404) {
+            reloadAnalysisPage();
+            return;
+        }
+        throw error;
+    }
+
+    if (result.notModified) {
+        await putCachedAnalysis(restored);
+        return;
+    }
+
+    // The analysis changed since it was stored: fetch the current page and show it
+    const response = await fetch(meta.dataset.analyzeUrl, { method: 'POST', body: new URLSearchParams(form) });
+    if (!response.ok) {
+        return;
+    }
+    const entry = { key, etag: result.etag, html: await response.text(), form };
+    await putCachedAnalysis(entry);
+    showToast('This analysis has been updated', 'info');
+    showCachedAnalysis(entry);
+}
+
+function submitAnalysisForm(action, values) {
+    // A regular navigation; the rendered page replaces the stored entry
+    const form = document.createElement('form');
+    form.method = 'POST';
+    form.action = action;
+    Object.entries(values).forEach(([name, value]) => {
+        const input = document.createElement('input');
+        input.type = 'hidden';
+        input.name = name;
+        input.value = value || '';
+        form.appendChild(input);
+    });
+    document.body.appendChild(form);
+    form.submit();
+}
+
 // Export functions for use in other scripts
 window.CompetitorAI = {
     validateForm,
     showToast,
     showProgress,
     makeAPIRequest,
+    analysisCacheKey,
+    reloadAnalysisPage,
     debounce,
     throttle
 };
\ No newline at end of file
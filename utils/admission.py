@@ -0,0 +1,138 @@
+"""
+Admission control for expensive endpoints.
+
+Each gated endpoint gets a ``Gate`` with a concurrency limit and a bounded
+wait queue. A request is admitted straight away while a slot is free;
+otherwise it waits, in arrival order, until a slot opens or its deadline
+passes. Requests are turned away early when the queue
+is full or when the expected wait (queue position x average service time)
+already exceeds the deadline, so callers can degrade to a cached or basic
+result, or answer 503 with ``Retry-After``.
+
+Limits apply per process, like the other in-process budgets: they queue the
+threads of one worker, so the server must run threaded workers (the Procfile
+uses gunicorn's ``gthread`` class); a sync worker handles one request at a
+time and never queues.
+"""
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from utils.metrics import ADMISSION_EVENTS, IN_FLIGHT
+
+
+class Overloaded(Exception):
+    """Raised when a request is not admitted; ``retry_after`` is in seconds"""
+
+    def __init__(self, endpoint: str, retry_after: int, reason: str):
+        super().__init__(f"{endpoint} overloaded ({reason})")
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class Gate:
+    def __init__(self, name: str, limit: int, queue_size: int, timeout: float):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.active = 0
+        # Events of waiting requests, oldest first
+        self._waiters = deque()
+        self._lock = threading.Lock()
+        # Moving average of admitted request durations, seeded with half the deadline
+        self._service_time = timeout / 2 if timeout else 1.0
+        IN_FLIGHT.set_function(lambda: self.active, kind=f'admitted_{name}')
+        IN_FLIGHT.set_function(lambda: len(self._waiters), kind=f'queued_{name}')
+
+    def expected_wait(self, position: int) -> float:
+        return math.ceil(position / max(self.limit, 1)) * self._service_time
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.expected_wait(len(self._waiters) + 1)))
+
+    def _reject(self, reason: str) -> Overloaded:
+        ADMISSION_EVENTS.inc(endpoint=self.name, outcome=reason)
+        return Overloaded(self.name, self.retry_after(), reason)
+
+    def acquire(self, timeout: Optional[float] = None) -> None:
+        """Wait for a slot; raises ``Overloaded`` when none frees up in time"""
+        timeout = self.timeout if timeout is None else timeout
+        with self._lock:
+            if self.active < self.limit and not self._waiters:
+                self.active += 1
+                ADMISSION_EVENTS.inc(endpoint=self.name, outcome='admitted')
+                return
+            if len(self._waiters) >= self.queue_size:
+                raise self._reject('queue_full')
+            if self.expected_wait(len(self._waiters) + 1) > timeout:
+                raise self._reject('deadline')
+            waiter = threading.Event()
+            self._waiters.append(waiter)
+        if waiter.wait(timeout):
+            ADMISSION_EVENTS.inc(endpoint=self.name, outcome='queued')
+            return
+        with self._lock:
+            if waiter.is_set():
+                # Handed a slot just as the deadline passed
+                ADMISSION_EVENTS.inc(endpoint=self.name, outcome='queued')
+                return
+            self._waiters.remove(waiter)
+            raise self._reject('timeout')
+
+    def release(self, duration: Optional[float] = None) -> None:
+        with self._lock:
+            if duration is not None:
+                self._service_time = 0.8 * self._service_time + 0.2 * duration
+            if self._waiters:
+                # Hand the slot straight to the next waiter
+                self._waiters.popleft().set()
+            else:
+                self.active -= 1
+
+    @contextmanager
+    def admit(self, timeout: Optional[float] = None):
+        self.acquire(timeout)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - started)
+
+    def stats(self) -> Dict:
+        return {
+            'limit': self.limit,
+            'active': self.active,
+            'queued': len(self._waiters),
+            'queue_size': self.queue_size,
+            'timeout': self.timeout,
+            'service_time': round(self._service_time, 3),
+        }
+
+
+class AdmissionController:
+    """Registry of per-endpoint gates"""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._gates: Dict[str, Gate] = {}
+
+    def add(self, name: str, limit: int, queue_size: int = 8, timeout: float = 10.0) -> Gate:
+        gate = self._gates[name] = Gate(name, limit, queue_size, timeout)
+        return gate
+
+    @contextmanager
+    def admit(self, name: str, timeout: Optional[float] = None):
+        gate = self._gates.get(name)
+        if not self.enabled or gate is None:
+            yield
+            return
+        with gate.admit(timeout):
+            yield
+
+    def stats(self) -> Dict[str, Dict]:
+        return {name: gate.stats() for name, gate in self._gates.items()}
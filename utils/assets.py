@@ -0,0 +1,94 @@
+"""
+Fingerprinted, precompressed static assets.
+
+Every file under the static folder is read once, hashed and precompressed
+(gzip, plus brotli when installed) in memory. Templates link to
+``asset_url('css/style.css')``, which yields ``/assets/css/style.<hash>.css``;
+since the name changes whenever the content does, responses carry
+``Cache-Control: public, max-age=31536000, immutable`` and browsers never
+revalidate them.
+"""
+import hashlib
+import logging
+import mimetypes
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+from flask import abort, url_for
+
+from utils.serialization import EncodedPayload, payload_response
+
+logger = logging.getLogger(__name__)
+
+
+def fingerprinted_name(filename: str, digest: str) -> str:
+    root, ext = os.path.splitext(filename)
+    return f'{root}.{digest}{ext}'
+
+
+class AssetManifest:
+    def __init__(self, static_folder: str, endpoint: str = 'asset', auto_reload: bool = False):
+        """``auto_reload`` rescans the folder when files change (for development)"""
+        self.static_folder = static_folder
+        self.endpoint = endpoint
+        self.auto_reload = auto_reload
+        self._urls: Dict[str, str] = {}
+        self._assets: Dict[str, Tuple[EncodedPayload, str]] = {}
+        self._mtimes: Dict[str, float] = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _scan(self) -> Dict[str, float]:
+        mtimes = {}
+        for directory, _, files in os.walk(self.static_folder):
+            for name in files:
+                path = os.path.join(directory, name)
+                mtimes[os.path.relpath(path, self.static_folder).replace(os.sep, '/')] = os.path.getmtime(path)
+        return mtimes
+
+    def load(self) -> None:
+        """(Re)build the manifest when files were added or changed"""
+        if self._loaded and not self.auto_reload:
+            return
+        mtimes = self._scan()
+        if self._loaded and mtimes == self._mtimes:
+            return
+        urls, assets = {}, {}
+        for filename in sorted(mtimes):
+            with open(os.path.join(self.static_folder, filename), 'rb') as fh:
+                body = fh.read()
+            name = fingerprinted_name(filename, hashlib.sha256(body).hexdigest()[:12])
+            mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            urls[filename] = name
+            assets[name] = (EncodedPayload(body), mimetype)
+        with self._lock:
+            self._urls, self._assets, self._mtimes, self._loaded = urls, assets, mtimes, True
+        logger.info('Loaded %d static assets', len(assets))
+
+    def url(self, filename: str) -> str:
+        self.load()
+        name = self._urls.get(filename)
+        if name is None:
+            return url_for('static', filename=filename)
+        return url_for(self.endpoint, filename=name)
+
+    def get(self, name: str) -> Optional[Tuple[EncodedPayload, str]]:
+        self.load()
+        return self._assets.get(name)
+
+    def response(self, name: str, request):
+        asset = self.get(name)
+        if asset is None:
+            abort(404)
+        payload, mimetype = asset
+        return payload_response(payload, request, mimetype=mimetype, immutable=True)
+
+    def stats(self) -> Dict:
+        self.load()
+        return {
+            'files': len(self._assets),
+            'bytes': sum(len(p.body) for p, _ in self._assets.values()),
+            'compressed_bytes': sum(min([len(p.body)] + [len(v) for v in p.encodings.values()])
+                                    for p, _ in self._assets.values()),
+        }
@@ -0,0 +1,75 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+from utils.metrics import CACHE_EVENTS
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedCache:
+    """Thread-safe LRU cache bounded by total payload size and entry count.
+
+    Values are expected to be ``bytes`` (or anything supporting ``len``); the
+    least recently used entries are evicted once either limit is exceeded.
+    Hits, misses and evictions are counted under ``name`` in the metrics.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_entries: int = 1024, name: str = 'default'):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+        CACHE_EVENTS.inc(cache=self.name, event='hit' if value is not None else 'miss')
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        size = len(value)
+        if size > self.max_bytes:
+            logger.warning('Cache entry %s too large to cache (%d bytes)', key, size)
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._entries[key] = value
+            self._size += size
+            while self._size > self.max_bytes or len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                CACHE_EVENTS.inc(cache=self.name, event='eviction')
+
+    def discard(self, key: Hashable) -> None:
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+
+    def discard_matching(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Drop every entry whose key satisfies ``predicate``; returns the count"""
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                self._size -= len(self._entries.pop(key))
+            return len(keys)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size(self) -> int:
+        """Total size in bytes of the cached values"""
+        return self._size
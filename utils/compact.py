@@ -0,0 +1,286 @@
+"""
+Compact in-memory representation of cached analyses.
+
+An analysis dict is split into a *shape* (the nested dict keys and list
+layout, interned so identical layouts across entries share one object) and
+flat value columns: interned strings, ``array('q')`` ints and ``array('d')``
+floats. Homogeneous numeric lists (chart series, scores) become slices of the
+arrays. Cold entries are additionally compressed (zstd when installed, zlib
+otherwise) and only expanded again when accessed.
+
+``CompactRecord.to_dict`` rebuilds exactly the JSON-style dict that was
+stored, so templates and exports are unaffected.
+"""
+import logging
+import pickle
+import sys
+import threading
+import zlib
+from array import array
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Any, Callable, Dict, Iterator, Optional
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional compression
+    zstandard = None
+
+from utils.metrics import CACHE_EVENTS
+
+logger = logging.getLogger(__name__)
+
+_INT64_MIN, _INT64_MAX = -2 ** 63, 2 ** 63 - 1
+
+# Shared table of shapes. Layouts keyed by company names are unique per entry,
+# so the table is reset when full; live records keep their own references.
+_SHAPES: Dict[Any, Any] = {}
+_MAX_SHAPES = 10000
+
+
+def _intern_shape(shape):
+    interned = _SHAPES.get(shape)
+    if interned is not None:
+        return interned
+    if len(_SHAPES) >= _MAX_SHAPES:
+        _SHAPES.clear()
+    _SHAPES[shape] = shape
+    return shape
+
+
+def _is_int64(value) -> bool:
+    return type(value) is int and _INT64_MIN <= value <= _INT64_MAX
+
+
+def _encode(value, strings: list, ints: array, floats: array):
+    kind = type(value)
+    if kind is str:
+        strings.append(sys.intern(value))
+        return 's'
+    if kind is bool:
+        ints.append(int(value))
+        return 'b'
+    if kind is int and _is_int64(value):
+        ints.append(value)
+        return 'i'
+    if kind is float:
+        floats.append(value)
+        return 'f'
+    if value is None:
+        return 'n'
+    if kind is dict:
+        keys = tuple(sys.intern(k) if type(k) is str else k for k in value)
+        children = tuple(_encode(v, strings, ints, floats) for v in value.values())
+        return _intern_shape(('d', keys, children))
+    if kind is list:
+        if value and all(_is_int64(v) for v in value):
+            ints.extend(value)
+            return _intern_shape(('I', len(value)))
+        if value and all(type(v) is float for v in value):
+            floats.extend(value)
+            return _intern_shape(('F', len(value)))
+        return _intern_shape(('l', tuple(_encode(v, strings, ints, floats) for v in value)))
+    # Anything else (tuples, big ints, ...) is kept as an opaque object
+    strings.append(value)
+    return 'o'
+
+
+class _Cursor:
+    __slots__ = ('strings', 'ints', 'floats', 's', 'i', 'f')
+
+    def __init__(self, strings, ints, floats):
+        self.strings, self.ints, self.floats = strings, ints, floats
+        self.s = self.i = self.f = 0
+
+
+def _decode(shape, cur: _Cursor):
+    if shape == 's' or shape == 'o':
+        cur.s += 1
+        return cur.strings[cur.s - 1]
+    if shape == 'i':
+        cur.i += 1
+        return cur.ints[cur.i - 1]
+    if shape == 'b':
+        cur.i += 1
+        return bool(cur.ints[cur.i - 1])
+    if shape == 'f':
+        cur.f += 1
+        return cur.floats[cur.f - 1]
+    if shape == 'n':
+        return None
+    tag = shape[0]
+    if tag == 'd':
+        return {key: _decode(child, cur) for key, child in zip(shape[1], shape[2])}
+    if tag == 'I':
+        cur.i += shape[1]
+        return cur.ints[cur.i - shape[1]:cur.i]
+    if tag == 'F':
+        cur.f += shape[1]
+        return cur.floats[cur.f - shape[1]:cur.f]
+    return [_decode(child, cur) for child in shape[1]]
+
+
+def _compress(data: bytes) -> bytes:
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return zlib.compress(data, 6)
+
+
+def _decompress(data: bytes) -> bytes:
+    if zstandard is not None:
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+class CompactRecord:
+    """One analysis as an interned shape plus flat value columns"""
+
+    __slots__ = ('shape', 'strings', 'ints', 'floats', 'packed')
+
+    def __init__(self, data: Dict):
+        strings, ints, floats = [], array('q'), array('d')
+        self.shape = _encode(data, strings, ints, floats)
+        self.strings = tuple(strings)
+        self.ints = ints
+        self.floats = floats
+        self.packed = None
+
+    @property
+    def compressed(self) -> bool:
+        return self.packed is not None
+
+    def compress(self) -> None:
+        if self.packed is None:
+            self.packed = _compress(pickle.dumps(
+                (self.strings, self.ints.tobytes(), self.floats.tobytes()), protocol=pickle.HIGHEST_PROTOCOL))
+            self.strings = self.ints = self.floats = None
+
+    def decompress(self) -> None:
+        if self.packed is not None:
+            strings, ints, floats = pickle.loads(_decompress(self.packed))
+            self.strings = tuple(sys.intern(s) if type(s) is str else s for s in strings)
+            self.ints = array('q')
+            self.ints.frombytes(ints)
+            self.floats = array('d')
+            self.floats.frombytes(floats)
+            self.packed = None
+
+    def to_dict(self) -> Dict:
+        if self.packed is not None:
+            strings, ints, floats = pickle.loads(_decompress(self.packed))
+            ints_array, floats_array = array('q'), array('d')
+            ints_array.frombytes(ints)
+            floats_array.frombytes(floats)
+            cur = _Cursor(strings, ints_array.tolist(), floats_array.tolist())
+        else:
+            cur = _Cursor(self.strings, self.ints.tolist(), self.floats.tolist())
+        return _decode(self.shape, cur)
+
+    def nbytes(self) -> int:
+        """Approximate memory held by this record (excluding shared shapes and interned strings)"""
+        if self.packed is not None:
+            return sys.getsizeof(self.packed)
+        return (sys.getsizeof(self.strings) + self.ints.buffer_info()[1] * self.ints.itemsize
+                + self.floats.buffer_info()[1] * self.floats.itemsize)
+
+
+class AnalysisCache(MutableMapping):
+    """Dict-compatible store of analyses kept as ``CompactRecord``s.
+
+    The ``hot_entries`` most recently used records stay uncompressed; older
+    ones are compressed and expanded again on access. Reads return a fresh
+    dict each time. Least recently used records are evicted beyond
+    ``max_entries`` or ``max_bytes``, and ``on_evict`` is called with each
+    evicted key.
+    """
+
+    def __init__(self, hot_entries: int = 64, compress: bool = True, max_entries: int = 1024,
+                 max_bytes: int = 128 * 1024 * 1024, on_evict: Callable[[str], None] = None):
+        self.hot_entries = hot_entries
+        self.compress = compress
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        # Records in use order, least recent first
+        self._records: 'OrderedDict[str, CompactRecord]' = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._size = 0
+        # Recently used (uncompressed) keys, least recent first
+        self._hot: 'OrderedDict[str, None]' = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _resize(self, key: str, record: CompactRecord) -> None:
+        size = record.nbytes()
+        self._size += size - self._sizes.get(key, 0)
+        self._sizes[key] = size
+
+    def _touch(self, key: str, record: CompactRecord) -> None:
+        self._records.move_to_end(key)
+        if self.compress:
+            record.decompress()
+            self._hot[key] = None
+            self._hot.move_to_end(key)
+            while len(self._hot) > self.hot_entries:
+                cold_key, _ = self._hot.popitem(last=False)
+                cold = self._records.get(cold_key)
+                if cold is not None:
+                    cold.compress()
+                    self._resize(cold_key, cold)
+        self._resize(key, record)
+
+    def _evict(self) -> list:
+        evicted = []
+        # The most recent record is kept even if it alone exceeds max_bytes
+        while len(self._records) > 1 and (len(self._records) > self.max_entries or self._size > self.max_bytes):
+            key, _ = self._records.popitem(last=False)
+            self._hot.pop(key, None)
+            self._size -= self._sizes.pop(key)
+            evicted.append(key)
+        return evicted
+
+    def __setitem__(self, key: str, value: Dict) -> None:
+        record = CompactRecord(value)
+        with self._lock:
+            self._records[key] = record
+            self._touch(key, record)
+            evicted = self._evict()
+        for evicted_key in evicted:
+            CACHE_EVENTS.inc(cache='analysis', event='eviction')
+            if self.on_evict is not None:
+                self.on_evict(evicted_key)
+
+    def __getitem__(self, key: str) -> Dict:
+        with self._lock:
+            record = self._records[key]
+            self._touch(key, record)
+            return record.to_dict()
+
+    def __delitem__(self, key: str) -> None:
+        with self._lock:
+            del self._records[key]
+            self._hot.pop(key, None)
+            self._size -= self._sizes.pop(key)
+
+    def __contains__(self, key) -> bool:
+        return key in self._records
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._records))
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def record(self, key: str) -> Optional[CompactRecord]:
+        return self._records.get(key)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            records = list(self._records.values())
+            size = self._size
+        return {
+            'entries': len(records),
+            'compressed': sum(1 for r in records if r.compressed),
+            'bytes': size,
+            'shapes': len(_SHAPES),
+            'compression': 'zstd' if zstandard is not None else 'zlib',
+        }
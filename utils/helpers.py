@@ -1,9 +1,11 @@
 from urllib.parse import urlparse
 import json
 import logging
+import hashlib
+import io
+import csv
 from typing import Dict, Any
 import os
-from datetime import datetime
 
 def validate_url(url: str) -> bool:
     """
@@ -16,77 +18,54 @@ def validate_url(url: str) -> bool:
     except:
         return False
         
-def generate_pdf_report(analysis_data: Dict[str, Any]) -> str:
+def content_hash(data: Any) -> str:
+    """
+    Return a stable SHA-256 hex digest of JSON-serializable data.
+    Used to address cached artifacts (exports, rendered pages) by content.
+    """
+    encoded = json.dumps(data, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+def generate_pdf_report(analysis_data: Dict[str, Any]) -> bytes:
     """
     Generate a PDF report from the analysis data.
-    Returns the path to the generated PDF file.
+    A one-section report from utils.report, returned as bytes.
     """
+    from utils.report import stream_report
+
     try:
-        from reportlab.lib import colors
-        from reportlab.lib.pagesizes import letter
-        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-        
-        # Create reports directory if it doesn't exist
-        reports_dir = os.path.join(os.getcwd(), 'static', 'reports')
-        os.makedirs(reports_dir, exist_ok=True)
-        
-        # Generate unique filename
-        filename = f"analysis_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-        filepath = os.path.join(reports_dir, filename)
-        
-        # Create the PDF document
-        doc = SimpleDocTemplate(filepath, pagesize=letter)
-        styles = getSampleStyleSheet()
-        story = []
-        
-        # Add title
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=24,
-            spaceAfter=30
-        )
-        story.append(Paragraph("Competitive Analysis Report", title_style))
-        story.append(Spacer(1, 12))
-        
-        # Add timestamp
-        story.append(Paragraph(f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styles["Normal"]))
-        story.append(Spacer(1, 12))
-        
-        # Add sections
-        sections = [
-            ("Market Analysis", analysis_data.get("market_data", {})),
-            ("SWOT Analysis", analysis_data.get("swot_analysis", {})),
-            ("Strategic Recommendations", analysis_data.get("strategic_recommendations", [])),
-            ("AI Insights", analysis_data.get("ai_insights", {}))
-        ]
-        
-        for section_title, section_data in sections:
-            story.append(Paragraph(section_title, styles["Heading2"]))
-            story.append(Spacer(1, 12))
-            
-            if isinstance(section_data, dict):
-                for key, value in section_data.items():
-                    if isinstance(value, (list, tuple)):
-                        for item in value:
-                            story.append(Paragraph(f"• {item}", styles["Normal"]))
-                    else:
-                        story.append(Paragraph(f"{key}: {value}", styles["Normal"]))
-            elif isinstance(section_data, (list, tuple)):
-                for item in section_data:
-                    story.append(Paragraph(f"• {item}", styles["Normal"]))
-            
-            story.append(Spacer(1, 12))
-        
-        # Build the PDF
-        doc.build(story)
-        return filepath
-        
+        title = (analysis_data.get("company_overview") or {}).get("name") or "Competitor"
+        return b"".join(stream_report([(f"{title} Analysis", analysis_data)]))
     except Exception as e:
         logging.error(f"Error generating PDF report: {str(e)}")
         raise
 
+def generate_csv_report(analysis_data: Dict[str, Any]) -> bytes:
+    """
+    Flatten the analysis data into a CSV report of (section, field, value) rows.
+    Returns UTF-8 encoded CSV bytes.
+    """
+    def flatten(prefix, value):
+        if isinstance(value, dict):
+            for key, item in value.items():
+                yield from flatten(f"{prefix}.{key}" if prefix else str(key), item)
+        elif isinstance(value, (list, tuple)):
+            for index, item in enumerate(value):
+                yield from flatten(f"{prefix}[{index}]", item)
+        else:
+            yield prefix, value
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['section', 'field', 'value'])
+    for section, section_data in analysis_data.items():
+        if isinstance(section_data, (dict, list, tuple)):
+            for field, value in flatten('', section_data):
+                writer.writerow([section, field, value])
+        else:
+            writer.writerow([section, '', section_data])
+    return buffer.getvalue().encode('utf-8')
+
 def format_analysis_data(data):
     """
     Format the analysis data for display.
@@ -119,3 +98,14 @@ def format_analysis_data(data):
     except Exception as e:
         logging.error(f"Unexpected error in format_analysis_data: {str(e)}")
         return {}
+
+
+def chart_payload(analysis_data: Dict[str, Any]) -> Dict[str, Any]:
+    """The chart datasets of an analysis, served separately from the page"""
+    visualization = analysis_data.get('visualization_data') or {}
+    market_analysis = analysis_data.get('market_analysis') or {}
+    return {
+        'market_share_data': visualization.get('market_share_data') or None,
+        'revenue_trends': market_analysis.get('revenue_trends') or None,
+        'product_comparison': visualization.get('product_comparison') or None,
+    }
@@ -0,0 +1,240 @@
+"""
+In-process metrics with Prometheus text exposition.
+
+Metrics are per process; with several gunicorn workers each worker reports
+its own values and the scraper aggregates them.
+"""
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0)
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: str = '') -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def expose(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in items]
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values = {}
+        self._functions = {}
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set_function(self, fn: Callable[[], float], **labels) -> None:
+        """Report the value returned by ``fn`` at scrape time"""
+        self._functions[self._key(labels)] = fn
+
+    def value(self, **labels) -> float:
+        key = self._key(labels)
+        if key in self._functions:
+            return self._functions[key]()
+        return self._values.get(key, 0)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        for key, fn in list(self._functions.items()):
+            values[key] = fn()
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}"
+                for key, v in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._values.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def expose(self) -> str:
+        return '\n'.join(metric.expose() for metric in self._metrics) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+REQUEST_LATENCY = REGISTRY.register(Histogram(
+    'tracksmith_request_duration_seconds', 'HTTP request latency by endpoint', ['endpoint', 'status']))
+STAGE_LATENCY = REGISTRY.register(Histogram(
+    'tracksmith_stage_duration_seconds', 'Latency of processing stages (scrape, openai, render, ...)', ['stage']))
+CACHE_EVENTS = REGISTRY.register(Counter(
+    'tracksmith_cache_events_total', 'Cache hits, misses and evictions', ['cache', 'event']))
+ANALYSIS_RESULTS = REGISTRY.register(Counter(
+    'tracksmith_analysis_results_total', 'Analyses by outcome (ai, reused or fallback)', ['result']))
+OPENAI_TOKENS = REGISTRY.register(Counter(
+    'tracksmith_openai_tokens_total', 'OpenAI tokens consumed by source (request or scheduled)', ['kind', 'source']))
+OPENAI_ERRORS = REGISTRY.register(Counter(
+    'tracksmith_openai_errors_total', 'Failed OpenAI calls by error type', ['error']))
+SCRAPE_ERRORS = REGISTRY.register(Counter(
+    'tracksmith_scrape_errors_total', 'Failed website fetches by error type', ['error']))
+ADMISSION_EVENTS = REGISTRY.register(Counter(
+    'tracksmith_admission_events_total', 'Admission decisions for gated endpoints', ['endpoint', 'outcome']))
+IN_FLIGHT = REGISTRY.register(Gauge(
+    'tracksmith_in_flight', 'Work currently in progress (requests, admitted and queued work, prerender jobs)', ['kind']))
+
+
+class TokenUsage:
+    """OpenAI tokens used under one ``track_tokens`` block, including the threads it propagates to"""
+
+    def __init__(self, source: str):
+        self.source = source
+        self.tokens = 0
+        self._lock = threading.Lock()
+
+    def add(self, amount: int) -> None:
+        with self._lock:
+            self.tokens += amount
+
+
+_token_usage = contextvars.ContextVar('tracksmith_token_usage', default=None)
+
+
+@contextmanager
+def track_tokens(source: str):
+    """Attribute OpenAI tokens used inside the block to ``source`` and count them on the yielded TokenUsage"""
+    usage = TokenUsage(source)
+    token = _token_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _token_usage.reset(token)
+
+
+def record_tokens(prompt: int, completion: int) -> None:
+    """Count an OpenAI call's tokens; calls outside ``track_tokens`` are user requests"""
+    usage = _token_usage.get()
+    source = usage.source if usage is not None else 'request'
+    OPENAI_TOKENS.inc(prompt, kind='prompt', source=source)
+    OPENAI_TOKENS.inc(completion, kind='completion', source=source)
+    if usage is not None:
+        usage.add(prompt + completion)
@@ -0,0 +1,101 @@
+import logging
+import queue
+import threading
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from utils.cache import BoundedCache
+from utils.metrics import IN_FLIGHT, STAGE_LATENCY
+from utils.tracing import propagate, span
+
+logger = logging.getLogger(__name__)
+
+
+class ExportPrerenderer:
+    """Render export artifacts in a background thread ahead of the first download.
+
+    Jobs are keyed by ``(content_hash, fmt)`` and written into the shared export
+    cache. The queue is bounded: submissions are dropped when it is full, and
+    queued jobs are discarded while ``load_fn`` reports more in-flight requests
+    than ``max_load`` so pre-rendering never competes with user traffic.
+    """
+
+    def __init__(self, cache: BoundedCache, renderers: Dict[str, Callable[[Dict], bytes]],
+                 max_pending: int = 32, load_fn: Optional[Callable[[], int]] = None,
+                 max_load: int = 4):
+        self.cache = cache
+        self.renderers = renderers
+        self.load_fn = load_fn
+        self.max_load = max_load
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        IN_FLIGHT.set_function(lambda: len(self._pending), kind='prerender_jobs')
+
+    def submit(self, etag: str, analysis: Dict[str, Any], formats: Optional[Iterable[str]] = None) -> int:
+        """Queue rendering of ``formats`` for an analysis; returns the number of jobs queued"""
+        queued = 0
+        for fmt in formats or self.renderers:
+            key = (etag, fmt)
+            if key in self.cache:
+                continue
+            with self._lock:
+                if key in self._pending:
+                    continue
+                # Render in the submitting request's trace context
+                job = (key, analysis, propagate(self._render))
+                try:
+                    self._queue.put_nowait(job)
+                except queue.Full:
+                    logger.info('Prerender queue full; dropping %s job', fmt)
+                    break
+                self._pending[key] = job
+            queued += 1
+        if queued:
+            self._ensure_worker()
+        return queued
+
+    def cancel(self, etag: str) -> None:
+        """Drop queued jobs for an analysis (e.g. when it is replaced in the cache)"""
+        with self._lock:
+            for key in [k for k in self._pending if k[0] == etag]:
+                del self._pending[key]
+
+    def cancel_all(self) -> None:
+        with self._lock:
+            self._pending.clear()
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def _ensure_worker(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='export-prerender', daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            job = self._queue.get()
+            key, analysis, render = job
+            with self._lock:
+                if self._pending.get(key) is not job:
+                    continue  # cancelled or superseded
+            try:
+                if self.load_fn is not None and self.load_fn() > self.max_load:
+                    logger.info('Server busy; skipping prerender of %s', key[1])
+                    continue
+                if key not in self.cache:
+                    render(key, analysis)
+            except Exception as e:
+                logger.warning('Prerender of %s export failed: %s', key[1], e)
+            finally:
+                with self._lock:
+                    if self._pending.get(key) is job:
+                        del self._pending[key]
+
+    def _render(self, key, analysis) -> None:
+        with span('prerender.render', format=key[1]), STAGE_LATENCY.time(stage=f'prerender_{key[1]}'):
+            artifact = self.renderers[key[1]](analysis)
+        self.cache.set(key, artifact)
@@ -0,0 +1,174 @@
+"""
+Opt-in per-request profiling for live workers.
+
+A request is profiled when it is picked by ``sample_rate`` or when it carries
+``X-Profile: <mode>`` together with a matching ``X-Profile-Token``. Modes:
+
+- ``sample``: statistical stack sampling of the request thread, written as
+  collapsed stacks (``*.folded``) for flamegraph.pl / speedscope
+- ``cprofile``: deterministic cProfile, written as a pstats dump (``*.prof``)
+  for snakeviz / flameprof / gprof2dot
+- ``memory``: tracemalloc snapshot diff over the request (``*.txt`` summary
+  plus a ``*.tracemalloc`` snapshot loadable with ``tracemalloc.Snapshot.load``)
+"""
+import cProfile
+import hmac
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+MODES = ('sample', 'cprofile', 'memory')
+
+
+class StackSampler:
+    """Samples one thread's Python stack at a fixed interval from a helper thread"""
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class ProfileSession:
+    def __init__(self, mode: str, label: str):
+        self.mode = mode
+        self.label = label
+        self.started = time.perf_counter()
+        self.profiler = None
+        self.sampler = None
+        self.snapshot = None
+        self.owns_tracemalloc = False
+        self.output = None
+
+
+class RequestProfiler:
+    def __init__(self, output_dir: str, sample_rate: float = 0.0, default_mode: str = 'sample',
+                 token: Optional[str] = None, interval: float = 0.005, max_concurrent: int = 2):
+        if default_mode not in MODES:
+            raise ValueError(f"Unknown profile mode {default_mode!r}; expected one of {MODES}")
+        self.output_dir = output_dir
+        self.sample_rate = sample_rate
+        self.default_mode = default_mode
+        self.token = token
+        self.interval = interval
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        # tracemalloc is process-wide, so only one memory profile runs at a time
+        self._memory_lock = threading.Lock()
+
+    def select_mode(self, headers) -> Optional[str]:
+        """Pick a profiling mode for a request, or None to skip profiling"""
+        requested = headers.get('X-Profile')
+        if requested:
+            supplied = headers.get('X-Profile-Token', '')
+            if self.token and hmac.compare_digest(supplied, self.token) and requested in MODES:
+                return requested
+            return None
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return self.default_mode
+        return None
+
+    def start(self, mode: str, label: str) -> Optional[ProfileSession]:
+        if not self._slots.acquire(blocking=False):
+            logger.info('Profiling skipped for %s: too many concurrent profiles', label)
+            return None
+        session = ProfileSession(mode, label)
+        try:
+            if mode == 'cprofile':
+                session.profiler = cProfile.Profile()
+                session.profiler.enable()
+            elif mode == 'sample':
+                session.sampler = StackSampler(threading.get_ident(), self.interval)
+                session.sampler.start()
+            elif mode == 'memory':
+                if not self._memory_lock.acquire(blocking=False):
+                    self._slots.release()
+                    return None
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start(25)
+                    session.owns_tracemalloc = True
+                session.snapshot = tracemalloc.take_snapshot()
+        except Exception as e:
+            logger.warning('Could not start %s profile: %s', mode, e)
+            if mode == 'memory':
+                # Only reached with the memory lock held: a failed acquire returns above
+                if session.owns_tracemalloc:
+                    tracemalloc.stop()
+                self._memory_lock.release()
+            self._slots.release()
+            return None
+        return session
+
+    def finish(self, session: Optional[ProfileSession]) -> Optional[str]:
+        """Stop profiling and write the output; returns the output path"""
+        if session is None:
+            return None
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            elapsed_ms = (time.perf_counter() - session.started) * 1000
+            base = os.path.join(self.output_dir, '{}_{}_{}_{}ms_{}'.format(
+                datetime.now().strftime('%Y%m%d_%H%M%S_%f'),
+                session.label.strip('/').replace('/', '_') or 'root',
+                session.mode, int(elapsed_ms), os.getpid()))
+
+            if session.mode == 'cprofile':
+                session.profiler.disable()
+                session.output = base + '.prof'
+                session.profiler.dump_stats(session.output)
+            elif session.mode == 'sample':
+                session.sampler.stop()
+                session.output = base + '.folded'
+                with open(session.output, 'w', encoding='utf-8') as fh:
+                    fh.write(session.sampler.folded())
+            elif session.mode == 'memory':
+                after = tracemalloc.take_snapshot()
+                session.output = base + '.txt'
+                after.dump(base + '.tracemalloc')
+                current, peak = tracemalloc.get_traced_memory()
+                with open(session.output, 'w', encoding='utf-8') as fh:
+                    fh.write(f"traced current={current} peak={peak}\n\nTop allocations during request:\n")
+                    for stat in after.compare_to(session.snapshot, 'lineno')[:50]:
+                        fh.write(f"{stat}\n")
+            logger.info('Wrote %s profile to %s', session.mode, session.output)
+            return session.output
+        except Exception as e:
+            logger.warning('Could not write %s profile: %s', session.mode, e)
+            return None
+        finally:
+            if session.mode == 'memory':
+                if session.owns_tracemalloc:
+                    tracemalloc.stop()
+                self._memory_lock.release()
+            self._slots.release()
@@ -0,0 +1,443 @@
+"""
+Streaming multi-analysis PDF reports.
+
+``stream_report`` writes the PDF incrementally: header and shared resources
+first, then the pages of each analysis as soon as they are laid out, and the
+page tree, outline and cross-reference table last. Memory is bounded by the
+sections in flight rather than the whole document, so a report covering
+hundreds of competitors streams straight to the client.
+
+Each analysis becomes one section (overview, vector charts drawn from the
+chart datasets, SWOT, recommendations, insights, market data) that is laid out
+and compressed independently. Sections render inline by default; large
+reports can use a process pool created once at startup by ``start_pool``,
+whose workers come from a forkserver (or spawn) rather than being forked from
+the threaded server. Only the standard Helvetica fonts are used, so nothing is embedded; text widths come
+from reportlab's font metrics.
+"""
+import logging
+import math
+import multiprocessing
+import zlib
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from utils.metrics import STAGE_LATENCY
+
+logger = logging.getLogger(__name__)
+
+PAGE_WIDTH, PAGE_HEIGHT = 612, 792  # US letter, in points
+MARGIN = 54
+CONTENT_WIDTH = PAGE_WIDTH - 2 * MARGIN
+TOP = PAGE_HEIGHT - MARGIN
+BOTTOM = MARGIN + 18  # leaves room for the footer
+
+FONTS = {'F1': 'Helvetica', 'F2': 'Helvetica-Bold'}
+PALETTE = ((0.21, 0.49, 0.87), (0.96, 0.45, 0.20), (0.30, 0.69, 0.31),
+           (0.61, 0.35, 0.71), (0.94, 0.76, 0.20), (0.40, 0.40, 0.40))
+
+# Fixed object numbers; pages and outline items are numbered from FIRST_FREE_OBJECT
+CATALOG, PAGES, RESOURCES, OUTLINES = 1, 2, 3, 4
+FIRST_FREE_OBJECT = 7
+
+# Section order; remaining keys follow in their own order
+SECTIONS = (
+    ('company_overview', 'Company Overview'),
+    ('market_analysis', 'Market Analysis'),
+    ('swot_analysis', 'SWOT Analysis'),
+    ('strategic_recommendations', 'Strategic Recommendations'),
+    ('ai_insights', 'AI Insights'),
+    ('market_data', 'Market Data'),
+)
+# Drawn as charts (or internal) rather than written out
+SKIPPED_KEYS = {'visualization_data', 'is_fallback', 'revenue_trends'}
+# Sections submitted to the pool ahead of the one being written
+MAX_IN_FLIGHT = 16
+
+
+def pdf_string(text: Any) -> bytes:
+    """A PDF literal string in WinAnsi encoding"""
+    data = str(text).encode('cp1252', 'replace')
+    return b'(' + data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+
+def label(key: Any) -> str:
+    return str(key).replace('_', ' ').strip().capitalize()
+
+
+def number(value: Any) -> Optional[float]:
+    """Chart values may arrive as numbers or strings like '36%' or '1,200'"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value) if math.isfinite(value) else None
+    try:
+        return float(str(value).strip().rstrip('%').replace(',', ''))
+    except ValueError:
+        return None
+
+
+def nice_ceiling(value: float) -> float:
+    """Round up to 1, 2 or 5 x 10^n for axis limits"""
+    if value <= 0:
+        return 1.0
+    exponent = 10 ** math.floor(math.log10(value))
+    for step in (1, 2, 5, 10):
+        if value <= step * exponent:
+            return step * exponent
+    return 10 * exponent
+
+
+def fmt(value: float) -> str:
+    return f'{value:,.0f}' if abs(value) >= 10 or value == int(value) else f'{value:,.1f}'
+
+
+class SectionLayout:
+    """Lays out one analysis as a list of page content streams"""
+
+    def __init__(self, title: str):
+        from reportlab.pdfbase.pdfmetrics import stringWidth
+        self._width = stringWidth
+        self.title = title
+        self.pages: List[bytes] = []
+        self.ops: List[bytes] = []
+        self.y = TOP
+
+    # -- primitives ------------------------------------------------------------
+
+    def text_width(self, text: str, font: str = 'F1', size: float = 10) -> float:
+        return self._width(text, FONTS[font], size)
+
+    def new_page(self) -> None:
+        if self.ops:
+            self.pages.append(zlib.compress(b'\n'.join(self.ops), 6))
+        self.ops = []
+        self.y = TOP
+
+    def ensure(self, height: float) -> None:
+        if self.y - height < BOTTOM:
+            self.new_page()
+
+    def text(self, x: float, y: float, text: str, font: str = 'F1', size: float = 10,
+             color: Tuple[float, float, float] = (0.1, 0.1, 0.1)) -> None:
+        self.ops.append(b'BT %.3f %.3f %.3f rg /%s %g Tf %.2f %.2f Td %s Tj ET'
+                        % (*color, font.encode(), size, x, y, pdf_string(text)))
+
+    def rect(self, x: float, y: float, w: float, h: float, color: Tuple[float, float, float]) -> None:
+        self.ops.append(b'%.3f %.3f %.3f rg %.2f %.2f %.2f %.2f re f' % (*color, x, y, w, h))
+
+    def line(self, points: List[Tuple[float, float]], color: Tuple[float, float, float], width: float = 1) -> None:
+        path = b' '.join(b'%.2f %.2f %s' % (x, y, b'l' if i else b'm') for i, (x, y) in enumerate(points))
+        self.ops.append(b'%.3f %.3f %.3f RG %.2f w %s S' % (*color, width, path))
+
+    def wrap(self, text: str, width: float, font: str, size: float, first_width: Optional[float] = None) -> List[str]:
+        # Widths are additive (no kerning), so each word is measured once
+        lines, current, used = [], [], 0.0
+        limit = width if first_width is None else first_width
+        space = self.text_width(' ', font, size)
+        for word in str(text).split():
+            word_width = self.text_width(word, font, size)
+            if current and used + space + word_width > limit:
+                lines.append(' '.join(current))
+                current, used, limit = [word], word_width, width
+            else:
+                used += space + word_width if current else word_width
+                current.append(word)
+        lines.append(' '.join(current))
+        return lines
+
+    # -- blocks ----------------------------------------------------------------
+
+    def heading(self, text: str, size: float = 13, space: float = 8) -> None:
+        # Keep a heading together with at least a couple of lines after it
+        self.ensure(size + space + 30)
+        self.y -= size + space
+        self.text(MARGIN, self.y, text, 'F2', size)
+        self.y -= 4
+
+    def paragraph(self, text: Any, indent: float = 0, size: float = 10, prefix: str = '',
+                  font: str = 'F1') -> None:
+        leading = size * 1.35
+        x = MARGIN + indent
+        width = CONTENT_WIDTH - indent
+        prefix_width = self.text_width(prefix + ' ', 'F2', size) if prefix else 0
+        for i, line in enumerate(self.wrap(text, width, font, size, width - prefix_width)):
+            self.ensure(leading)
+            self.y -= leading
+            if i == 0 and prefix:
+                self.text(x, self.y, prefix, 'F2', size)
+                self.text(x + prefix_width, self.y, line, font, size)
+            else:
+                self.text(x, self.y, line, font, size)
+
+    def value(self, data: Any, indent: float = 0) -> None:
+        """Nested dicts and lists as labelled paragraphs, sub-headings and bullets"""
+        if isinstance(data, dict):
+            for key, item in data.items():
+                if key in SKIPPED_KEYS or item in (None, '', [], {}):
+                    continue
+                if isinstance(item, (dict, list, tuple)):
+                    self.ensure(40)
+                    self.y -= 14
+                    self.text(MARGIN + indent, self.y, label(key), 'F2', 10.5)
+                    self.value(item, indent + 12)
+                else:
+                    self.paragraph(item, indent, prefix=f'{label(key)}:')
+        elif isinstance(data, (list, tuple)):
+            for item in data:
+                if isinstance(item, dict):
+                    self.value(item, indent)
+                    self.y -= 4
+                elif isinstance(item, (list, tuple)):
+                    self.value(item, indent + 12)
+                else:
+                    self.paragraph(item, indent, prefix='•')
+        elif data not in (None, ''):
+            self.paragraph(data, indent)
+
+    # -- charts ----------------------------------------------------------------
+
+    def chart(self, title: str, categories: List[str], datasets: List[Tuple[str, List[float]]],
+              kind: str = 'bar', height: float = 150) -> None:
+        """Grouped bar or line chart with gridlines, axis labels and a legend"""
+        values = [v for _, data in datasets for v in data if v is not None]
+        if not categories or not values:
+            return
+        self.ensure(height + 60)
+        self.y -= 22
+        self.text(MARGIN, self.y, title, 'F2', 10.5)
+        legend_y = self.y - 14
+        x = MARGIN
+        for i, (name, _) in enumerate(datasets):
+            color = PALETTE[i % len(PALETTE)]
+            self.rect(x, legend_y, 8, 8, color)
+            self.text(x + 11, legend_y + 1, name, size=8)
+            x += self.text_width(name, size=8) + 26
+
+        top = legend_y - 10
+        bottom = top - height
+        left = MARGIN + 32
+        width = CONTENT_WIDTH - 32
+        low = min(0.0, min(values))
+        # Four gridline steps of a round size
+        high = 4 * nice_ceiling(max(values) / 4) if max(values) > 0 else 1.0
+        span = (high - low) or 1.0
+
+        def scale(v):
+            return bottom + (v - low) / span * height
+
+        for step in range(5):
+            tick = low + span * step / 4
+            y = scale(tick)
+            self.line([(left, y), (left + width, y)], (0.85, 0.85, 0.85), 0.5)
+            text = fmt(tick)
+            self.text(left - 4 - self.text_width(text, size=7), y - 2.5, text, size=7, color=(0.4, 0.4, 0.4))
+        self.line([(left, bottom), (left, top)], (0.5, 0.5, 0.5), 0.75)
+
+        slot = width / len(categories)
+        for i, category in enumerate(categories):
+            name = str(category)
+            while len(name) > 3 and self.text_width(name, size=7) > slot - 2:
+                name = name.rstrip('…')[:-1] + '…'
+            self.text(left + slot * (i + 0.5) - self.text_width(name, size=7) / 2, bottom - 10, name,
+                      size=7, color=(0.4, 0.4, 0.4))
+
+        if kind == 'line':
+            for i, (_, data) in enumerate(datasets):
+                points = [(left + slot * (j + 0.5), scale(v)) for j, v in enumerate(data[:len(categories)])
+                          if v is not None]
+                color = PALETTE[i % len(PALETTE)]
+                if len(points) > 1:
+                    self.line(points, color, 1.5)
+                for px, py in points:
+                    self.rect(px - 1.75, py - 1.75, 3.5, 3.5, color)
+        else:
+            bar = slot * 0.8 / len(datasets)
+            for i, (_, data) in enumerate(datasets):
+                color = PALETTE[i % len(PALETTE)]
+                for j, v in enumerate(data[:len(categories)]):
+                    if v is None:
+                        continue
+                    y0, y1 = sorted((scale(0.0), scale(v)))
+                    self.rect(left + slot * j + slot * 0.1 + bar * i, y0, bar, y1 - y0, color)
+        self.y = bottom - 18
+
+    def charts(self, analysis: Dict[str, Any]) -> None:
+        visualization = analysis.get('visualization_data') or {}
+        market_analysis = analysis.get('market_analysis') or {}
+
+        share = visualization.get('market_share_data') or {}
+        if share.get('labels'):
+            self.chart('Market share (%)', share['labels'],
+                       [('Share', [number(v) for v in share.get('values') or []])])
+
+        for title, data, kind in (('Revenue trends', market_analysis.get('revenue_trends'), 'line'),
+                                  ('Product comparison', visualization.get('product_comparison'), 'bar')):
+            data = data or {}
+            categories = data.get('labels') or data.get('categories') or []
+            datasets = [(str(d.get('label', '')), [number(v) for v in d.get('data') or []])
+                        for d in data.get('datasets') or [] if isinstance(d, dict)]
+            if datasets:
+                self.chart(title, categories, datasets, kind)
+
+    # -- section -----------------------------------------------------------------
+
+    def render(self, analysis: Dict[str, Any]) -> List[bytes]:
+        self.text(MARGIN, self.y - 20, self.title, 'F2', 18)
+        self.y -= 28
+        if analysis.get('is_fallback'):
+            self.paragraph('Basic analysis (AI analysis was unavailable).', size=9)
+        self.charts(analysis)
+
+        known = {key for key, _ in SECTIONS}
+        order = list(SECTIONS) + [(key, label(key)) for key in analysis if key not in known]
+        for key, title in order:
+            data = analysis.get(key)
+            if key in SKIPPED_KEYS or data in (None, '', [], {}):
+                continue
+            if isinstance(data, dict) and not any(k not in SKIPPED_KEYS for k in data):
+                continue
+            self.heading(title)
+            self.value(data)
+        self.new_page()
+        return self.pages
+
+
+def render_section(section: Tuple[str, Dict[str, Any]]) -> Tuple[str, List[bytes]]:
+    """Compressed page content streams for one (title, analysis) section (runs in a pool worker)"""
+    title, analysis = section
+    return title, SectionLayout(title).render(analysis)
+
+
+def start_pool(workers: int) -> Optional[ProcessPoolExecutor]:
+    """A process pool for rendering report sections, or None when ``workers`` is below 2.
+
+    Create it once at startup and pass it to every ``stream_report`` call.
+    """
+    if workers <= 1:
+        return None
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(['utils.report'])
+    else:
+        context = multiprocessing.get_context('spawn')
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context)
+
+
+def _rendered(sections: Iterable[Tuple[str, Dict[str, Any]]],
+              pool: Optional[Executor]) -> Iterator[Tuple[str, List[bytes]]]:
+    """Rendered sections in input order, at most ``MAX_IN_FLIGHT`` submitted ahead"""
+    if pool is None:
+        for section in sections:
+            yield render_section(section)
+        return
+    pending = deque()
+    try:
+        for section in sections:
+            pending.append(pool.submit(render_section, section))
+            if len(pending) >= MAX_IN_FLIGHT:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # The pool outlives this report; drop work for a client that went away
+        for future in pending:
+            future.cancel()
+
+
+class PdfStream:
+    """Serializes PDF objects in order while recording their offsets for the xref table"""
+
+    def __init__(self):
+        self.offsets: Dict[int, int] = {}
+        self.position = 0
+        self.next_object = FIRST_FREE_OBJECT
+
+    def allocate(self) -> int:
+        self.next_object += 1
+        return self.next_object - 1
+
+    def raw(self, data: bytes) -> bytes:
+        self.position += len(data)
+        return data
+
+    def obj(self, number: int, body: bytes) -> bytes:
+        self.offsets[number] = self.position
+        return self.raw(b'%d 0 obj\n%s\nendobj\n' % (number, body))
+
+    def stream(self, number: int, data: bytes, compressed: bool = True) -> bytes:
+        flate = b' /Filter /FlateDecode' if compressed else b''
+        return self.obj(number, b'<< /Length %d%s >>\nstream\n%s\nendstream' % (len(data), flate, data))
+
+    def trailer(self) -> bytes:
+        size = max(self.offsets) + 1
+        rows = [b'0000000000 65535 f \n']
+        rows += [b'%010d 00000 n \n' % self.offsets[n] if n in self.offsets else b'0000000000 65535 f \n'
+                 for n in range(1, size)]
+        xref = self.position
+        return self.raw(b'xref\n0 %d\n%s' % (size, b''.join(rows))
+                        + b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (size, CATALOG, xref))
+
+
+def stream_report(sections: Iterable[Tuple[str, Dict[str, Any]]], title: str = 'Competitive Analysis Report',
+                  pool: Optional[Executor] = None) -> Iterator[bytes]:
+    """Yield a PDF covering ``sections`` ((title, analysis) pairs) in chunks.
+
+    Sections render on ``pool`` (see ``start_pool``) when given, otherwise
+    inline; each chunk is written as soon as the sections before it are done.
+    """
+    with STAGE_LATENCY.time(stage='report'):
+        pdf = PdfStream()
+        yield pdf.raw(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        fonts = []
+        for number, (name, base) in enumerate(FONTS.items(), start=RESOURCES + 2):
+            fonts.append(b'/%s %d 0 R' % (name.encode(), number))
+            yield pdf.obj(number, b'<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>'
+                          % base.encode())
+        yield pdf.obj(RESOURCES, b'<< /Font << %s >> /ProcSet [/PDF /Text] >>' % b' '.join(fonts))
+
+        page_ids: List[int] = []
+        outline: List[Tuple[str, int]] = []
+
+        def page(content: bytes) -> bytes:
+            number = len(page_ids) + 1
+            footer = b'BT 0.5 0.5 0.5 rg /F1 8 Tf %d 30 Td %s Tj ET BT 0.5 0.5 0.5 rg /F1 8 Tf %d 30 Td %s Tj ET' % (
+                MARGIN, pdf_string(title), PAGE_WIDTH - MARGIN - 40, pdf_string(f'Page {number}'))
+            body_id, footer_id, page_id = pdf.allocate(), pdf.allocate(), pdf.allocate()
+            page_ids.append(page_id)
+            return (pdf.stream(body_id, content) + pdf.stream(footer_id, footer, compressed=False)
+                    + pdf.obj(page_id, b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] /Resources %d 0 R '
+                              b'/Contents [%d 0 R %d 0 R] >>'
+                              % (PAGES, PAGE_WIDTH, PAGE_HEIGHT, RESOURCES, body_id, footer_id)))
+
+        cover = SectionLayout(title)
+        cover.text(MARGIN, TOP - 120, title, 'F2', 24)
+        cover.text(MARGIN, TOP - 146, f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", size=11)
+        cover.new_page()
+        yield page(cover.pages[0])
+
+        for section_title, streams in _rendered(sections, pool):
+            outline.append((section_title, pdf.allocate()))
+            first_page = len(page_ids)
+            chunk = b''.join(page(content) for content in streams)
+            outline[-1] += (page_ids[first_page],)
+            yield chunk
+
+        yield pdf.obj(PAGES, b'<< /Type /Pages /Kids [%s] /Count %d >>'
+                      % (b' '.join(b'%d 0 R' % p for p in page_ids), len(page_ids)))
+        for i, (section_title, number, first_page) in enumerate(outline):
+            links = b''.join(b' /%s %d 0 R' % (name, outline[j][1]) for name, j in ((b'Prev', i - 1), (b'Next', i + 1))
+                             if 0 <= j < len(outline))
+            yield pdf.obj(number, b'<< /Title %s /Parent %d 0 R /Dest [%d 0 R /Fit]%s >>'
+                          % (pdf_string(section_title), OUTLINES, first_page, links))
+        if outline:
+            yield pdf.obj(OUTLINES, b'<< /Type /Outlines /First %d 0 R /Last %d 0 R /Count %d >>'
+                          % (outline[0][1], outline[-1][1], len(outline)))
+            yield pdf.obj(CATALOG, b'<< /Type /Catalog /Pages %d 0 R /Outlines %d 0 R /PageMode /UseOutlines >>'
+                          % (PAGES, OUTLINES))
+        else:
+            yield pdf.obj(CATALOG, b'<< /Type /Catalog /Pages %d 0 R >>' % PAGES)
+        yield pdf.trailer()
+    logger.info('Rendered report with %d pages covering %d analyses', len(page_ids), len(outline))
@@ -0,0 +1,97 @@
+import gzip
+import hashlib
+import json
+import logging
+from typing import Any
+
+from flask import make_response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional compression
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 256
+
+
+def dumps(data: Any) -> bytes:
+    """Encode data as compact UTF-8 JSON, using orjson when it is installed"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, default=str, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            logger.debug('orjson could not encode payload, falling back to json')
+    return json.dumps(data, default=str, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+class EncodedPayload:
+    """A JSON body encoded once, with precompressed variants and a strong ETag"""
+
+    __slots__ = ('body', 'etag', 'encodings')
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+        self.encodings = {}
+        if len(body) >= MIN_COMPRESS_SIZE:
+            compressed = gzip.compress(body, compresslevel=6, mtime=0)
+            if len(compressed) < len(body):
+                self.encodings['gzip'] = compressed
+            if brotli is not None:
+                compressed = brotli.compress(body, quality=5)
+                if len(compressed) < len(body):
+                    self.encodings['br'] = compressed
+
+    def __len__(self) -> int:
+        return len(self.body) + sum(len(v) for v in self.encodings.values())
+
+
+def encode_payload(data: Any) -> EncodedPayload:
+    return EncodedPayload(dumps(data))
+
+
+def payload_response(payload: EncodedPayload, request, status: int = 200, filename: str = None,
+                     mimetype: str = 'application/json', immutable: bool = False, etag: str = None):
+    """Serve a precompressed payload, honouring Accept-Encoding and If-None-Match.
+
+    ``immutable`` is for content-addressed URLs, which browsers may cache for good.
+    ``etag`` replaces the payload's own hash as validator, e.g. with a hash the
+    client already received elsewhere.
+    """
+    etag = etag or payload.etag
+    encoding = None
+    for candidate in ('br', 'gzip'):
+        if candidate in payload.encodings and request.accept_encodings[candidate]:
+            encoding = candidate
+            break
+
+    body = payload.encodings[encoding] if encoding else payload.body
+    response = make_response(body, status)
+    response.mimetype = mimetype
+    response.vary.add('Accept-Encoding')
+    if encoding:
+        response.content_encoding = encoding
+    if filename:
+        response.headers['Content-Disposition'] = f"attachment; filename={filename}"
+    # Each representation gets its own strong validator; a client revalidating
+    # with the bare one gets it back, whichever encoding it accepts
+    if encoding and not request.if_none_match.contains(etag):
+        response.set_etag(f"{etag}-{encoding}")
+    else:
+        response.set_etag(etag)
+    if immutable:
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+    if status != 200:
+        return response
+    return response.make_conditional(request)
@@ -0,0 +1,253 @@
+"""
+Shared on-disk state for the persistent stores.
+
+All worker processes of a deployment open the same store directories, so
+read-merge-write updates happen under ``file_lock`` (an advisory ``flock``
+held across processes) and default locations come from ``private_dir``,
+which refuses directories that other users could have created or could
+write to. Stores kept in memory share their changes through a ``Journal``.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from utils.serialization import dumps
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Without flock (Windows) locks only exclude threads of this process
+_local_locks = {}
+_local_locks_guard = threading.Lock()
+
+
+def private_dir(path: str) -> str:
+    """Create ``path`` (mode 0700) and check that only this user can write to it"""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    if hasattr(os, 'geteuid'):
+        st = os.stat(path)
+        if st.st_uid != os.geteuid() or st.st_mode & 0o022:
+            raise PermissionError(f'{path} must be owned by this user and not writable by others')
+    return path
+
+
+@contextmanager
+def file_lock(path: str, shared: bool = False):
+    """Hold an advisory lock on ``path`` (created if missing) across processes"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if fcntl is None:
+        with _local_locks_guard:
+            lock = _local_locks.setdefault(os.path.abspath(path), threading.RLock())
+        with lock:
+            yield
+        return
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+def try_lock(path: str):
+    """Take an exclusive lock on ``path`` without waiting; returns a handle to keep, or None.
+
+    The lock lasts until the handle is closed or the process exits, which makes
+    it suitable for electing one process of a deployment to run a background job.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    if fcntl is None:
+        return fd
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return None
+    return fd
+
+
+class Journal:
+    """JSON-lines file of per-URL changes shared by the worker processes of a store.
+
+    Every process appends its changes under a file lock and replays the entries
+    the others appended (``read``) before answering from its in-memory copy.
+    The first line identifies the journal; ``compact`` replaces the file with
+    the latest entry per URL, and readers then replay the new file from the
+    start. An entry ``{'url': ..., 'removed': True}`` drops a URL.
+
+    A store can also save a binary snapshot of its state (``save_checkpoint``,
+    in ``<path>.checkpoint``) together with the journal position it reflects.
+    A reader starting on that journal resumes after the checkpoint, and only
+    replays the entries appended since; ``take_checkpoint`` hands it the
+    snapshot to restore first.
+    """
+
+    def __init__(self, path: str, label: str = 'journal'):
+        self.path = path
+        self.label = label
+        self.checkpoint_path = path + '.checkpoint'
+        # Header line of the journal replayed so far and the offset reached in it
+        self._header = None
+        self._offset = 0
+        # Offset covered by the newest checkpoint known for this journal, and
+        # the snapshot the last restart resumed from (until taken)
+        self._checkpoint_offset = 0
+        self._checkpoint = None
+
+    def lock(self):
+        return file_lock(self.path + '.lock')
+
+    @staticmethod
+    def _new_header() -> bytes:
+        return dumps({'journal': os.urandom(8).hex(), 'created': time.time()}) + b'\n'
+
+    def read(self) -> Tuple[bool, List[Dict]]:
+        """``(restart, entries)``: entries appended since the last read, by any process.
+
+        ``restart`` means the journal was replaced (or read for the first time):
+        the caller must clear its state before applying the entries.
+        """
+        try:
+            with open(self.path, 'rb') as fh:
+                header = fh.readline()
+                if not header.endswith(b'\n'):
+                    return False, []
+                restart = header != self._header
+                size = os.fstat(fh.fileno()).st_size
+                if restart:
+                    # New or compacted journal (inode numbers get reused): replay it from the
+                    # start, or from its checkpoint
+                    self._header, self._offset = header, len(header)
+                    self._checkpoint = self._read_checkpoint(header, size)
+                    if self._checkpoint is not None:
+                        self._offset = self._checkpoint[0]
+                    self._checkpoint_offset = self._offset
+                if size <= self._offset:
+                    return restart, []
+                fh.seek(self._offset)
+                data = fh.read()
+        except FileNotFoundError:
+            return False, []
+        except OSError as e:
+            logger.warning('Could not read %s %s: %s', self.label, self.path, e)
+            return False, []
+        # A line still being written is picked up by the next read
+        end = data.rfind(b'\n') + 1
+        self._offset += end
+        entries = []
+        for line in data[:end].splitlines():
+            try:
+                entries.append(json.loads(line))
+            except ValueError as e:
+                logger.warning('Skipping bad %s entry: %s', self.label, e)
+        return restart, entries
+
+    def rewind(self) -> None:
+        """Replay the whole journal on the next ``read``, ignoring its checkpoint
+        (e.g. after the checkpoint could not be restored)"""
+        self._header, self._offset, self._checkpoint = None, 0, None
+        try:
+            os.unlink(self.checkpoint_path)
+        except OSError:
+            pass
+
+    def take_checkpoint(self) -> Optional[bytes]:
+        """Snapshot the last restart resumed after, to restore before applying the entries read"""
+        checkpoint, self._checkpoint = self._checkpoint, None
+        return checkpoint[1] if checkpoint is not None else None
+
+    def _read_checkpoint(self, header: bytes, size: int = None) -> Optional[Tuple[int, bytes]]:
+        """(offset, snapshot) of the checkpoint of the journal with ``header``, or None"""
+        try:
+            with open(self.checkpoint_path, 'rb') as fh:
+                meta = json.loads(fh.readline())
+                if meta.get('header') != header.decode('utf-8').rstrip('\n'):
+                    return None
+                offset = int(meta['offset'])
+                if size is not None and not len(header) <= offset <= size:
+                    return None
+                return offset, (fh.read() if size is not None else b'')
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning('Ignoring %s checkpoint %s: %s', self.label, self.checkpoint_path, e)
+            return None
+
+    def checkpoint_due(self, min_bytes: int) -> bool:
+        """Whether ``min_bytes`` of entries have been read past the newest checkpoint"""
+        if self._header is None or self._offset - self._checkpoint_offset < min_bytes:
+            return False
+        # Another process may have saved a newer checkpoint
+        newest = self._read_checkpoint(self._header)
+        if newest is not None:
+            self._checkpoint_offset = max(self._checkpoint_offset, newest[0])
+        return self._offset - self._checkpoint_offset >= min_bytes
+
+    def save_checkpoint(self, snapshot: bytes) -> None:
+        """Store ``snapshot`` as the state after every entry read so far.
+
+        Call right after ``read`` while no entry read since has been applied.
+        """
+        if self._header is None:
+            return
+        meta = {'header': self._header.decode('utf-8').rstrip('\n'), 'offset': self._offset}
+        tmp = f'{self.checkpoint_path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp, 'wb') as fh:
+                fh.write(dumps(meta) + b'\n')
+                fh.write(snapshot)
+            os.replace(tmp, self.checkpoint_path)
+            self._checkpoint_offset = self._offset
+        except OSError as e:
+            logger.warning('Could not write %s checkpoint %s: %s', self.label, self.checkpoint_path, e)
+
+    def append(self, entry: Dict) -> bool:
+        try:
+            with self.lock():
+                with open(self.path, 'ab') as fh:
+                    if not fh.tell():
+                        fh.write(self._new_header())
+                    fh.write(dumps(entry) + b'\n')
+            return True
+        except OSError as e:
+            logger.warning('Could not write %s %s: %s', self.label, self.path, e)
+            return False
+
+    def compact(self) -> None:
+        """Rewrite the journal with the latest entry of each live URL.
+
+        Call under ``lock`` right after ``read``: the reader is left at the end
+        of the new journal, so the caller drops its own replaced and removed
+        entries instead of replaying the file.
+        """
+        latest = {}
+        with open(self.path, 'rb') as fh:
+            fh.readline()
+            for line in fh:
+                try:
+                    entry = json.loads(line)
+                    latest.pop(entry['url'], None)
+                    latest[entry['url']] = line if not entry.get('removed') else None
+                except (ValueError, KeyError, TypeError):
+                    continue
+        header = self._new_header()
+        with open(self.path + '.tmp', 'wb') as fh:
+            fh.write(header)
+            fh.writelines(line for line in latest.values() if line is not None)
+            size = fh.tell()
+        os.replace(self.path + '.tmp', self.path)
+        self._header, self._offset, self._checkpoint = header, size, None
+        self._checkpoint_offset = len(header)
@@ -0,0 +1,216 @@
+"""
+Lightweight request tracing with context-propagated spans.
+
+Spans nest through a ``contextvars`` variable, so work that hops to another
+thread keeps its parent when run through ``propagate``. Finished spans are
+handed to the configured exporters: an in-memory buffer backing the
+``/debug/traces`` viewer and, optionally, a JSON-lines file.
+"""
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_current_span = contextvars.ContextVar('tracksmith_current_span', default=None)
+
+
+class Span:
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent_id', 'start', 'duration',
+                 'attributes', 'error', 'thread', '_started', '_token')
+
+    def __init__(self, name: str, parent: Optional['Span'] = None, attributes: Dict[str, Any] = None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.start = time.time()
+        self.duration = None
+        self.attributes = dict(attributes or {})
+        self.error = None
+        self.thread = threading.current_thread().name
+        self._started = time.perf_counter()
+        self._token = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'start': self.start,
+            'duration_ms': round(self.duration * 1000, 3) if self.duration is not None else None,
+            'attributes': self.attributes,
+            'error': self.error,
+            'thread': self.thread,
+        }
+
+
+class MemoryExporter:
+    """Keeps the spans of the most recent traces for the in-app viewer"""
+
+    def __init__(self, max_traces: int = 200):
+        self.max_traces = max_traces
+        self._traces = OrderedDict()
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        with self._lock:
+            spans = self._traces.get(span.trace_id)
+            if spans is None:
+                spans = self._traces[span.trace_id] = []
+                while len(self._traces) > self.max_traces:
+                    self._traces.popitem(last=False)
+            spans.append(span.to_dict())
+
+    def traces(self) -> List[Dict[str, Any]]:
+        """Summaries of buffered traces, newest first"""
+        with self._lock:
+            items = [(trace_id, list(spans)) for trace_id, spans in self._traces.items()]
+        summaries = []
+        for trace_id, spans in reversed(items):
+            root = next((s for s in spans if s['parent_id'] is None), spans[0])
+            start = min(s['start'] for s in spans)
+            end = max(s['start'] + (s['duration_ms'] or 0) / 1000 for s in spans)
+            summaries.append({
+                'trace_id': trace_id,
+                'name': root['name'],
+                'start': start,
+                'duration_ms': round((end - start) * 1000, 3),
+                'spans': len(spans),
+                'error': any(s['error'] for s in spans),
+            })
+        return summaries
+
+    def get(self, trace_id: str) -> List[Dict[str, Any]]:
+        """Spans of one trace in depth-first order, annotated with depth and offset"""
+        with self._lock:
+            spans = list(self._traces.get(trace_id, []))
+        if not spans:
+            return []
+        start = min(s['start'] for s in spans)
+        children = {}
+        for s in spans:
+            children.setdefault(s['parent_id'], []).append(s)
+        known = {s['span_id'] for s in spans}
+        roots = [s for s in spans if s['parent_id'] is None or s['parent_id'] not in known]
+
+        ordered = []
+
+        def walk(span, depth):
+            ordered.append({**span, 'depth': depth, 'offset_ms': round((span['start'] - start) * 1000, 3)})
+            for child in sorted(children.get(span['span_id'], []), key=lambda c: c['start']):
+                walk(child, depth + 1)
+
+        for root in sorted(roots, key=lambda s: s['start']):
+            walk(root, 0)
+        return ordered
+
+
+class JsonLinesExporter:
+    """Appends each finished span as one JSON line"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as fh:
+                fh.write(line + '\n')
+
+
+class Tracer:
+    def __init__(self):
+        self.enabled = True
+        self.exporters = []
+
+    def configure(self, enabled: bool = True, exporters: List[Any] = None) -> None:
+        self.enabled = enabled
+        self.exporters = list(exporters or [])
+
+    def start_span(self, name: str, **attributes) -> Optional[Span]:
+        """Open a span as a child of the current one and make it current"""
+        if not self.enabled:
+            return None
+        span = Span(name, parent=_current_span.get(), attributes=attributes)
+        span._token = _current_span.set(span)
+        return span
+
+    def end_span(self, span: Optional[Span], error: Optional[BaseException] = None) -> None:
+        if span is None:
+            return
+        span.duration = time.perf_counter() - span._started
+        if error is not None:
+            span.error = f"{type(error).__name__}: {error}"
+        if span._token is not None:
+            try:
+                _current_span.reset(span._token)
+            except ValueError:
+                # Ended from a different context than it was started in
+                pass
+            span._token = None
+        for exporter in self.exporters:
+            try:
+                exporter.export(span)
+            except Exception as e:
+                logger.warning('Span export failed: %s', e)
+
+
+tracer = Tracer()
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Trace the enclosed block as a child of the current span"""
+    active = tracer.start_span(name, **attributes)
+    try:
+        yield active
+    except BaseException as e:
+        tracer.end_span(active, error=e)
+        raise
+    else:
+        tracer.end_span(active)
+
+
+def traced(name: str = None):
+    """Decorator form of ``span``; defaults to the function's qualified name"""
+    def decorator(fn):
+        span_name = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def propagate(fn: Callable) -> Callable:
+    """Bind ``fn`` to the current context so spans it opens in another thread
+    (thread pools, background workers) keep their parent"""
+    context = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return context.copy().run(fn, *args, **kwargs)
+    return wrapper